@@ -7,7 +7,7 @@ register(REPORT,
   id    = 'AncestorFill',
   name  = _("AncestorFill"),
   description =  _("Report on the filling of the tree"),
-  version = '1.0.5',
+  version = '1.0.6',
   gramps_target_version = '4.2',
   include_in_listing = False,
   status = UNSTABLE,
@@ -29,6 +29,7 @@
 #
 #------------------------------------------------------------------------
 import copy
+import csv
 import os
 import gettext
 
@@ -42,12 +43,15 @@ from gen.display.name import displayer as global_name_display
 from Errors import ReportError
 from gen.lib import ChildRefType
 from gen.plug.menu import (NumberOption, PersonOption,BooleanOption,
-                          EnumeratedListOption)
+                          EnumeratedListOption, FilterOption,
+                          DestinationOption)
 from gen.plug.docgen import (IndexMark, FontStyle, ParagraphStyle,
+                             TableStyle, TableCellStyle,
                              FONT_SANS_SERIF, INDEX_TYPE_TOC, 
                              PARA_ALIGN_CENTER)
 from gen.plug.report import Report
 from gen.plug.report import MenuReportOptions
+from gen.plug.report import utils as ReportUtils
 from libtranslate import get_language_string
 from TransUtils import get_addon_translator
 from libtranslate import Translator, get_language_string
@@ -129,6 +133,185 @@ class Translator:
         else:
             return unicode(gettext.gettext(message))
 
+# Columns of the batch mode table, the first ones of the CSV file:
+BATCH_COLUMNS = ["gramps_id", "name", "generations", "ancestors",
+                 "single_ancestors", "fill", "collapse"]
+
+# Columns by which the batch mode table can be sorted:
+SORT_COLUMNS = ["fill", "collapse", "ancestors", "generations", "name"]
+
+def get_birth_parents(database, person, families):
+    """
+    Return the handles of the birth father and mother of a person (None if
+    unknown), as apply_filter finds them. families is a cache of the
+    families, by handle.
+    """
+    father_handle = None
+    mother_handle = None
+    for family_handle in person.get_parent_family_handle_list():
+        family = families.get(family_handle)
+        if family is None:
+            family = database.get_family_from_handle(family_handle)
+            families[family_handle] = family
+        ref = [ c for c in family.get_child_ref_list()
+                if c.get_reference_handle() == person.get_handle()]
+        if ref:
+            if not father_handle and \
+               ref[0].get_father_relation() == ChildRefType.BIRTH:
+                father_handle = family.get_father_handle()
+            if not mother_handle and \
+               ref[0].get_mother_relation() == ChildRefType.BIRTH:
+                mother_handle = family.get_mother_handle()
+    return father_handle, mother_handle
+
+#------------------------------------------------------------------------
+#
+# AncestorMetrics
+#
+#------------------------------------------------------------------------
+class AncestorMetrics(object):
+    """
+    Fill and pedigree collapse of the ancestors of every person of a
+    database, up to max_generations, computed in one pass.
+
+    The persons are sorted so that the parents come before their children
+    (persons who are their own ancestors are left out), and the metrics of
+    a person are computed from the metrics of their parents:
+
+    lines[g]  - number of lines to the ancestors of generation g, the
+                ancestors found through several lines being counted once
+                per line (as in the report for a single person).
+    free[g]   - number of lines to the ancestors of generation g which
+                do not go through a shared ancestor, that is an ancestor
+                with several children.
+    shared[k] - bitset of the shared ancestors of generation k (the person
+                itself for k = 0, if they are shared).
+
+    The ancestors found through several lines can only be found through
+    shared ancestors. Each single ancestor of generation g is found through
+    one free line from either the person or one shared ancestor s of
+    generation k: its number of single ancestors is the sum of the
+    free[g - k] of these shared ancestors, and of its own free[g].
+
+    The metrics of a person are released when all their children are
+    computed, except the free lines of the shared ancestors.
+    """
+    def __init__(self, database, max_generations, user=None):
+        self.database = database
+        self.max_generations = max_generations
+        self.parents = {}
+        families = {}
+        for family in database.iter_families():
+            families[family.get_handle()] = family
+        children = defaultdict(list)
+        for person in database.iter_people():
+            handle = person.get_handle()
+            parents = [h for h in get_birth_parents(database, person, families)
+                       if h]
+            self.parents[handle] = parents
+            for parent in parents:
+                children[parent].append(handle)
+        # Sort the persons, parents first
+        self.order = []
+        waiting = dict((handle, len([p for p in parents
+                                     if p in self.parents]))
+                       for (handle, parents) in self.parents.items())
+        ready = [handle for (handle, count) in waiting.items() if not count]
+        while ready:
+            handle = ready.pop()
+            self.order.append(handle)
+            for child in children[handle]:
+                waiting[child] -= 1
+                if not waiting[child]:
+                    ready.append(child)
+        self.children = dict((handle, len(children[handle]))
+                             for handle in self.parents)
+        self.bit = {}
+        for handle in self.order:
+            if self.children[handle] > 1:
+                self.bit[handle] = 1 << len(self.bit)
+        self.shared_handles = dict((bit, handle)
+                                   for (handle, bit) in self.bit.items())
+
+    def compute(self, handles):
+        """
+        Return the metrics of the given persons, as a dictionary giving for
+        each person handle a tuple (lines, single): the number of lines to
+        the ancestors, and the number of single ancestors, of each
+        generation from 1 to max_generations. single[0] is the total
+        number of single ancestors, of all generations.
+        """
+        gens = self.max_generations + 1
+        wanted = set(handles)
+        lines = {}
+        free = {}
+        shared = {}
+        remaining = dict(self.children)
+        results = {}
+        for handle in self.order:
+            parents = [p for p in self.parents[handle] if p in lines]
+            person_lines = [1] + [0] * self.max_generations
+            person_free = [1] + [0] * self.max_generations
+            person_shared = [self.bit.get(handle, 0)] + \
+                            [0] * self.max_generations
+            for parent in parents:
+                parent_lines = lines[parent]
+                parent_free = free[parent]
+                parent_shared = shared[parent]
+                for g in range(1, gens):
+                    person_lines[g] += parent_lines[g - 1]
+                    person_shared[g] |= parent_shared[g - 1]
+                    if parent not in self.bit:
+                        person_free[g] += parent_free[g - 1]
+            lines[handle] = person_lines
+            free[handle] = person_free
+            shared[handle] = person_shared
+            if handle in wanted:
+                results[handle] = (person_lines,
+                                   self.single_ancestors(handle, free, shared))
+            # Release the metrics of the parents which are not needed any
+            # more
+            for parent in parents:
+                remaining[parent] -= 1
+                if not remaining[parent]:
+                    del lines[parent]
+                    del shared[parent]
+                    if parent not in self.bit:
+                        del free[parent]
+        return results
+
+    def single_ancestors(self, handle, free, shared):
+        """
+        Return the number of single ancestors of each generation of a
+        person, and their total in the first item.
+        """
+        gens = self.max_generations + 1
+        person_shared = shared[handle]
+        single = [0] * gens
+        # Generation of each shared ancestor, closest to the person
+        first = {}
+        if handle not in self.bit:
+            first[handle] = 0
+        for k in range(gens):
+            bits = person_shared[k]
+            while bits:
+                bit = bits & -bits
+                bits ^= bit
+                first.setdefault(self.shared_handles[bit], k)
+                anchor_free = free[self.shared_handles[bit]]
+                for g in range(max(k, 1), gens):
+                    single[g] += anchor_free[g - k]
+        if handle not in self.bit:
+            for g in range(1, gens):
+                single[g] += free[handle][g]
+        # The ancestors found through free lines from a shared ancestor are
+        # only found in the generations following its closest generation
+        total = 0
+        for (anchor, k) in first.items():
+            total += sum(free[anchor][:gens - k])
+        single[0] = total - 1
+        return single
+
 #------------------------------------------------------------------------
 #
 # AncestorFillReport
@@ -167,8 +350,12 @@ class AncestorFillReport(Report):
         self.Filleddigit = menu.get_option_by_name('Filleddigit').get_value()
         self.Collapsedigit = menu.get_option_by_name('Collapsedigit').get_value()
         self.displayth = menu.get_option_by_name('Display theorical').get_value()
+        self.batch = menu.get_option_by_name('batch').get_value()
+        self.filter = menu.get_option_by_name('filter').get_filter()
+        self.csvfile = menu.get_option_by_name('csvfile').get_value()
+        self.sort = menu.get_option_by_name('sort').get_value()
         self.center_person = database.get_person_from_gramps_id(pid)
-        if (self.center_person == None) :
+        if (self.center_person == None) and not self.batch:
             raise ReportError(_("Person %s is not in the Database") % pid )
         language = menu.get_option_by_name('trans').get_value()
         translator = Translator(language)
@@ -260,6 +447,9 @@ class AncestorFillReport(Report):
         The routine the actually creates the report. At this point, the document
         is opened and ready for writing.
         """
+        if self.batch:
+            self.write_batch_report()
+            return
 
         name = self._name_display.display(self.center_person)
         self.title = _("AncestorFill for %s") % name
@@ -336,6 +526,106 @@ class AncestorFillReport(Report):
 
         name = self._name_display.display_formal(self.center_person)
 
+    def write_batch_report(self):
+        """
+        Write the fill and pedigree collapse of every person of the filter,
+        computed in one pass (see AncestorMetrics), as a table sorted by
+        the selected column, and in a CSV file if one is given.
+        """
+        self.title = _("AncestorFill for all people")
+        self.doc.start_paragraph("AHN-Title")
+        mark = IndexMark(self.title, INDEX_TYPE_TOC, 1)
+        self.doc.write_text(self.title, mark)
+        self.doc.end_paragraph()
+
+        handles = self.filter.apply(self.database,
+                                    self.database.iter_person_handles())
+        metrics = AncestorMetrics(self.database, self.max_generations)
+        results = metrics.compute(handles)
+        theorical = 2 ** (self.max_generations + 1) - 2
+        rows = []
+        for (handle, (lines, single)) in results.items():
+            person = self.database.get_person_from_handle(handle)
+            ancestors = sum(lines[1:])
+            generations = max([g for g in range(len(lines)) if lines[g]])
+            row = {
+                "gramps_id": person.get_gramps_id(),
+                "name": self._name_display.display(person),
+                "generations": generations,
+                "ancestors": ancestors,
+                "single_ancestors": single[0],
+                "fill": ancestors * 100.0 / theorical,
+                "collapse": (float(ancestors - single[0]) * 100.0 / ancestors
+                             if ancestors else 0.0),
+                }
+            for g in range(1, self.max_generations + 1):
+                row["fill_%d" % g] = lines[g] * 100.0 / 2 ** g
+                row["collapse_%d" % g] = (float(lines[g] - single[g]) * 100.0
+                                          / lines[g] if lines[g] else 0.0)
+            rows.append(row)
+        rows.sort(key=lambda row: row[self.sort],
+                  reverse=(self.sort != "name"))
+        skipped = len(handles) - len(results)
+        if skipped:
+            self.doc.start_paragraph("AHN-Generation")
+            self.doc.write_text(_("%d people who are their own ancestors "
+                                  "are left out") % skipped)
+            self.doc.end_paragraph()
+
+        self.doc.start_table("AncestorFillTable", "AHN-Table")
+        self.doc.start_row()
+        for title in [_("ID"), _("Name"), _("Generations"),
+                      _("Number of Ancestors found"),
+                      _("Number of single Ancestors found"),
+                      _("percent of Ancestors found"), _("Pedigree Collapse")]:
+            self.doc.start_cell("AHN-TableCell")
+            self.doc.start_paragraph("AHN-Generation")
+            self.doc.write_text(title)
+            self.doc.end_paragraph()
+            self.doc.end_cell()
+        self.doc.end_row()
+        for row in rows:
+            self.doc.start_row()
+            for text in [row["gramps_id"], row["name"],
+                         str(row["generations"]), str(row["ancestors"]),
+                         str(row["single_ancestors"]),
+                         "%.*f%%" % (self.Filleddigit, row["fill"]),
+                         "%.*f%%" % (self.Collapsedigit, row["collapse"])]:
+                self.doc.start_cell("AHN-TableCell")
+                self.doc.start_paragraph("AHN-Entry")
+                self.doc.write_text(text)
+                self.doc.end_paragraph()
+                self.doc.end_cell()
+            self.doc.end_row()
+        self.doc.end_table()
+
+        if self.csvfile:
+            self.write_csv(rows)
+
+    def write_csv(self, rows):
+        """
+        Write the batch mode results in a CSV file, with the fill and
+        collapse percentages of each generation. The csv module writes
+        bytes only, so the names are encoded in UTF-8.
+        """
+        def encode(value):
+            if isinstance(value, unicode):
+                return value.encode("utf-8")
+            return value
+        columns = BATCH_COLUMNS[:]
+        for g in range(1, self.max_generations + 1):
+            columns += ["fill_%d" % g, "collapse_%d" % g]
+        try:
+            fp = open(self.csvfile, "wb")
+        except IOError as msg:
+            raise ReportError(_("Could not create %s") % self.csvfile,
+                              str(msg))
+        writer = csv.writer(fp)
+        writer.writerow([encode(column) for column in columns])
+        for row in rows:
+            writer.writerow([encode(row[column]) for column in columns])
+        fp.close()
+
 #------------------------------------------------------------------------
 #
 # AncestorOptions
@@ -348,6 +638,9 @@ class AncestorFillOptions(MenuReportOptions):
     """
 
     def __init__(self, name, dbase):
+        self.__db = dbase
+        self.__pid = None
+        self.__filter = None
         MenuReportOptions.__init__(self, name, dbase)
         
     def add_menu_options(self, menu):
@@ -368,6 +661,31 @@ class AncestorFillOptions(MenuReportOptions):
         Collapsedigit = NumberOption(_("Collapsedigit"), 10, 1, 50)
         Collapsedigit.set_help(_("The number of digit after comma to include in the report for the pedigree Collapse"))
         menu.add_option(category_name, "Collapsedigit", Collapsedigit)
+        batch = BooleanOption(_("All people (batch mode)"), False)
+        batch.set_help(_("Compute the fill and pedigree collapse of every "
+                         "person of the filter, instead of the center "
+                         "person only"))
+        menu.add_option(category_name, "batch", batch)
+        self.__filter = FilterOption(_("Filter"), 0)
+        self.__filter.set_help(_("Select the people of the batch mode"))
+        menu.add_option(category_name, "filter", self.__filter)
+        self.__pid = pid
+        self.__pid.connect('value-changed', self.__update_filters)
+        self.__update_filters()
+        sort = EnumeratedListOption(_("Sort by"), "fill")
+        for (column, text) in zip(SORT_COLUMNS, [
+                _("percent of Ancestors found"), _("Pedigree Collapse"),
+                _("Number of Ancestors found"), _("Generations"),
+                _("Name")]):
+            sort.add_item(column, text)
+        sort.set_help(_("The column by which the batch mode table is sorted"))
+        menu.add_option(category_name, "sort", sort)
+        csvfile = DestinationOption(_("CSV file"), "")
+        csvfile.set_help(_("The CSV file where the batch mode results are "
+                           "also written, with the fill and collapse of each "
+                           "generation (none if empty)"))
+        csvfile.set_directory_entry(False)
+        menu.add_option(category_name, "csvfile", csvfile)
         displayth = BooleanOption(_("Display theorical"), False)
         displayth.set_help(_("Display the theorical number of ancestor by generation"))
         menu.add_option(category_name, "Display theorical", displayth)
@@ -378,6 +696,15 @@ class AncestorFillOptions(MenuReportOptions):
         trans.set_help(_("The translation to be used for the report."))
         menu.add_option(category_name, "trans", trans)
 
+    def __update_filters(self):
+        """
+        Update the filter list based on the selected person
+        """
+        gid = self.__pid.get_value()
+        person = self.__db.get_person_from_gramps_id(gid)
+        filter_list = ReportUtils.get_person_filters(person, False)
+        self.__filter.set_filters(filter_list)
+
     def make_default_style(self, default_style):
         """
         Make the default output style for the Ahnentafel report.
@@ -444,3 +771,15 @@ class AncestorFillOptions(MenuReportOptions):
         para.set_bottom_margin(0.125)        
         para.set_description(_('The basic style used for the text display.'))
         default_style.add_paragraph_style("AHN-Entry", para)
+
+        #
+        # AHN-Table
+        #
+        table = TableStyle()
+        table.set_width(100)
+        table.set_columns(7)
+        for (column, width) in enumerate([10, 30, 10, 13, 13, 12, 12]):
+            table.set_column_width(column, width)
+        default_style.add_table_style("AHN-Table", table)
+        cell = TableCellStyle()
+        default_style.add_cell_style("AHN-TableCell", cell)
@@ -44,6 +44,266 @@ except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
 
+#------------------------------------------------------------------------
+#
+# Kinship index
+#
+#------------------------------------------------------------------------
+class KinshipIndex(object):
+    """
+    In-memory index of the kinship links between people: parents,
+    children, spouses, siblings, associations, and people mentioned in
+    notes.
+
+    Only the handles needed to compute the links are kept, for each
+    person and each family; the links themselves are computed when they
+    are followed. The index is built in one pass over the database, and
+    is kept up to date with the person and family signals.
+    """
+    def __init__(self):
+        # person handle -> (family handles, parent family handles,
+        #                   [(associated handle, relation)], note handles)
+        self.people = {}
+        # family handle -> (father, mother, child handles, note handles)
+        self.families = {}
+        # note handle -> handles of the people mentioned in the note
+        self.note_links = {}
+        # person handle -> handles of the people it links to by an
+        # association or a note, and the reverse links
+        self.link_targets = {}
+        self.reverse_links = {}
+
+    def build(self, db):
+        """
+        Build the index from the database. This is a generator, that
+        yields the number of objects read every 1000 objects.
+        """
+        count = 0
+        for note in db.iter_notes():
+            mentions = [link[3] for link in note.get_links()
+                        if link[0] == "gramps" and link[1] == "Person" and
+                        link[2] == "handle"]
+            if mentions:
+                self.note_links[note.handle] = mentions
+            count += 1
+            if count % 1000 == 0:
+                yield count
+        for family in db.iter_families():
+            self.families[family.handle] = self.family_record(family)
+            count += 1
+            if count % 1000 == 0:
+                yield count
+        for person in db.iter_people():
+            self.people[person.handle] = self.person_record(person)
+            count += 1
+            if count % 1000 == 0:
+                yield count
+        for person_handle in self.people:
+            self.update_links(person_handle)
+        yield count
+
+    def person_record(self, person):
+        return (person.get_family_handle_list(),
+                person.get_parent_family_handle_list(),
+                [(assoc.get_reference_handle(),
+                  _("%s (association)") % assoc.get_relation())
+                 for assoc in person.get_person_ref_list()],
+                person.get_note_list())
+
+    def family_record(self, family):
+        return (family.get_father_handle(), family.get_mother_handle(),
+                [child_ref.ref for child_ref in family.get_child_ref_list()],
+                family.get_note_list())
+
+    def note_edges(self, note_list, person_handle):
+        return [(handle, (_("mentioned in note"), person_handle), True)
+                for note_handle in note_list
+                for handle in self.note_links.get(note_handle, [])]
+
+    def edges(self, person_handle):
+        """
+        Return the links from a person, as a list of
+        (relative handle, step, is_link), where step describes the
+        relative, in the form (relation, person_handle, [parents]),
+        and is_link tells whether the link is an association or a note
+        mention, that does not have to be reciprocal.
+        """
+        record = self.people.get(person_handle)
+        if record is None:
+            return []
+        (family_list, parent_family_list, assoc_list, note_list) = record
+        retval = []
+        for family_handle in family_list:
+            family = self.families.get(family_handle)
+            if family:
+                (husband, wife, children, family_notes) = family
+                retval.extend((child, (_("child"), person_handle,
+                                       husband, wife), False)
+                              for child in children)
+                if husband and husband != person_handle:
+                    retval.append((husband, (_("husband"), person_handle),
+                                   False))
+                if wife and wife != person_handle:
+                    retval.append((wife, (_("wife"), person_handle), False))
+                retval += self.note_edges(family_notes, person_handle)
+        for family_handle in parent_family_list:
+            family = self.families.get(family_handle)
+            if family:
+                (husband, wife, children, family_notes) = family
+                retval.extend((child, (_("sibling"), person_handle,
+                                       husband, wife), False)
+                              for child in children if child != person_handle)
+                if husband and husband != person_handle:
+                    retval.append((husband, (_("father"), person_handle,
+                                             wife), False))
+                if wife and wife != person_handle:
+                    retval.append((wife, (_("mother"), person_handle,
+                                          husband), False))
+                retval += self.note_edges(family_notes, person_handle)
+        retval.extend((assoc_handle, (relation, person_handle), True)
+                      for (assoc_handle, relation) in assoc_list)
+        retval += self.note_edges(note_list, person_handle)
+        return retval
+
+    def predecessors(self, person_handle):
+        """
+        Return the handles of the people that have a link to the person.
+        The family links are reciprocal, the other ones are looked up in
+        the reverse links.
+        """
+        retval = set(handle for (handle, step, is_link)
+                     in self.edges(person_handle) if not is_link)
+        retval.update(self.reverse_links.get(person_handle, ()))
+        return retval
+
+    def update_links(self, person_handle):
+        """
+        Update the reverse links of the associations and note mentions
+        of a person.
+        """
+        targets = set(handle for (handle, step, is_link)
+                      in self.edges(person_handle) if is_link)
+        old_targets = self.link_targets.get(person_handle, set())
+        for handle in old_targets - targets:
+            self.reverse_links[handle].discard(person_handle)
+        for handle in targets - old_targets:
+            self.reverse_links.setdefault(handle, set()).add(person_handle)
+        if targets:
+            self.link_targets[person_handle] = targets
+        else:
+            self.link_targets.pop(person_handle, None)
+
+    def update_people(self, db, handle_list):
+        for handle in handle_list:
+            person = db.get_person_from_handle(handle)
+            if person:
+                self.people[handle] = self.person_record(person)
+            else:
+                self.people.pop(handle, None)
+            self.update_links(handle)
+
+    def update_families(self, db, handle_list):
+        for handle in handle_list:
+            members = set()
+            record = self.families.get(handle)
+            if record:
+                members.update([record[0], record[1]] + record[2])
+            family = db.get_family_from_handle(handle)
+            if family:
+                record = self.family_record(family)
+                self.families[handle] = record
+                members.update([record[0], record[1]] + record[2])
+            else:
+                self.families.pop(handle, None)
+            for person_handle in members:
+                if person_handle in self.people:
+                    self.update_links(person_handle)
+
+    def shortest_paths(self, start, goal):
+        """
+        Generate all of the shortest paths from start to goal, found with
+        a bidirectional breadth-first search. Each path is the list of
+        its steps (see edges).
+        """
+        # distance and predecessors (handle, step) from start
+        forward = {start: 0}
+        forward_preds = {start: []}
+        # distance and successors from goal, along reversed links
+        backward = {goal: 0}
+        backward_succs = {goal: []}
+        forward_level = [start]
+        backward_level = [goal]
+        forward_depth = backward_depth = 0
+        best = 0 if start == goal else None
+        while best is None or forward_depth + backward_depth < best:
+            if not (forward_level or backward_level):
+                break
+            if best is None and not (forward_level and backward_level):
+                break
+            if forward_level and (not backward_level or
+                                  len(forward_level) <= len(backward_level)):
+                next_level = []
+                for handle in forward_level:
+                    for (relative, step, is_link) in self.edges(handle):
+                        if relative is None:
+                            continue
+                        if relative not in forward:
+                            forward[relative] = forward_depth + 1
+                            forward_preds[relative] = [(handle, step)]
+                            next_level.append(relative)
+                            if relative in backward:
+                                distance = forward_depth + 1 + backward[relative]
+                                if best is None or distance < best:
+                                    best = distance
+                        elif forward[relative] == forward_depth + 1:
+                            forward_preds[relative].append((handle, step))
+                forward_level = next_level
+                forward_depth += 1
+            else:
+                next_level = []
+                for handle in backward_level:
+                    for relative in self.predecessors(handle):
+                        if relative not in backward:
+                            backward[relative] = backward_depth + 1
+                            backward_succs[relative] = [handle]
+                            next_level.append(relative)
+                            if relative in forward:
+                                distance = backward_depth + 1 + forward[relative]
+                                if best is None or distance < best:
+                                    best = distance
+                        elif backward[relative] == backward_depth + 1:
+                            backward_succs[relative].append(handle)
+                backward_level = next_level
+                backward_depth += 1
+        if best is None:
+            return
+        # Every shortest path goes through exactly one person at this
+        # distance from start, known by both searches
+        middle = min(forward_depth, best)
+        for handle in sorted(forward):
+            if forward[handle] == middle and \
+                    backward.get(handle) == best - middle:
+                for head in self.forward_paths(handle, forward_preds):
+                    for tail in self.backward_paths(handle, backward_succs):
+                        yield head + tail
+
+    def forward_paths(self, handle, preds):
+        if not preds[handle]:
+            yield []
+        for (previous, step) in preds[handle]:
+            for path in self.forward_paths(previous, preds):
+                yield path + [step]
+
+    def backward_paths(self, handle, succs):
+        if not succs[handle]:
+            yield []
+        for following in succs[handle]:
+            steps = [step for (relative, step, is_link) in self.edges(handle)
+                     if relative == following]
+            for path in self.backward_paths(following, succs):
+                for step in steps:
+                    yield [step] + path
+
 #------------------------------------------------------------------------
 #
 # The Gramplet
@@ -52,9 +312,15 @@ _ = _trans.gettext
 class DeepConnectionsGramplet(Gramplet):
     """
     Finds deep connections people the home person and the active person.
+
+    All of the shortest connections are found with a bidirectional
+    breadth-first search over a kinship index (see L{KinshipIndex}), which
+    is built once for the database and updated when people and families
+    are changed.
     """
     def init(self):
         self.selected_handles = set()
+        self.index = None
         self.relationship_calc = get_relationship_calculator()
         self.set_tooltip(_("Double-click name for details"))
         self.set_text(_("No Family Tree loaded."))
@@ -77,71 +343,34 @@ class DeepConnectionsGramplet(Gramplet):
         self.gui.get_container_widget().add_with_viewport(vbox)
         vbox.show_all()
 
-    def get_links_from_notes(self, obj, path, relation, person_handle):
+    def db_changed(self):
         """
-        Get anyone mentioned in any note attached to this object.
+        Rebuild the kinship index for the new database, and keep it up to
+        date with the person and family changes.
         """
-        retval = []
-        note_list = obj.get_note_list()
-        for note_handle in note_list: 
-            note = self.dbstate.db.get_note_from_handle(note_handle)
-            if note:
-                links = note.get_links()
-                for link in links:
-                    if link[0] == "gramps" and link[1] == "Person":
-                        relation = _("mentioned in note")
-                        if link[2] == "handle":
-                            retval += [(link[3], (path, (relation, person_handle)))]
-        return retval
+        self.index = None
+        self.dbstate.db.connect('person-add', self.people_changed)
+        self.dbstate.db.connect('person-delete', self.people_changed)
+        self.dbstate.db.connect('person-update', self.people_changed)
+        self.dbstate.db.connect('family-add', self.families_changed)
+        self.dbstate.db.connect('family-delete', self.families_changed)
+        self.dbstate.db.connect('family-update', self.families_changed)
+        # The index does not know which people refer to a note,
+        # rebuild it on next search
+        self.dbstate.db.connect('note-add', self.notes_changed)
+        self.dbstate.db.connect('note-delete', self.notes_changed)
+        self.dbstate.db.connect('note-update', self.notes_changed)
 
-    def get_relatives(self, person_handle, path):
-        """
-        Gets all of the relations of person_handle.
-        """
-        retval = []
-        person = self.dbstate.db.get_person_from_handle(person_handle)
-        if person is None: return []
-        family_list = person.get_family_handle_list()
-        for family_handle in family_list:
-            family = self.dbstate.db.get_family_from_handle(family_handle)
-            if family:
-                children = family.get_child_ref_list()
-                husband = family.get_father_handle()
-                wife = family.get_mother_handle()
-                retval.extend((child_ref.ref, (path, (_("child"), person_handle, 
-                                                      husband, wife)))
-                              for child_ref in children)
-                if husband and husband != person_handle:
-                    retval += [(husband, (path, (_("husband"), person_handle)))]
-                if wife and wife != person_handle:
-                    retval += [(wife, (path, (_("wife"), person_handle)))]
-                retval += self.get_links_from_notes(family, path, _("Note on Family"), person_handle)
+    def people_changed(self, handle_list):
+        if self.index is not None:
+            self.index.update_people(self.dbstate.db, handle_list)
 
-        parent_family_list = person.get_parent_family_handle_list()
-        for family_handle in parent_family_list:
-            family = self.dbstate.db.get_family_from_handle(family_handle)
-            if family:
-                children = family.get_child_ref_list()
-                husband = family.get_father_handle()
-                wife = family.get_mother_handle()
-                retval.extend((child_ref.ref, (path, 
-                                    (_("sibling"), person_handle, husband, wife)))
-                              for child_ref in children if child_ref.ref != person_handle)
-                if husband and husband != person_handle:
-                    retval += [(husband, 
-                                (path, (_("father"), person_handle, wife)))]
-                if wife and wife != person_handle:
-                    retval += [(wife, 
-                                (path, (_("mother"), person_handle, husband)))]
-                retval += self.get_links_from_notes(family, path, _("Note on Parent Family"), person_handle)
-        assoc_list = person.get_person_ref_list()
-        for assoc in assoc_list:
-            relation = _("%s (association)") % assoc.get_relation()
-            assoc_handle = assoc.get_reference_handle()
-            retval += [(assoc_handle, (path, (relation, person_handle)))]
-
-        retval += self.get_links_from_notes(person, path, _("Note on Person"), person_handle)
-        return retval
+    def families_changed(self, handle_list):
+        if self.index is not None:
+            self.index.update_families(self.dbstate.db, handle_list)
+
+    def notes_changed(self, handle_list):
+        self.index = None
 
     def active_changed(self, handle):
         """
@@ -193,9 +422,6 @@ class DeepConnectionsGramplet(Gramplet):
         if active_person == None:
             self.set_text(_("No Active Person set."))
             return
-        self.cache = set() 
-        self.queue = [(self.default_person.handle, 
-                       (None, (_("self"), self.default_person.handle, [])))]
         default_name = self.default_person.get_primary_name()
         active_name = active_person.get_primary_name()
         self.set_text("")
@@ -205,37 +431,34 @@ class DeepConnectionsGramplet(Gramplet):
                          (name_displayer.display_name(default_name), 
                           name_displayer.display_name(active_name)))
         yield True
+        if self.index is None:
+            index = KinshipIndex()
+            for count in index.build(self.dbstate.db):
+                yield True
+            self.index = index
         relationship = self.relationship_calc.get_one_relationship(
             self.dbstate.db, self.default_person, active_person)
-        while self.queue:
-            current_handle, current_path = self.queue.pop(0)
-            if current_handle == active_person.handle: 
-                self.total_relations_found += 1
-                self.append_text(_("Found relation #%d: \n   ") % self.total_relations_found)
-
-                self.link(name_displayer.display_name(active_name), "Person", active_person.handle)
-                if relationship:
-                    self.append_text(" [%s]" % relationship)
-                self.selected_handles.clear()
-                self.selected_handles.add(active_person.handle)
-                self.pretty_print(current_path)
-                self.append_text("\n")
-                if self.default_person.handle != active_person.handle:
-                    self.append_text(_("Paused.\nPress Continue to search for additional relations.\n"))
-                    self.pause()
-                    yield False
-                else:
-                    break
-            elif current_handle in self.cache: 
-                continue
-            self.cache.add(current_handle)
-            relatives = self.get_relatives(current_handle, current_path)
-            for items in relatives:
-                person_handle = items[0]
-                path = items[1] 
-                if person_handle is not None: # and person_handle not in self.cache: 
-                    self.queue.append((person_handle, path))
-            yield True
+        for steps in self.index.shortest_paths(self.default_person.handle,
+                                               active_person.handle):
+            current_path = (None, (_("self"), self.default_person.handle, []))
+            for step in steps:
+                current_path = (current_path, step)
+            self.total_relations_found += 1
+            self.append_text(_("Found relation #%d: \n   ") % self.total_relations_found)
+
+            self.link(name_displayer.display_name(active_name), "Person", active_person.handle)
+            if relationship:
+                self.append_text(" [%s]" % relationship)
+            self.selected_handles.clear()
+            self.selected_handles.add(active_person.handle)
+            self.pretty_print(current_path)
+            self.append_text("\n")
+            if self.default_person.handle != active_person.handle:
+                self.append_text(_("Paused.\nPress Continue to search for additional relations.\n"))
+                self.pause()
+                yield False
+            else:
+                break
         self.append_text(_("\nSearch completed. %d relations found.") % self.total_relations_found)
         yield False
 
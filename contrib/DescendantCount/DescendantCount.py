@@ -19,6 +19,9 @@
 # $Id$
 
 import sys
+import hashlib
+import logging
+import math
 
 #------------------------------------------------------------------------
 #
@@ -35,7 +38,19 @@ _ = _trans.gettext
 from gramps.gui.plug.quick import QuickTable, run_quick_report_by_name
 from gramps.gen.simple import SimpleAccess, SimpleDoc
 
-cache = {}
+LOG = logging.getLogger(".DescendantCount")
+
+# Above this number of people, the descendants are counted with
+# HyperLogLog sketches of a fixed size instead of exact bitsets, which
+# grow with the number of people
+EXACT_LIMIT = 500000
+# Number of HyperLogLog registers, the relative error is about 3%
+SKETCH_BITS = 10
+SKETCH_SIZE = 1 << SKETCH_BITS
+SKETCH_ALPHA = 0.7213 / (1 + 1.079 / SKETCH_SIZE)
+SKETCH_POWERS = [2.0 ** -rank for rank in range(65)]
+
+_counter = None
 
 #------------------------------------------------------------------------
 #
@@ -43,6 +58,14 @@ cache = {}
 #
 #------------------------------------------------------------------------
 class DescendantCountGramplet(Gramplet):
+    def db_changed(self):
+        self.dbstate.db.connect('person-add', self.update)
+        self.dbstate.db.connect('person-delete', self.update)
+        self.dbstate.db.connect('person-update', self.update)
+        self.dbstate.db.connect('family-add', self.update)
+        self.dbstate.db.connect('family-delete', self.update)
+        self.dbstate.db.connect('family-update', self.update)
+
     def main(self):
         run_quick_report_by_name(self.gui.dbstate, 
                                  self.gui.uistate, 
@@ -50,32 +73,173 @@ class DescendantCountGramplet(Gramplet):
                                  "None", # dummy handle value
                                  container=self.gui.textview)
 
+#------------------------------------------------------------------------
+#
+# Descendant counter
+#
+#------------------------------------------------------------------------
+class DescendantCounter(object):
+    """
+    Counts the unique descendants of all of the people of a database.
+
+    The people are numbered, and the children of each person are stored
+    as lists of numbers. The people are then visited in topological order,
+    the children before their parents, and the descendants of each person
+    are the union of its children and of their descendants, so that a
+    descendant reached by several lines of descent is only counted once.
+
+    The descendants are Python integers used as bitsets, or HyperLogLog
+    sketches giving an estimation above L{EXACT_LIMIT} people. The set of
+    a person is released once all of its parents have been visited.
+
+    The counts are kept until a person or a family is changed.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.counts = None
+        self.estimated = False
+        for signal in ('person-add', 'person-delete', 'person-update',
+                       'family-add', 'family-delete', 'family-update'):
+            db.connect(signal, self.invalidate)
+
+    def invalidate(self, *args):
+        self.counts = None
+
+    def get_counts(self):
+        """
+        Return a dictionary giving the number of descendants of each person
+        handle.
+        """
+        if self.counts is None:
+            self.counts = self.compute()
+        return self.counts
+
+    def build_graph(self):
+        """
+        Return the person handles, and the list of the children numbers of
+        each person.
+        """
+        handles = []
+        for handle in self.db.iter_person_handles():
+            if isinstance(handle, bytes):
+                handle = handle.decode("utf-8")
+            handles.append(handle)
+        index = dict((handle, number) for (number, handle)
+                     in enumerate(handles))
+        children = [set() for handle in handles]
+        for family in self.db.iter_families():
+            child_list = [index[child_ref.ref]
+                          for child_ref in family.get_child_ref_list()
+                          if child_ref.ref in index]
+            for parent in (family.get_father_handle(),
+                           family.get_mother_handle()):
+                if parent in index:
+                    children[index[parent]].update(child_list)
+        return (handles, [list(child_set) for child_set in children])
+
+    def compute(self):
+        (handles, children) = self.build_graph()
+        nb_people = len(handles)
+        nb_parents = [0] * nb_people
+        for child_list in children:
+            for child in child_list:
+                nb_parents[child] += 1
+        remaining = list(nb_parents)
+        # Topological order, the parents before their children
+        order = [number for number in range(nb_people)
+                 if not nb_parents[number]]
+        for number in order:
+            for child in children[number]:
+                nb_parents[child] -= 1
+                if not nb_parents[child]:
+                    order.append(child)
+        if len(order) < nb_people:
+            LOG.warning("%d people are their own ancestors, "
+                        "their descendant counts are not exact" %
+                        (nb_people - len(order)))
+            order.extend(number for number in range(nb_people)
+                         if nb_parents[number])
+        self.estimated = nb_people > EXACT_LIMIT
+        if self.estimated:
+            (empty, add, union, size) = (bytearray(SKETCH_SIZE),
+                self.sketch_add, self.sketch_union, self.sketch_size)
+            keys = [self.sketch_key(handle) for handle in handles]
+        else:
+            # The bit of a person is its rank in the visit order, so that
+            # the bitsets of the people visited first stay small
+            (empty, add, union, size) = (0,
+                lambda bitset, bit: bitset | bit,
+                lambda bitset, other: bitset | other,
+                lambda bitset: bin(bitset).count("1"))
+            keys = [0] * nb_people
+            for (rank, number) in enumerate(reversed(order)):
+                keys[number] = 1 << rank
+        descendants = [None] * nb_people
+        counts = {}
+        for number in reversed(order):
+            result = empty
+            for child in children[number]:
+                if descendants[child] is not None:
+                    result = union(result, descendants[child])
+                result = add(result, keys[child])
+                remaining[child] -= 1
+                if not remaining[child]:
+                    descendants[child] = None
+            counts[handles[number]] = size(result) if children[number] else 0
+            if remaining[number]:
+                descendants[number] = result
+        return counts
+
+    def sketch_key(self, handle):
+        """
+        Return the register and the rank of a person in a sketch.
+        """
+        value = int(hashlib.md5(handle.encode("utf-8")).hexdigest()[:16], 16)
+        register = value & (SKETCH_SIZE - 1)
+        value >>= SKETCH_BITS
+        rank = (value & -value).bit_length() if value else 64 - SKETCH_BITS
+        return (register, rank)
+
+    def sketch_add(self, sketch, key):
+        (register, rank) = key
+        if sketch[register] < rank:
+            sketch = bytearray(sketch)
+            sketch[register] = rank
+        return sketch
+
+    def sketch_union(self, sketch, other):
+        return bytearray(map(max, sketch, other))
+
+    def sketch_size(self, sketch):
+        estimate = SKETCH_ALPHA * SKETCH_SIZE * SKETCH_SIZE / \
+            sum(map(SKETCH_POWERS.__getitem__, sketch))
+        zeros = sketch.count(b"\0")
+        if estimate <= 2.5 * SKETCH_SIZE and zeros:
+            estimate = SKETCH_SIZE * math.log(float(SKETCH_SIZE) / zeros)
+        return int(round(estimate))
+
 #------------------------------------------------------------------------
 #
 # Functions
 #
 #------------------------------------------------------------------------
-def countem(db, person_handle, count):
-    global cache
-    if person_handle not in cache:
-        total = count
-        person = db.get_person_from_handle(person_handle)
-        for fam_handle in person.get_family_handle_list():
-            fam = db.get_family_from_handle(fam_handle)
-            for child_ref in fam.get_child_ref_list():
-                total += countem(db, child_ref.ref, 1)
-        cache[person_handle] = total
-    else:
-        total = cache[person_handle]
-    return total
+def get_counter(db):
+    """
+    Return the descendant counter of the database, that keeps the counts
+    between runs.
+    """
+    global _counter
+    if _counter is None or _counter.db is not db:
+        _counter = DescendantCounter(db)
+    return _counter
 
 def run(database, document, person):
     """
     Loops through the families that the person is a child in, and display
     the information about the other children.
     """
-    global cache
-    cache = {}
+    counter = get_counter(database)
+    counts = counter.get_counts()
     # setup the simple access functions
     sdb = SimpleAccess(database)
     sdoc = SimpleDoc(document)
@@ -83,15 +247,13 @@ def run(database, document, person):
     # display the title
     sdoc.title(_("Descendent Count"))
     sdoc.paragraph("")
+    if counter.estimated:
+        sdoc.paragraph(_("The numbers of descendants are estimated."))
+        sdoc.paragraph("")
     stab.columns(_("Person"), _("Number of Descendants"))
-    people = database.get_person_handles(sort_handles=False)
-    for person_handle in people:
-        countem(database, person_handle, 1)
     matches = 0
-    for person_handle in cache:
-        person = database.get_person_from_handle(person_handle)
-        stab.row(person, cache[person_handle] - 1) # remove self
+    for person in database.iter_people():
+        stab.row(person, counts.get(person.handle, 0))
         matches += 1
     sdoc.paragraph(_("There are %d people.\n") % matches)
     stab.write(sdoc)
-                    
@@ -14,7 +14,7 @@ register(REPORT,
 	id = 'DynamicWeb',
 	name = _("Dynamic Web Report"),
 	description =  _("Produces dynamic web pages for the database"),
-	version = '0.0.31',
+	version = '0.0.41',
 	gramps_target_version = '4.2',
 	status = STABLE,
 	fname = 'dynamicweb.py',
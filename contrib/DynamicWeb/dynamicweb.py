@@ -47,6 +47,7 @@ The generated pages use lots of Javascript:
    Raphael: raphaeljs.com
  - The web pages have the following structure:
 	- dwr_db_*.js: Generated files that contain the Gramps data. Theses files are generated by the methods "DynamicWebReport._export_***"
+	  With the "Precompressed data files" option, each data file has a gzip compressed copy dwr_db_*.js.gz, see L{DataFileWriter}
 	- *.html: Generated HTML files.
 	  See the list of HTML pages given in L{PAGES_NAMES}
 	  Some files (not listed in in L{PAGES_NAMES}) are generated by L{DynamicWebReport._export_pages}
@@ -114,25 +115,39 @@ import shutil
 import codecs
 import tarfile
 import tempfile
+import json
+import hashlib
+import binascii
 if sys.version_info[0] < 3:
 	from cStringIO import StringIO
+	from io import BytesIO
 	string_types = basestring
 else:
-	from io import StringIO
+	from io import StringIO, BytesIO
 	string_types = str
 from textwrap import TextWrapper
 from unicodedata import normalize
-from collections import defaultdict
+from collections import defaultdict, deque
+from contextlib import contextmanager
 from xml.sax.saxutils import escape
 if (sys.version_info[0] < 3):
 	import urlparse, urllib
 else:
 	import urllib, urllib.parse as urlparse
 import zipfile
+import gzip
+import filecmp
+import multiprocessing
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from operator import itemgetter
 from decimal import Decimal, getcontext
 getcontext().prec = 8
+try:
+	import resource
+except ImportError:
+	resource = None
 
 
 #------------------------------------------------
@@ -177,7 +192,6 @@ from gramps.gen.plug.report import MenuReportOptions
 from gramps.gen.utils.config import get_researcher
 from gramps.gen.utils.string import conf_strings
 from gramps.gen.utils.file import media_path_full
-from gramps.gen.utils.alive import probably_alive
 from gramps.gen.utils.db import get_source_and_citation_referents, get_birth_or_fallback, get_death_or_fallback, get_marriage_or_fallback
 from gramps.gen.constfunc import win, conv_to_unicode, get_curr_dir
 if (sys.version_info[0] < 3):
@@ -193,6 +207,7 @@ if (DWR_VERSION_412):
 	from gramps.gen.display.place import displayer as _pd
 from gramps.gen.datehandler import get_date_formats, displayer as _dd
 from gramps.gen.proxy import PrivateProxyDb, LivingProxyDb
+from gramps.gen.db import DbBsddb, DBMODE_R
 from gramps.plugins.lib.libhtmlconst import _CHARACTER_SETS, _CC, _COPY_OPTIONS
 
 # import HTML Class from src/plugins/lib/libhtml.py
@@ -351,6 +366,75 @@ BKREF_CLASS = 0
 BKREF_HANDLE = 1
 BKREF_REFOBJ = 2
 
+#: Number of objects in each shard of the Javascript data files (see L{DynamicWebReport._export_table})
+SHARD_SIZE = 500
+
+#: Manifest of the report, used for the incremental update (see L{DynamicWebReport._load_manifest})
+MANIFEST_FILE = "dwr_manifest.json"
+
+#: Cache of the media files copied to the web site, giving for each file: [source size, source modification time, MD5 digest]
+MEDIA_CACHE_FILE = "dwr_media_cache.json"
+
+#: Extensions of the files already compressed, stored without compression in the ZIP archives
+STORED_EXTENSIONS = set([
+	".jpg", ".jpeg", ".png", ".gif", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z",
+	".mp3", ".mp4", ".ogg", ".avi", ".mpg", ".mpeg", ".webm", ".woff", ".eot",
+])
+
+#: Profiling report of the report run, written in the web site directory (see L{StageProfiler})
+PROFILE_FILE = "dwr_profile.json"
+
+#: Number of generations through which the birth years are propagated to estimate the living status, see L{LivingStatus}
+LIVING_GENERATIONS = 3
+
+#: Size of the blocks compressed in parallel in the TGZ archives
+GZIP_BLOCK_SIZE = 1 << 20
+
+#: Size of the blocks read when copying files
+COPY_BLOCK_SIZE = 1 << 20
+
+#: Methods exporting the database as Javascript files, run in parallel in the parallel export mode (see L{DynamicWebReport._export_data})
+EXPORT_METHODS = [
+	"_export_individuals",
+	"_export_families",
+	"_export_sources",
+	"_export_citations",
+	"_export_repositories",
+	"_export_places",
+	"_export_media",
+	"_export_surnames",
+	"_export_search_index",
+]
+
+#: Number of characters of the prefix of the search index keys, giving the shard of the key (see L{DynamicWebReport._export_search_index})
+SEARCH_PREFIX_LENGTH = 2
+
+#: Data files of the objects found by the search page, for each Javascript Array (see L{DynamicWebReport._export_search_index})
+SEARCH_DATA_FILES = {
+	"I": "dwr_db_indi",
+	"M": "dwr_db_media",
+	"S": "dwr_db_sour",
+	"P": "dwr_db_place",
+}
+
+#: Search index shards file names
+SEARCH_SHARD_RE = re.compile(r"^dwr_search_[0-9a-f]+\.js$")
+
+#: Database method giving an object from its handle, for each class name
+HANDLE_FUNCS = {
+	"Person": "get_person_from_handle",
+	"Family": "get_family_from_handle",
+	"Event": "get_event_from_handle",
+	"Place": "get_place_from_handle",
+	"Source": "get_source_from_handle",
+	"Citation": "get_citation_from_handle",
+	"Repository": "get_repository_from_handle",
+	"MediaObject": "get_object_from_handle",
+	"Media": "get_object_from_handle",
+	"Note": "get_note_from_handle",
+	"Tag": "get_tag_from_handle",
+}
+
 
 _html_dbl_quotes = re.compile(r'([^"]*) " ([^"]*) " (.*)', re.VERBOSE)
 _html_sng_quotes = re.compile(r"([^']*) ' ([^']*) ' (.*)", re.VERBOSE)
@@ -442,6 +526,539 @@ def format_date(date, gedcom = False, iso = False):
 	return(val)
 
 
+def md5_digest(text):
+	"""Return the MD5 digest of a string, as an hexadecimal string"""
+	return(hashlib.md5(text.encode("UTF-8")).hexdigest())
+
+
+def replace_file(from_path, to_path):
+	"""
+	Rename a file, replacing the destination file if any.
+	Python 2 has no os.replace, and os.rename does not replace a file under Windows:
+	the destination is removed first.
+	"""
+	if (hasattr(os, "replace")):
+		os.replace(from_path, to_path)
+	else:
+		if (os.path.exists(to_path)): os.remove(to_path)
+		os.rename(from_path, to_path)
+
+
+def gzip_block(block):
+	"""Compress a block of bytes as a gzip member"""
+	out = BytesIO()
+	gz = gzip.GzipFile(fileobj = out, mode = "wb", mtime = 0)
+	gz.write(block)
+	gz.close()
+	return(out.getvalue())
+
+
+class DataFileWriter(object):
+	"""
+	Streaming writer of a Javascript data file.
+	The file is written to a temporary file as the records come, so that the memory used is bounded by a single record.
+	The records are written in compact form, one per line: the line breaks laying out a record are removed
+	(the Javascript strings cannot contain line breaks, they are escaped by L{script_escape}).
+	The file may have a precompressed sibling "<file>.gz", for the static servers serving precompressed files.
+	The MD5 digest of the contents (as given by L{md5_digest}) is computed on the fly.
+	"""
+	def __init__(self, path, encoding, compress = False):
+		self.path = path
+		self.tmp_path = path + ".tmp"
+		self.encoding = encoding
+		self.fw = open(self.tmp_path, "wb")
+		self.gz = None
+		if (compress):
+			self.gz_file = open(self.tmp_path + ".gz", "wb")
+			self.gz = gzip.GzipFile(filename = "", mode = "wb", fileobj = self.gz_file, mtime = 0)
+		self.md5 = hashlib.md5()
+		self.size = 0 #: Number of bytes written
+		self.nb_records = 0
+
+	def write(self, text):
+		self.md5.update(text.encode("UTF-8"))
+		data = text.encode(self.encoding, "xmlcharrefreplace")
+		self.fw.write(data)
+		if (self.gz): self.gz.write(data)
+		self.size += len(data)
+
+	def record(self, text):
+		"""Write a record of a Javascript Array, separated from the previous one"""
+		self.write(",\n" if (self.nb_records) else "\n")
+		self.write(text.replace("\n", ""))
+		self.nb_records += 1
+
+	def digest(self):
+		return(self.md5.hexdigest())
+
+	def close(self):
+		self.fw.close()
+		if (self.gz):
+			self.gz.close()
+			self.gz_file.close()
+
+	def identical(self):
+		"""Whether the file written is identical to the existing file"""
+		return(os.path.exists(self.path) and filecmp.cmp(self.tmp_path, self.path, shallow = False))
+
+	def commit(self, identical):
+		"""
+		Replace the existing file by the file written, unless identical.
+		The precompressed sibling is replaced as well, or removed if not written.
+		"""
+		if (identical):
+			os.remove(self.tmp_path)
+		else:
+			replace_file(self.tmp_path, self.path)
+		gz_path = self.path + ".gz"
+		if (not self.gz):
+			if (os.path.exists(gz_path)): os.remove(gz_path)
+		elif (identical and os.path.exists(gz_path)):
+			os.remove(self.tmp_path + ".gz")
+		else:
+			replace_file(self.tmp_path + ".gz", gz_path)
+
+
+class ParallelGzipFile(object):
+	"""
+	Write-only file object that compresses its contents with gzip in a pool of threads.
+	The contents are split in blocks of L{GZIP_BLOCK_SIZE} bytes, compressed as separate gzip members.
+	The concatenation of the members is a valid gzip file.
+	"""
+	def __init__(self, fileobj, threads = None):
+		self.fileobj = fileobj
+		self.pool = ThreadPool(threads)
+		self.max_pending = 2 * (threads or cpu_count())
+		self.pending = deque() #: Blocks being compressed, in the file order
+		self.buffer = []
+		self.buffer_size = 0
+
+	def write(self, data):
+		self.buffer.append(data)
+		self.buffer_size += len(data)
+		if (self.buffer_size >= GZIP_BLOCK_SIZE): self._compress_buffer()
+
+	def _compress_buffer(self):
+		if (self.buffer_size == 0): return
+		block = b"".join(self.buffer)
+		self.buffer = []
+		self.buffer_size = 0
+		self.pending.append(self.pool.apply_async(gzip_block, (block, )))
+		while (len(self.pending) > self.max_pending):
+			self.fileobj.write(self.pending.popleft().get())
+
+	def close(self):
+		self._compress_buffer()
+		while (self.pending):
+			self.fileobj.write(self.pending.popleft().get())
+		self.pool.close()
+		self.pool.join()
+		self.fileobj.close()
+
+	def abort(self):
+		"""Stop the compression threads and close the file, leaving its contents incomplete"""
+		self.pool.terminate()
+		self.pool.join()
+		self.fileobj.close()
+
+
+class RenderCache(object):
+	"""
+	Cache of the texts rendered during a report run (notes, citations lists, places names, dates),
+	by kind of text and key, with hit and miss counters for each kind
+	"""
+	def __init__(self):
+		self.texts = defaultdict(dict) #: Texts rendered, by kind and key
+		self.hits = defaultdict(int)
+		self.misses = defaultdict(int)
+
+	def get(self, kind, key, func, *args):
+		"""
+		Return the text of a given kind and key, rendered by func(*args) if it is not cached yet
+		"""
+		texts = self.texts[kind]
+		if (key in texts):
+			self.hits[kind] += 1
+			return(texts[key])
+		self.misses[kind] += 1
+		text = texts[key] = func(*args)
+		return(text)
+
+	def counters(self):
+		"""
+		Return the hit and miss counters, by kind
+		"""
+		kinds = set(self.hits) | set(self.misses)
+		return(dict((kind, (self.hits[kind], self.misses[kind])) for kind in kinds))
+
+	def add_counters(self, counters):
+		"""
+		Add the counters of another cache (of a worker process, see L{run_export_job})
+		"""
+		for (kind, (hits, misses)) in counters.items():
+			self.hits[kind] += hits
+			self.misses[kind] += misses
+
+	def log_counters(self):
+		for (kind, (hits, misses)) in sorted(self.counters().items()):
+			log.info("Render cache \"%s\": %i hits, %i misses (%.0f%% hits)" %
+				(kind, hits, misses, 100.0 * hits / max(hits + misses, 1)))
+
+
+def cpu_time():
+	"""Return the CPU time of the process, in seconds"""
+	if (hasattr(time, "process_time")): return(time.process_time())
+	return(time.clock())
+
+
+def peak_memory():
+	"""Return the peak resident memory of the process in kB, or None if it is unknown"""
+	if (resource is None): return(None)
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if (sys.platform == "darwin"): peak //= 1024
+	return(peak)
+
+
+class StageProfiler(object):
+	"""
+	Profiling of the report run, stage by stage (see L{stage}), written as a JSON report (see L{PROFILE_FILE}).
+	Each stage records: wall and CPU time, objects fetched from the database for each class (see L{CountingDb}),
+	files and bytes written, files not written because identical, and peak memory of the process.
+	When disabled, the profiler records nothing.
+	"""
+	def __init__(self, enabled):
+		self.enabled = enabled
+		self.start = time.time()
+		self.stages = [] #: Stages completed, in the order of completion
+		self.current = None #: Stage in progress, receiving the counts
+
+	@contextmanager
+	def stage(self, name):
+		if (not self.enabled):
+			yield
+			return
+		previous = self.current
+		self.current = {
+			"stage": name,
+			"fetches": defaultdict(int),
+			"files_written": 0,
+			"bytes_written": 0,
+			"files_identical": 0,
+		}
+		t = time.time()
+		cpu = cpu_time()
+		try:
+			yield
+		finally:
+			self.current["wall_time"] = round(time.time() - t, 3)
+			self.current["cpu_time"] = round(cpu_time() - cpu, 3)
+			self.current["peak_memory_kb"] = peak_memory()
+			self.current["pid"] = os.getpid()
+			self.stages.append(self.current)
+			self.current = previous
+
+	def fetch(self, class_name):
+		if (self.current is not None): self.current["fetches"][class_name] += 1
+
+	def file_written(self, nb_bytes):
+		if (self.current is None): return
+		self.current["files_written"] += 1
+		self.current["bytes_written"] += nb_bytes
+
+	def file_identical(self):
+		if (self.current is not None): self.current["files_identical"] += 1
+
+	def write(self, path, context):
+		"""
+		Write the profiling report, with the given context (options, objects counts, etc.)
+		"""
+		if (not self.enabled): return
+		report = dict(context)
+		report["wall_time"] = round(time.time() - self.start, 3)
+		report["peak_memory_kb"] = peak_memory()
+		report["stages"] = self.stages
+		with open(path, "w") as fw:
+			json.dump(report, fw, indent = 1, sort_keys = True)
+		log.info("File \"%s\" generated" % path)
+
+
+#: Class name of the objects fetched by each database method, for the profiling report (see L{CountingDb})
+FETCH_FUNCS = dict((func, class_name) for (class_name, func) in HANDLE_FUNCS.items() if (class_name != "Media"))
+
+class CountingDb(object):
+	"""
+	Database wrapper counting the objects fetched by the report, in the current stage of a L{StageProfiler}
+	"""
+	def __init__(self, database, profiler):
+		self.wrapped = database
+		self.profiler = profiler
+
+	def __getattr__(self, name):
+		attr = getattr(self.wrapped, name)
+		class_name = FETCH_FUNCS.get(name)
+		if (class_name is None): return(attr)
+		def fetch(handle):
+			self.profiler.fetch(class_name)
+			return(attr(handle))
+		return(fetch)
+
+
+def base_database(database):
+	"""
+	Return the database wrapped by the proxies (see L{DynamicWebReport.proxy_database}) and by the L{CountingDb} wrapper
+	"""
+	while True:
+		if (isinstance(database, CountingDb)):
+			database = database.wrapped
+		elif (getattr(database, "basedb", database) is not database):
+			database = database.basedb
+		else:
+			return(database)
+
+
+class LivingStatus(object):
+	"""
+	Living status of all the persons of a database, computed once in a whole-tree pass.
+	The status is stored in bitmaps indexed by the rank of the person handle:
+	 - alive: the person is probably alive today,
+	 - living: the person is considered as living by the privacy filter (see L{LivingBitmapProxyDb}):
+	   alive, or dead for less than years_after_death years.
+	Like probably_alive (gramps.gen.utils.alive), a person is dead when they have a death (or fallback) event,
+	or when their birth year is more than "behavior.max-age-prob-alive" years ago.
+	The birth year is given by the birth (or fallback) event, the earliest dated event,
+	or estimated from the birth years of the spouses, parents and children ("behavior.avg-generation-gap" years apart),
+	propagated through L{LIVING_GENERATIONS} generations. A person with no evidence is alive.
+	"""
+	def __init__(self, database, years_after_death = 0):
+		t = time.time()
+		self.ranks = {} #: Rank of each person handle in the bitmaps
+		current_year = Today().get_year()
+		max_age = config.get('behavior.max-age-prob-alive')
+		gap = config.get('behavior.avg-generation-gap')
+		birth = {} #: Birth year of the persons, known or estimated
+		death = {} #: Death year of the dead persons, 0 if unknown
+		for handle in database.iter_person_handles():
+			person = database.get_person_from_handle(handle)
+			if (not person): continue
+			self.ranks[handle] = len(self.ranks)
+			years = [self._event_year(database.get_event_from_handle(ref.ref)) for ref in person.get_event_ref_list()]
+			years = [year for year in years if (year)]
+			year = self._event_year(get_birth_or_fallback(database, person)) or min(years or [0])
+			if (year): birth[handle] = year
+			event = get_death_or_fallback(database, person)
+			if (event): death[handle] = self._event_year(event)
+		# Relatives of each person
+		relatives = defaultdict(list) #: List of (relative handle, birth years difference)
+		for family in database.iter_families():
+			parents = [h for h in (family.get_father_handle(), family.get_mother_handle()) if (h in self.ranks)]
+			children = [ref.ref for ref in family.get_child_ref_list() if (ref.ref in self.ranks)]
+			for parent in parents:
+				relatives[parent].extend((spouse, 0) for spouse in parents if (spouse != parent))
+				relatives[parent].extend((child, -gap) for child in children)
+				for child in children: relatives[child].append((parent, gap))
+		# Propagate the birth years. The latest estimate is kept, so that the persons are rather considered as living
+		for generation in range(LIVING_GENERATIONS):
+			estimates = {}
+			for handle in self.ranks:
+				if (handle in birth or handle in death): continue
+				years = [birth[h] + diff for (h, diff) in relatives[handle] if (h in birth)]
+				if (years): estimates[handle] = max(years)
+			if (not estimates): break
+			birth.update(estimates)
+		# Build the bitmaps
+		self.alive = bytearray((len(self.ranks) + 7) // 8)
+		self.living = bytearray(len(self.alive))
+		for (handle, rank) in self.ranks.items():
+			alive = (handle not in death) and (current_year - birth.get(handle, current_year) <= max_age)
+			living = alive or (death.get(handle) and current_year - death[handle] < years_after_death)
+			if (alive): self.alive[rank >> 3] |= 1 << (rank & 7)
+			if (living): self.living[rank >> 3] |= 1 << (rank & 7)
+		log.info("Living status of %i persons computed in %.2f s" % (len(self.ranks), time.time() - t))
+
+	@staticmethod
+	def _event_year(event):
+		if (not event): return(0)
+		return(event.get_date_object().get_year())
+
+	def _get_bit(self, bitmap, handle):
+		# Persons unknown when the status was computed are considered as living
+		rank = self.ranks.get(handle)
+		if (rank is None): return(True)
+		return(bool(bitmap[rank >> 3] & (1 << (rank & 7))))
+
+	def is_alive(self, handle):
+		return(self._get_bit(self.alive, handle))
+
+	def is_living(self, handle):
+		return(self._get_bit(self.living, handle))
+
+
+class LivingBitmapProxyDb(LivingProxyDb):
+	"""
+	L{LivingProxyDb} taking the living status of the persons from a L{LivingStatus},
+	instead of calling probably_alive each time a person is accessed.
+	The status is given by overriding the private method of L{LivingProxyDb} that calls probably_alive:
+	a warning is logged if this version of Gramps does not have it.
+	"""
+	def __init__(self, dbase, mode, living_status, current_year = None, years_after_death = 0):
+		LivingProxyDb.__init__(self, dbase, mode, current_year, years_after_death)
+		self.living_status = living_status
+		if (not callable(getattr(LivingProxyDb, "_LivingProxyDb__is_living", None))):
+			log.warning(_("The living status of the persons cannot be precomputed with this version of Gramps, it is computed each time a person is accessed"))
+
+	def _LivingProxyDb__is_living(self, person):
+		return(self.living_status.is_living(person.get_handle()))
+
+
+class ArchiveWriter(object):
+	"""
+	Archive (ZIP or TGZ) of the web site, to which the files are added as soon as they are generated.
+	The archive is written to a temporary file "<archive>.tmp", which replaces the previous archive when closed:
+	a report that fails leaves the previous archive untouched.
+	In the ZIP archives, the files already compressed (see L{STORED_EXTENSIONS}) are stored without compression.
+	The TGZ archives are compressed in a pool of threads (see L{ParallelGzipFile}).
+	"""
+	def __init__(self, path, ext, target_path, basepath):
+		"""
+		@param path: archive file path
+		@param ext: archive type, ".zip" or ".tgz"
+		@param target_path: web site directory
+		@param basepath: base path for the files inside the archive
+		"""
+		self.path = path
+		self.tmp_path = path + ".tmp"
+		self.ext = ext
+		self.target_path = target_path
+		self.basepath = basepath
+		self.added = set() #: Files already added
+		if (ext == ".zip"):
+			self.zip = zipfile.ZipFile(self.tmp_path, "w", zipfile.ZIP_DEFLATED, True)
+		else:
+			self.gzfile = ParallelGzipFile(open(self.tmp_path, "wb"))
+			self.tgz = tarfile.open(fileobj = self.gzfile, mode = "w|")
+
+	def add(self, file):
+		"""
+		Add a file to the archive, unless it was already added
+		"""
+		if (file in self.added or not os.path.isfile(file)): return
+		self.added.add(file)
+		arc_rel_path = file.replace(self.target_path, self.basepath, 1)
+		if (self.ext == ".zip"):
+			compress_type = zipfile.ZIP_DEFLATED
+			if (os.path.splitext(file)[1].lower() in STORED_EXTENSIONS):
+				compress_type = zipfile.ZIP_STORED
+			if (sys.version_info[0] < 3):
+				file = file.encode("cp437")
+				arc_rel_path = arc_rel_path.encode("cp437")
+			self.zip.write(file, arc_rel_path, compress_type)
+		else:
+			self.tgz.add(file, arc_rel_path)
+
+	def close(self):
+		if (self.ext == ".zip"):
+			self.zip.close()
+		else:
+			self.tgz.close()
+			self.gzfile.close()
+		replace_file(self.tmp_path, self.path)
+
+	def abort(self):
+		"""Close the archive after an error, and remove the temporary file"""
+		try:
+			if (self.ext == ".zip"):
+				self.zip.close()
+			else:
+				self.gzfile.abort()
+		finally:
+			if (os.path.exists(self.tmp_path)): os.remove(self.tmp_path)
+
+
+def file_digest(path):
+	"""Return the MD5 digest of a file contents, as an hexadecimal string"""
+	md5 = hashlib.md5()
+	with open(path, "rb") as fr:
+		for block in iter(lambda: fr.read(COPY_BLOCK_SIZE), b""):
+			md5.update(block)
+	return(md5.hexdigest())
+
+
+def copy_file_digest(from_path, to_path):
+	"""Copy a file, and return the MD5 digest of its contents (computed while copying)"""
+	md5 = hashlib.md5()
+	with open(from_path, "rb") as fr:
+		with open(to_path, "wb") as fw:
+			for block in iter(lambda: fr.read(COPY_BLOCK_SIZE), b""):
+				md5.update(block)
+				fw.write(block)
+	return(md5.hexdigest())
+
+
+def run_media_job(job):
+	"""
+	Run a media job given as (function, arguments), see L{DynamicWebReport._run_media_jobs}
+	@return: the destination file (last argument) and the result of the job
+	"""
+	(func, args) = job
+	return(args[-1], func(*args))
+
+
+#: Report whose data files are generated by the export worker processes, see L{DynamicWebReport._export_data}
+_export_report = None
+
+#: Error raised when a worker process could not open its database handle, see L{init_export_worker}
+_export_worker_error = None
+
+def init_export_worker(db_path):
+	"""
+	Initialize a worker process of the parallel export, see L{DynamicWebReport._export_data}
+	The worker processes are forked: the report they inherit is a read-only snapshot of the objects dictionaries.
+	Each worker opens its own read-only handle on the database when it is a BSDDB database (whose handles cannot be shared by processes).
+	If the database cannot be opened, the worker runs no job (see L{run_export_job}): the inherited handle is never used.
+	@param db_path: directory of the BSDDB database, or None to use the inherited database
+	"""
+	global _export_worker_error
+	report = _export_report
+	# The files are added to the archive by the parent process
+	report.archive = None
+	if (not db_path): return
+	try:
+		database = DbBsddb()
+		database.load(db_path, None, DBMODE_R)
+		report.database = report.proxy_database(database)
+	except:
+		_export_worker_error = str(sys.exc_info()[1])
+		report.database = None
+
+
+def run_export_job(method):
+	"""
+	Run an export method (see L{EXPORT_METHODS}) in a worker process, see L{DynamicWebReport._export_data}
+	@return: the method name, and what the method changed in the report state, see L{DynamicWebReport._merge_export_result},
+	or None with the error if the worker could not open the database
+	"""
+	report = _export_report
+	if (_export_worker_error is not None):
+		return(method, None, _export_worker_error)
+	report.created_files = []
+	report.media_jobs = []
+	report.manifest["shards"] = {}
+	report.render_cache = RenderCache()
+	report.profiler.stages = []
+	with report.profiler.stage(method):
+		getattr(report, method)()
+	return(method, {
+		"created_files": report.created_files,
+		# The media jobs are bound methods of the report, they are given by name
+		"media_jobs": [(func.__name__, args) for (func, args) in report.media_jobs],
+		"images_copied": report.images_copied,
+		"thumbnail_created": report.thumbnail_created,
+		"shards": report.manifest["shards"],
+		"cache_counters": report.render_cache.counters(),
+		"profile": report.profiler.stages,
+	}, None)
+
+
 def rmtree_fix(dirname):
 	"""Windows fix: Python shutil.rmtree does not work properly on Windows.
 	Unfortunately this fix is not completely working. Don't know why.
@@ -464,7 +1081,7 @@ class DynamicWebReport(Report):
 	
 	Extracts information from the database and exports the data into Javascript and HTML files
 	
-	The database extraction is performed by the method L{_build_obj_dict}. It recursively calls the methods "_add_***".
+	The database extraction is performed by the method L{_build_obj_dict}. It walks the objects graph with the methods "_add_***".
 	
 	The database extraction builds:
 	 - indexes of the objects selected for the report as dictionaries,
@@ -513,16 +1130,11 @@ class DynamicWebReport(Report):
 			menuopt = menu.get_option_by_name(optname)
 			self.options[optname] = menuopt.get_value()
 
-		if not self.options['incpriv']:
-			self.database = PrivateProxyDb(database)
-		else:
-			self.database = database
-
-		livinginfo = self.options['living']
-		yearsafterdeath = self.options['yearsafterdeath']
-
-		if livinginfo != INCLUDE_LIVING_VALUE:
-			self.database = LivingProxyDb(self.database, livinginfo, None, yearsafterdeath)
+		#: Profiling of the report run, see L{StageProfiler}
+		self.profiler = StageProfiler(self.options['profile'])
+		#: Living status of the persons, see L{LivingStatus}
+		self.living_status = None
+		self.database = self.proxy_database(database)
 
 		filters_option = menu.get_option_by_name('filter')
 		self.filter = filters_option.get_filter()
@@ -553,6 +1165,8 @@ class DynamicWebReport(Report):
 		self.encoding = self.options['encoding']
 		self.copyright = self.options['copyright']
 		self.inc_gendex = self.options['inc_gendex']
+		self.inc_search_index = self.options['inc_search_index']
+		self.incremental = self.options['incremental']
 		self.template = self.options['template']
 		self.pages_number = self.options['pages_number']
 		self.page_content = [
@@ -584,6 +1198,31 @@ class DynamicWebReport(Report):
 		self._backend = HtmlBackend()
 		self._backend.build_link = self.build_link
 
+		#: Texts rendered during the report run, see L{RenderCache}
+		self.render_cache = RenderCache()
+
+
+	def proxy_database(self, database):
+		"""
+		Return the database filtered according to the privacy options
+		"""
+		if not self.options['incpriv']:
+			database = PrivateProxyDb(database)
+
+		livinginfo = self.options['living']
+		yearsafterdeath = self.options['yearsafterdeath']
+
+		# The living status is computed once, and inherited by the worker processes of the parallel export
+		if (self.living_status is None):
+			with self.profiler.stage("living_status"):
+				self.living_status = LivingStatus(database, yearsafterdeath)
+
+		if livinginfo != INCLUDE_LIVING_VALUE:
+			database = LivingBitmapProxyDb(database, livinginfo, self.living_status, None, yearsafterdeath)
+		if (self.profiler.enabled):
+			database = CountingDb(database, self.profiler)
+		return(database)
+
 
 	def write_report(self):
 		"""
@@ -633,57 +1272,337 @@ class DynamicWebReport(Report):
 		#: List of thumbnails already created
 		self.thumbnail_created = set()
 
+		#: Media files copies and thumbnails creations, performed by L{_run_media_jobs}
+		self.media_jobs = []
+
 		#################################################
 		# Pass 1 Build the lists of objects to be output
 
-		self._build_obj_dict()
-		self._sort_obj_dict()
+		with self.profiler.stage("build_obj_dict"):
+			self._build_obj_dict()
+			self._sort_obj_dict()
 
 		#################################################
 		# Pass 2 Generate the web pages
 		
-		with self.user.progress(_("Dynamic Web Site Report"), _("Exporting family tree data ..."), 10) as step:
-			self.created_files = []
-			# Create directories
-			for dirname in ["thumb"] + (["image"] if (self.copy_media) else []):
-				dirpath = os.path.join(self.target_path, dirname)
-				if (not os.path.isdir(dirpath)): os.mkdir(dirpath)
-			# Copy web site files
-			self.copy_template_files()
-			step()
-			# Export database as Javascript files
-			self._export_individuals()
-			step()
-			self._export_families()
-			step()
-			self._export_sources()
-			self._export_citations()
-			self._export_repositories()
-			step()
-			self._export_places()
-			step()
-			self._export_media()
-			step()
-			self._export_surnames()
-			step()
-			# Generate HTML files
-			self._export_pages()
-			step()
-			# Create GENDEX file
-			self.build_gendex(self.obj_dict[Person])
-			step()
-			# Create an archive file of the web site
-			self.create_archive()
+		self.archive = None
+		try:
+			with self.user.progress(_("Dynamic Web Site Report"), _("Exporting family tree data ..."), len(EXPORT_METHODS) + 3) as step:
+				self.created_files = []
+				# Open the archive file of the web site
+				self.open_archive()
+				# Create directories
+				for dirname in ["thumb"] + (["image"] if (self.copy_media) else []):
+					dirpath = os.path.join(self.target_path, dirname)
+					if (not os.path.isdir(dirpath)): os.mkdir(dirpath)
+				# Copy web site files
+				with self.profiler.stage("copy_template_files"):
+					self.copy_template_files()
+				step()
+				# Read the manifest of the previous report for the incremental update
+				self._load_manifest()
+				# Export database as Javascript files
+				self._export_data(step)
+				self._save_manifest()
+				# Generate HTML files
+				with self.profiler.stage("export_pages"):
+					self._export_pages()
+				step()
+				# Create GENDEX file
+				with self.profiler.stage("build_gendex"):
+					self.build_gendex(self.obj_dict[Person])
+				step()
+
+			self.render_cache.log_counters()
+
+			# Copy the media files and create the thumbnails
+			with self.profiler.stage("media_jobs"):
+				self._run_media_jobs()
+
+			# Complete the archive file of the web site
+			with self.profiler.stage("create_archive"):
+				self.create_archive()
+		finally:
+			# Remove the partial archive if the report failed
+			if (self.archive):
+				self.archive.abort()
+				self.archive = None
+
+		self.profiler.write(os.path.join(self.target_path, PROFILE_FILE), {
+			"gramps_version": VERSION,
+			"objects": dict((cls.__name__, len(objects)) for (cls, objects) in self.obj_dict.items()),
+			"options": {
+				"incremental": self.incremental,
+				"parallel_export": self.options['parallel_export'],
+				"inc_search_index": self.inc_search_index,
+				"archive": self.options['archive'],
+			},
+			"render_cache": self.render_cache.counters(),
+		})
+
+
+	def _export_data(self, step):
+		"""
+		Export the database as Javascript files, with the methods L{EXPORT_METHODS}
+		In the parallel export mode, the methods run concurrently in a pool of worker processes, see L{init_export_worker}.
+		Each method writes its own files, and only reads the database and the objects dictionaries.
+		@param step: progress step function, called after each method
+		"""
+		pool = None
+		if (self.options['parallel_export']):
+			pool = self._make_export_pool()
+		remaining = list(EXPORT_METHODS)
+		if (pool):
+			global _export_report
+			try:
+				for (method, result, error) in pool.imap_unordered(run_export_job, EXPORT_METHODS):
+					if (result is None):
+						log.warning(_("Unable to open the database in a worker process: %(error)s, the data files are generated sequentially") % {"error": error})
+						pool.terminate()
+						break
+					self._merge_export_result(result)
+					remaining.remove(method)
+					log.info("Data files of \"%s\" generated" % method)
+					step()
+				else:
+					pool.close()
+			except:
+				pool.terminate()
+				raise
+			finally:
+				pool.join()
+				_export_report = None
+		for method in remaining:
+			with self.profiler.stage(method):
+				getattr(self, method)()
 			step()
 
 
+	def _make_export_pool(self):
+		"""
+		Return the pool of worker processes of the parallel export, or None if processes cannot be forked
+		"""
+		global _export_report
+		try:
+			context = multiprocessing.get_context("fork")
+		except (AttributeError, ValueError):
+			log.warning(_("Processes cannot be forked on this system, the data files are generated sequentially"))
+			return(None)
+		basedb = base_database(self.database)
+		db_path = basedb.get_save_path() if (isinstance(basedb, DbBsddb)) else None
+		# The workers inherit the report when they are forked
+		_export_report = self
+		processes = min(len(EXPORT_METHODS), cpu_count())
+		return(context.Pool(processes, init_export_worker, (db_path, )))
+
+
+	def _merge_export_result(self, result):
+		"""
+		Merge in the report state what an export method changed in a worker process, see L{run_export_job}:
+		the files created, the media jobs (unless already requested by another method), and the manifest shards
+		"""
+		created = set(self.created_files)
+		media_dests = set(args[-1] for (func, args) in self.media_jobs)
+		for (name, args) in result["media_jobs"]:
+			if (args[-1] in media_dests): continue
+			media_dests.add(args[-1])
+			self.media_jobs.append((getattr(self, name), args))
+		for f in result["created_files"]:
+			if (f in created): continue
+			created.add(f)
+			self.created_files.append(f)
+			# The media files are archived when copied, see L{_run_media_jobs}
+			if (f not in media_dests): self.archive_file(f)
+		self.images_copied.update(result["images_copied"])
+		self.thumbnail_created.update(result["thumbnail_created"])
+		self.manifest["shards"].update(result["shards"])
+		self.render_cache.add_counters(result["cache_counters"])
+		self.profiler.stages.extend(result["profile"])
+
+
+	def _export_table(self, filename, var, obj_class, header, handle_list, data_func):
+		"""
+		Export a table of objects in Javascript files
+		The table is split in shards of L{SHARD_SIZE} objects "<filename>_<n>.js", that add the objects to the Javascript Array L{var}.
+		The file "<filename>.js" declares the Array and loads the shards.
+		@param filename: data file name, without extension
+		@param var: name of the Javascript Array
+		@param obj_class: class of the objects
+		@param header: comments describing the table
+		@param handle_list: handles of the objects, sorted by index
+		@param data_func: method building the Javascript data of an object from its handle
+		"""
+		sw = StringIO()
+		sw.write(header)
+		sw.write(var + " = [];\n")
+		nb_shards = (len(handle_list) + SHARD_SIZE - 1) // SHARD_SIZE
+		for n in range(nb_shards):
+			fout = "%s_%i.js" % (filename, n)
+			sw.write("document.write('<script language=\"javascript\" src=\"%s\" charset=\"%s\"></script>');\n" % (fout, self.encoding))
+			self._export_shard(fout, var, obj_class, handle_list[n * SHARD_SIZE : (n + 1) * SHARD_SIZE], data_func)
+		# Remove the shards of a previous report that are not used any more
+		n = nb_shards
+		while (os.path.exists(os.path.join(self.target_path, "%s_%i.js" % (filename, n)))):
+			os.remove(os.path.join(self.target_path, "%s_%i.js" % (filename, n)))
+			if (os.path.exists(os.path.join(self.target_path, "%s_%i.js.gz" % (filename, n)))):
+				os.remove(os.path.join(self.target_path, "%s_%i.js.gz" % (filename, n)))
+			n += 1
+		self.update_file(filename + ".js", sw.getvalue())
+
+
+	def _export_shard(self, fout, var, obj_class, handle_list, data_func):
+		"""
+		Export a shard of a table of objects, see L{_export_table}
+		In incremental mode, the shard is not generated if the objects it contains and their fingerprints are unchanged since the previous report.
+		The shard is then not read from the disk either.
+		"""
+		path = os.path.join(self.target_path, fout)
+		old = self.previous_shards.get(fout)
+		fingerprints = None
+		if (self.incremental):
+			fingerprints = [self._object_fingerprint(obj_class, handle) for handle in handle_list]
+			if (old and os.path.exists(path) and
+				[obj[0] for obj in old["objects"]] == handle_list and
+				[obj[2] for obj in old["objects"]] == fingerprints):
+				created = set(self.created_files)
+				for f in [path] + ([path + ".gz"] if (self.options['data_gzip']) else []):
+					self.created_files.append(f)
+					self.archive_file(f)
+				for f in old["files"]:
+					f = os.path.join(self.target_path, f)
+					if (f not in created):
+						self.created_files.append(f)
+						self.archive_file(f)
+				self.manifest["shards"][fout] = old
+				self.profiler.file_identical()
+				log.info("File \"%s\" not generated (unchanged objects)" % fout)
+				return
+		# Generate the shard, and keep track of the media files it copies
+		nb_created = len(self.created_files)
+		writer = self.open_data_file(fout)
+		writer.write("// This file is generated\n\n" + var + ".push(")
+		digests = []
+		for handle in handle_list:
+			data = data_func(handle)
+			digests.append(md5_digest(data))
+			writer.record(data)
+		writer.write("\n);\n")
+		files = [os.path.relpath(f, self.target_path) for f in self.created_files[nb_created:]]
+		digest = writer.digest()
+		if (fingerprints is None):
+			self.close_data_file(writer)
+		else:
+			self.close_data_file(writer, bool(old and old["digest"] == digest and os.path.exists(path)))
+		self.manifest["shards"][fout] = {
+			"digest": digest,
+			"objects": [
+				[handle, self.obj_change.get(handle), fingerprints[i] if fingerprints else None, digests[i]]
+				for (i, handle) in enumerate(handle_list)],
+			"files": files,
+		}
+
+
+	def _load_manifest(self):
+		"""
+		Read the manifest of the previous report (see L{MANIFEST_FILE}), used in incremental mode.
+		The manifest gives for each data file shard:
+		 - the digest of the shard contents,
+		 - the objects of the shard in the form: [handle, change time, fingerprint, digest of the object data],
+		 - the media files copied when generating the shard.
+		The manifest of the previous report is ignored when the report options or the objects names and indexes have changed.
+		"""
+		self.manifest = {"context": self._manifest_context(), "shards": {}}
+		self.previous_shards = {}
+		if (not self.incremental): return
+		path = os.path.join(self.target_path, MANIFEST_FILE)
+		try:
+			with open(path) as fr:
+				manifest = json.load(fr)
+		except (IOError, OSError, ValueError):
+			log.info("No manifest \"%s\", all data files are generated" % path)
+			return
+		if (manifest.get("context") != self.manifest["context"]):
+			log.info("Report options or objects indexes changed, all data files are generated")
+			return
+		self.previous_shards = manifest.get("shards", {})
+
+
+	def _save_manifest(self):
+		"""
+		Write the manifest of the report (see L{_load_manifest})
+		"""
+		path = os.path.join(self.target_path, MANIFEST_FILE)
+		with open(path, "w") as fw:
+			json.dump(self.manifest, fw)
+		log.info("File \"%s\" generated" % MANIFEST_FILE)
+
+
+	def _manifest_context(self):
+		"""
+		Return the digest of what the data files depend on, besides the objects themselves:
+		the report options, the Gramps version, and the names, IDs and indexes of all the objects.
+		"""
+		options = sorted((name, str(value)) for (name, value) in self.options.items() if (name not in ("incremental", "parallel_export", "profile")))
+		context = [VERSION, options]
+		for obj_class in sorted(self.obj_dict.keys(), key = lambda cls: cls.__name__):
+			context.append(sorted(self.obj_dict[obj_class].items()))
+		return(md5_digest(repr(context)))
+
+
+	def _record_object(self, handle, obj):
+		"""
+		Record the change time of an object, and in incremental mode the objects it references.
+		This is used to compute the fingerprints of the objects, see L{_object_fingerprint}
+		"""
+		self.obj_change[handle] = obj.change
+		if (self.incremental):
+			self.obj_refs[handle] = obj.get_referenced_handles_recursively()
+
+
+	def _get_change(self, class_name, handle):
+		"""
+		Get the change time of an object, reading it from the database if it was not recorded by L{_record_object}
+		"""
+		if (handle not in self.obj_change):
+			obj = None
+			if (class_name in HANDLE_FUNCS):
+				obj = getattr(self.database, HANDLE_FUNCS[class_name])(handle)
+			self.obj_change[handle] = obj.change if obj else None
+		return(self.obj_change[handle])
+
+
+	def _object_fingerprint(self, obj_class, handle):
+		"""
+		Return the digest of the change times of an object, of the objects it references,
+		of the objects referenced by its events (places, notes, citations, media),
+		and of the objects referencing it (see L{bkref_dict}).
+		The data of an object include its back references (the persons and families of a place, the citations of a source,
+		the references of a media with their regions and notes): the fingerprint changes when a reference is added,
+		removed, or modified in the referencing object.
+		"""
+		changes = [self.obj_change.get(handle)]
+		for (class_name, ref_handle) in self.obj_refs.get(handle, []):
+			changes.append(self._get_change(class_name, ref_handle))
+			if (class_name == "Event"):
+				changes.extend([self._get_change(c, h) for (c, h) in self.obj_refs.get(ref_handle, [])])
+		bkrefs = []
+		for (bkref_class, bkref_handle, ref) in self.bkref_dict[obj_class].get(handle, ()):
+			bkref = [bkref_class.__name__, bkref_handle, self._get_change(bkref_class.__name__, bkref_handle)]
+			if (ref is not None):
+				# The reference may be held by an event of the referencing object
+				bkref.append(ref.serialize())
+				bkref.extend([self._get_change(c, h) for (c, h) in ref.get_referenced_handles_recursively()])
+			bkrefs.append(repr(bkref))
+		changes.append(sorted(bkrefs))
+		return(md5_digest(repr(changes)))
+
+
 	def _export_individuals(self):
 		"""
 		Export individuals data in Javascript file
 		The individuals data is stored in the Javascript Array "I"
 		"""
-		sw = StringIO()
-		sw.write(
+		header = (
 			"// This file is generated\n\n"
 			"// 'I' is sorted by person name\n"
 			"// 'I' gives for individual:\n"
@@ -737,64 +1656,66 @@ class DynamicWebReport(Report):
 			"//       [index (in table 'F'), relation to father, relation to mother, notes, list of citations]\n"
 			"//   - A list of associations in the form:\n"
 			"//       [person index (in table 'I'), relationship, notes, list of citations (in table 'C')]\n"
-			"I = [")
-		sep = "\n"
+			"\n")
 		person_list = list(self.obj_dict[Person].keys())
 		person_list.sort(key = lambda x: self.obj_dict[Person][x][OBJDICT_INDEX])
-		for person_handle in person_list:
-			person = self.database.get_person_from_handle(person_handle)
-			sw.write(sep)
-			sw.write("[\"" + self.obj_dict[Person][person_handle][OBJDICT_GID] + "\",")
-			# Names
-			name = self.get_name(person) or ""
-			sw.write("\"" + script_escape(name) + "\",")
-			name = self.get_short_name(person) or ""
-			sw.write("\"" + script_escape(name) + "\",\n")
-			sw.write(self.get_name_data(person) + ",\n")
-			# Gender
-			gender = ""
-			if (person.get_gender() == Person.MALE): gender = "M"
-			if (person.get_gender() == Person.FEMALE): gender = "F"
-			if (person.get_gender() == Person.UNKNOWN): gender = "U"
-			sw.write("\"" + gender + "\",")
-			# Years
-			sw.write("\"" + self.get_birth_year(person) + "\",\n")
-			sw.write("\"" + self.get_birth_place(person) + "\",\n")
-			sw.write("\"" + self.get_death_year(person) + "\",\n")
-			sw.write("\"" + self.get_death_place(person) + "\",\n")
-			# Age at death
-			sw.write("\"" + script_escape(self.get_death_age(person)) + "\",\n")
-			# Events
-			sw.write("[\n" + self._data_events(person) + "\n],\n")
-			# Addresses
-			sw.write("[\n" + self._data_addresses(person) + "\n],\n")
-			# Get individual notes
-			sw.write("\"" + script_escape(self.get_notes_text(person)) + "\",\n")
-			# Get individual media
-			sw.write(self._data_media_reference_index(person))
-			sw.write(",\n")
-			# Get individual sources
-			sw.write(self._data_source_citation_index(person))
-			sw.write(",\n")
-			# Get individual attributes
-			sw.write(self._data_attributes(person))
-			sw.write(",\n")
-			# Get individual URL
-			sw.write(self._data_url_list(person))
-			sw.write(",\n")
-			# Families (partners)
-			sw.write(self._data_families_index(person))
-			sw.write(",\n")
-			# Families (parents)
-			sw.write(self._data_parents_families_index(person))
-			sw.write(",\n")
-			# Associations
-			sw.write(self._data_associations(person))
-			sw.write("\n]")
-			#
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_indi.js", sw.getvalue())
+		self._export_table("dwr_db_indi", "I", Person, header, person_list, self._data_person)
+
+
+	def _data_person(self, person_handle):
+		"""
+		Build the Javascript data of a person, as described in L{_export_individuals}
+		"""
+		sw = StringIO()
+		person = self.database.get_person_from_handle(person_handle)
+		sw.write("[\"" + self.obj_dict[Person][person_handle][OBJDICT_GID] + "\",")
+		# Names
+		name = self.get_name(person) or ""
+		sw.write("\"" + script_escape(name) + "\",")
+		name = self.get_short_name(person) or ""
+		sw.write("\"" + script_escape(name) + "\",\n")
+		sw.write(self.get_name_data(person) + ",\n")
+		# Gender
+		gender = ""
+		if (person.get_gender() == Person.MALE): gender = "M"
+		if (person.get_gender() == Person.FEMALE): gender = "F"
+		if (person.get_gender() == Person.UNKNOWN): gender = "U"
+		sw.write("\"" + gender + "\",")
+		# Years
+		sw.write("\"" + self.get_birth_year(person) + "\",\n")
+		sw.write("\"" + self.get_birth_place(person) + "\",\n")
+		sw.write("\"" + self.get_death_year(person) + "\",\n")
+		sw.write("\"" + self.get_death_place(person) + "\",\n")
+		# Age at death
+		sw.write("\"" + script_escape(self.get_death_age(person)) + "\",\n")
+		# Events
+		sw.write("[\n" + self._data_events(person) + "\n],\n")
+		# Addresses
+		sw.write("[\n" + self._data_addresses(person) + "\n],\n")
+		# Get individual notes
+		sw.write("\"" + script_escape(self.get_notes_text(person)) + "\",\n")
+		# Get individual media
+		sw.write(self._data_media_reference_index(person))
+		sw.write(",\n")
+		# Get individual sources
+		sw.write(self._data_source_citation_index(person))
+		sw.write(",\n")
+		# Get individual attributes
+		sw.write(self._data_attributes(person))
+		sw.write(",\n")
+		# Get individual URL
+		sw.write(self._data_url_list(person))
+		sw.write(",\n")
+		# Families (partners)
+		sw.write(self._data_families_index(person))
+		sw.write(",\n")
+		# Families (parents)
+		sw.write(self._data_parents_families_index(person))
+		sw.write(",\n")
+		# Associations
+		sw.write(self._data_associations(person))
+		sw.write("\n]")
+		return(sw.getvalue())
 
 
 	def get_name_data(self, person):
@@ -836,7 +1757,7 @@ class DynamicWebReport(Report):
 			fnick = name.get_family_nick_name() or ""
 			text += "\"" + script_escape(str(fnick)) + "\","
 			# Get name date
-			datetext = format_date(name.date) or ""
+			datetext = self.format_date(name.date) or ""
 			text += "\"" + script_escape(datetext) + "\","
 			# Get name notes
 			text += "\"" + script_escape(self.get_notes_text(name)) + "\","
@@ -892,8 +1813,7 @@ class DynamicWebReport(Report):
 		Export families data in Javascript file
 		The families data is stored in the Javascript Array "F"
 		"""
-		sw = StringIO()
-		sw.write(
+		header = (
 			"// This file is generated\n\n"
 			"// 'F' is sorted by family full name\n"
 			"// 'F' gives for each family:\n"
@@ -929,44 +1849,46 @@ class DynamicWebReport(Report):
 			"//   - A list of spouses index (in table 'I')\n"
 			"//   - A list of child in the form:\n"
 			"//       [index (in table 'I'), relation to father, relation to mother, notes, list of citations]\n"
-			"F = [")
-		sep = "\n"
+			"\n")
 		family_list = list(self.obj_dict[Family].keys())
 		family_list.sort(key = lambda x: self.obj_dict[Family][x][OBJDICT_INDEX])
-		for family_handle in family_list:
-			family = self.database.get_family_from_handle(family_handle)
-			sw.write(sep)
-			sw.write("[\"" + self.obj_dict[Family][family_handle][OBJDICT_GID] + "\",")
-			# Names
-			name = self.get_family_name(family) or ""
-			sw.write("\"" + script_escape(name) + "\",\n")
-			sw.write("\"" + script_escape(str(family.get_relationship())) + "\",\n")
-			# Years
-			sw.write("\"" + self.get_marriage_year(family) + "\",\n")
-			sw.write("\"" + self.get_marriage_place(family) + "\",\n")
-			# Events
-			sw.write("[\n" + self._data_events(family) + "\n],\n")
-			# Get family notes
-			sw.write("\"" + script_escape(self.get_notes_text(family)) + "\",\n")
-			# Get family media
-			sw.write(self._data_media_reference_index(family))
-			sw.write(",\n")
-			# Get family sources
-			sw.write(self._data_source_citation_index(family))
-			sw.write(",\n")
-			# Get family attributes
-			sw.write(self._data_attributes(family))
-			sw.write(",\n")
-			# Partners
-			sw.write(self._data_partners_index(family))
-			sw.write(",\n")
-			# Children
-			sw.write(self._data_children_index(family))
-			sw.write("\n]")
-			#
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_fam.js", sw.getvalue())
+		self._export_table("dwr_db_fam", "F", Family, header, family_list, self._data_family)
+
+
+	def _data_family(self, family_handle):
+		"""
+		Build the Javascript data of a family, as described in L{_export_families}
+		"""
+		sw = StringIO()
+		family = self.database.get_family_from_handle(family_handle)
+		sw.write("[\"" + self.obj_dict[Family][family_handle][OBJDICT_GID] + "\",")
+		# Names
+		name = self.get_family_name(family) or ""
+		sw.write("\"" + script_escape(name) + "\",\n")
+		sw.write("\"" + script_escape(str(family.get_relationship())) + "\",\n")
+		# Years
+		sw.write("\"" + self.get_marriage_year(family) + "\",\n")
+		sw.write("\"" + self.get_marriage_place(family) + "\",\n")
+		# Events
+		sw.write("[\n" + self._data_events(family) + "\n],\n")
+		# Get family notes
+		sw.write("\"" + script_escape(self.get_notes_text(family)) + "\",\n")
+		# Get family media
+		sw.write(self._data_media_reference_index(family))
+		sw.write(",\n")
+		# Get family sources
+		sw.write(self._data_source_citation_index(family))
+		sw.write(",\n")
+		# Get family attributes
+		sw.write(self._data_attributes(family))
+		sw.write(",\n")
+		# Partners
+		sw.write(self._data_partners_index(family))
+		sw.write(",\n")
+		# Children
+		sw.write(self._data_children_index(family))
+		sw.write("\n]")
+		return(sw.getvalue())
 
 
 	def _data_events(self, object):
@@ -1009,9 +1931,9 @@ class DynamicWebReport(Report):
 			evt_desc = event.get_description()
 			trow += "\"" + self.obj_dict[Event][event_ref.ref][OBJDICT_GID] + "\","
 			trow += "\"" + script_escape(html_escape(evt_type)) + "\","
-			evt_date = format_date(event.get_date_object())
+			evt_date = self.format_date(event.get_date_object())
 			trow += "\"" + script_escape(html_escape(evt_date)) + "\","
-			evt_date = format_date(event.get_date_object(), True)
+			evt_date = self.format_date(event.get_date_object(), True)
 			trow += "\"" + script_escape(html_escape(evt_date)) + "\","
 			trow += str(place_index) + ","
 			if (evt_desc is None): evt_desc = ""
@@ -1055,9 +1977,9 @@ class DynamicWebReport(Report):
 		rows = []
 		for addr in addrlist:
 			text = "\t["
-			addr_date = format_date(addr.get_date_object())
+			addr_date = self.format_date(addr.get_date_object())
 			text += "\"" + script_escape(html_escape(addr_date)) + "\","
-			addr_date = format_date(addr.get_date_object(), True)
+			addr_date = self.format_date(addr.get_date_object(), True)
 			text += "\"" + script_escape(html_escape(addr_date)) + "\","
 			addr_data = [
 				addr.get_street(),
@@ -1084,8 +2006,7 @@ class DynamicWebReport(Report):
 		Export sources data in Javascript file
 		The sources data is stored in the Javascript Array "S"
 		"""
-		sw = StringIO()
-		sw.write(
+		header = (
 			"// This file is generated\n\n"
 			"// 'S' is sorted by source title\n"
 			"// 'S' gives for each source:\n"
@@ -1107,46 +2028,49 @@ class DynamicWebReport(Report):
 			"//       - notes of the repository reference\n"
 			"//   - The list of the sources attributes in the form:\n"
 			"//       [attribute, value, note, list of citations]\n"
-			"S = [")
-		sep = "\n"
+			"\n")
 		source_list = list(self.obj_dict[Source])
 		if (not self.inc_sources): source_list = []
 		source_list.sort(key = lambda x: self.obj_dict[Source][x][OBJDICT_INDEX])
-		for source_handle in source_list:
-			source = self.database.get_source_from_handle(source_handle)
-			sw.write(sep)
-			sw.write("[\"" + self.obj_dict[Source][source_handle][OBJDICT_GID] + "\",")
-			title = source.get_title() or ""
-			sw.write("\"" + script_escape(html_escape(title)) + "\",\n")
-			sw.write("\"")
-			for (label, value) in [
-				(_("Author"), source.get_author()),
-				(_("Abbreviation"), source.get_abbreviation()),
-				(_("Publication information"), source.get_publication_info())]:
-				if value:
-					html = Html("p") + Html("b", label + ": ") + value
-					sw.write(script_escape(html_text(html)))
-			sw.write("\",\n")
-			# Get source notes
-			sw.write("\"" + script_escape(self.get_notes_text(source)) + "\",\n")
-			# Get source media
-			sw.write(self._data_media_reference_index(source))
-			sw.write(",\n")
-			# Get source citations
-			sw.write(self._data_bkref_index(Source, source_handle, Citation))
-			sw.write(",\n")
-			# Get repositories references
-			sw.write(self._data_repo_reference_index(source))
-			sw.write(",\n")
-			# Get source attributes
-			if (DWR_VERSION_410):
-				sw.write(self._data_attributes_src(source))
-			else:
-				sw.write("[]")
-			sw.write("\n]")
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_sour.js", sw.getvalue())
+		self._export_table("dwr_db_sour", "S", Source, header, source_list, self._data_source)
+
+
+	def _data_source(self, source_handle):
+		"""
+		Build the Javascript data of a source, as described in L{_export_sources}
+		"""
+		sw = StringIO()
+		source = self.database.get_source_from_handle(source_handle)
+		sw.write("[\"" + self.obj_dict[Source][source_handle][OBJDICT_GID] + "\",")
+		title = source.get_title() or ""
+		sw.write("\"" + script_escape(html_escape(title)) + "\",\n")
+		sw.write("\"")
+		for (label, value) in [
+			(_("Author"), source.get_author()),
+			(_("Abbreviation"), source.get_abbreviation()),
+			(_("Publication information"), source.get_publication_info())]:
+			if value:
+				html = Html("p") + Html("b", label + ": ") + value
+				sw.write(script_escape(html_text(html)))
+		sw.write("\",\n")
+		# Get source notes
+		sw.write("\"" + script_escape(self.get_notes_text(source)) + "\",\n")
+		# Get source media
+		sw.write(self._data_media_reference_index(source))
+		sw.write(",\n")
+		# Get source citations
+		sw.write(self._data_bkref_index(Source, source_handle, Citation))
+		sw.write(",\n")
+		# Get repositories references
+		sw.write(self._data_repo_reference_index(source))
+		sw.write(",\n")
+		# Get source attributes
+		if (DWR_VERSION_410):
+			sw.write(self._data_attributes_src(source))
+		else:
+			sw.write("[]")
+		sw.write("\n]")
+		return(sw.getvalue())
 
 
 	def _export_citations(self):
@@ -1154,8 +2078,8 @@ class DynamicWebReport(Report):
 		Export citations data in Javascript file
 		The citations data is stored in the Javascript Array "C"
 		"""
-		sw = StringIO()
-		sw.write(
+		writer = self.open_data_file("dwr_db_cita.js")
+		writer.write(
 			"// This file is generated\n\n"
 			"// 'C' gives for each source citation:\n"
 			"//   - Gramps ID\n"
@@ -1176,14 +2100,13 @@ class DynamicWebReport(Report):
 			"//     (including the media references referencing this citation)\n"
 			"//   - A list of the repository index (in table 'R') referencing this citation\n"
 			"C = [")
-		sep = "\n"
 		citation_list = list(self.obj_dict[Citation])
 		if (not self.inc_sources): citation_list = []
 		citation_list.sort(key = lambda x: self.obj_dict[Citation][x][OBJDICT_INDEX])
 		for citation_handle in citation_list:
 			citation = self.database.get_citation_from_handle(citation_handle)
 			source_handle = citation.get_reference_handle()
-			sw.write(sep)
+			sw = StringIO()
 			sw.write("[\"" + self.obj_dict[Citation][citation_handle][OBJDICT_GID] + "\",")
 			sw.write(str(self.obj_dict[Source][source_handle][OBJDICT_INDEX])+ ",\n")
 			sw.write("\"")
@@ -1193,7 +2116,7 @@ class DynamicWebReport(Report):
 			else:
 				confidence = None
 			for (label, value) in [
-				(_("Date"), format_date(citation.get_date_object())),
+				(_("Date"), self.format_date(citation.get_date_object())),
 				(_("Page"), citation.get_page()),
 				(_("Confidence"), confidence),
 			]:
@@ -1217,9 +2140,9 @@ class DynamicWebReport(Report):
 			sw.write(",\n")
 			sw.write(self._data_bkref_index(Citation, citation_handle, Repository))
 			sw.write("\n]")
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_cita.js", sw.getvalue())
+			writer.record(sw.getvalue())
+		writer.write("\n];\n")
+		self.close_data_file(writer)
 
 
 	def _export_repositories(self):
@@ -1227,8 +2150,8 @@ class DynamicWebReport(Report):
 		Export repositories data in Javascript file
 		The repositories data is stored in the Javascript Array "R"
 		"""
-		sw = StringIO()
-		sw.write(
+		writer = self.open_data_file("dwr_db_repo.js")
+		writer.write(
 			"// This file is generated\n\n"
 			"// 'R' is sorted by repository name\n"
 			"// 'R' gives for each repository:\n"
@@ -1251,13 +2174,12 @@ class DynamicWebReport(Report):
 			"//       - call number\n"
 			"//       - notes of the repository reference\n"
 			"R = [")
-		sep = "\n"
 		repo_list = list(self.obj_dict[Repository])
 		if (not self.inc_repositories): repo_list = []
 		repo_list.sort(key = lambda x: self.obj_dict[Repository][x][OBJDICT_INDEX])
 		for repo_handle in repo_list:
 			repo = self.database.get_repository_from_handle(repo_handle)
-			sw.write(sep)
+			sw = StringIO()
 			sw.write("[\"" + self.obj_dict[Repository][repo_handle][OBJDICT_GID] + "\",")
 			name = repo.get_name() or ""
 			sw.write("\"" + script_escape(name) + "\",\n")
@@ -1273,9 +2195,9 @@ class DynamicWebReport(Report):
 			# Get source references
 			sw.write(self._data_repo_backref_index(repo, Source))
 			sw.write("\n]")
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_repo.js", sw.getvalue())
+			writer.record(sw.getvalue())
+		writer.write("\n];\n")
+		self.close_data_file(writer)
 
 
 	def _export_media(self):
@@ -1283,8 +2205,7 @@ class DynamicWebReport(Report):
 		Export media data in Javascript file
 		The media data is stored in the Javascript Array "M"
 		"""
-		sw = StringIO()
-		sw.write(
+		header = (
 			"// This file is generated\n\n"
 			"// 'M' is sorted by media title\n"
 			"// 'M' gives for each media object:\n"
@@ -1324,49 +2245,52 @@ class DynamicWebReport(Report):
 			"//       - [x1, y1, x2, y2] of the media reference\n"
 			"//       - notes of the media reference\n"
 			"//       - list of the media reference source citations index (in table 'C')\n"
-			"M = [")
-		sep = "\n"
+			"\n")
 		media_list = list(self.obj_dict[MediaObject])
 		if (not self.inc_gallery): media_list = []
 		media_list.sort(key = lambda x: self.obj_dict[MediaObject][x][OBJDICT_INDEX])
-		for media_handle in media_list:
-			media = self.database.get_object_from_handle(media_handle)
-			sw.write(sep)
-			sw.write("[\"" + self.obj_dict[MediaObject][media_handle][OBJDICT_GID] + "\",")
-			title = media.get_description() or ""
-			sw.write("\"" + script_escape(html_escape(title)) + "\",\n")
-			sw.write("\"" + script_escape(media.get_path()) + "\",\n")
-			path = self.get_media_web_path(media)
-			sw.write("\"" + script_escape(path) + "\",\n")
-			sw.write("\"" + script_escape(media.get_mime_type()) + "\",\n")
-			# Get media date
-			date = format_date(media.get_date_object()) or ""
-			sw.write("\"" + date + "\",\n")
-			date = format_date(media.get_date_object(), True) or ""
-			sw.write("\"" + date + "\",\n")
-			# Get media notes
-			sw.write("\"" + script_escape(self.get_notes_text(media)) + "\",\n")
-			# Get media sources
-			sw.write(self._data_source_citation_index(media))
-			sw.write(",\n")
-			# Get media attributes
-			sw.write(self._data_attributes(media))
-			sw.write(",\n")
-			# Get media thumbnail
-			sw.write("\"" + self.copy_thumbnail(media, (0,0,100,100)) + "\",\n")
-			# Get media references
-			sw.write(self._data_media_backref_index(media, Person))
-			sw.write(",\n")
-			sw.write(self._data_media_backref_index(media, Family))
-			sw.write(",\n")
-			sw.write(self._data_media_backref_index(media, Source))
-			sw.write(",\n")
-			sw.write(self._data_media_backref_index(media, Place))
-			sw.write("\n")
-			sw.write("]")
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_media.js", sw.getvalue())
+		self._export_table("dwr_db_media", "M", MediaObject, header, media_list, self._data_media)
+
+
+	def _data_media(self, media_handle):
+		"""
+		Build the Javascript data of a media, as described in L{_export_media}
+		"""
+		sw = StringIO()
+		media = self.database.get_object_from_handle(media_handle)
+		sw.write("[\"" + self.obj_dict[MediaObject][media_handle][OBJDICT_GID] + "\",")
+		title = media.get_description() or ""
+		sw.write("\"" + script_escape(html_escape(title)) + "\",\n")
+		sw.write("\"" + script_escape(media.get_path()) + "\",\n")
+		path = self.get_media_web_path(media)
+		sw.write("\"" + script_escape(path) + "\",\n")
+		sw.write("\"" + script_escape(media.get_mime_type()) + "\",\n")
+		# Get media date
+		date = self.format_date(media.get_date_object()) or ""
+		sw.write("\"" + date + "\",\n")
+		date = self.format_date(media.get_date_object(), True) or ""
+		sw.write("\"" + date + "\",\n")
+		# Get media notes
+		sw.write("\"" + script_escape(self.get_notes_text(media)) + "\",\n")
+		# Get media sources
+		sw.write(self._data_source_citation_index(media))
+		sw.write(",\n")
+		# Get media attributes
+		sw.write(self._data_attributes(media))
+		sw.write(",\n")
+		# Get media thumbnail
+		sw.write("\"" + self.copy_thumbnail(media, (0,0,100,100)) + "\",\n")
+		# Get media references
+		sw.write(self._data_media_backref_index(media, Person))
+		sw.write(",\n")
+		sw.write(self._data_media_backref_index(media, Family))
+		sw.write(",\n")
+		sw.write(self._data_media_backref_index(media, Source))
+		sw.write(",\n")
+		sw.write(self._data_media_backref_index(media, Place))
+		sw.write("\n")
+		sw.write("]")
+		return(sw.getvalue())
 
 
 	def _export_places(self):
@@ -1374,8 +2298,7 @@ class DynamicWebReport(Report):
 		Export places data in Javascript file
 		The places data is stored in the Javascript Array "P"
 		"""
-		sw = StringIO()
-		sw.write(
+		header = (
 			"// This file is generated\n\n"
 			"// 'P' is sorted by place name\n"
 			"// 'P' gives for each media object:\n"
@@ -1392,84 +2315,86 @@ class DynamicWebReport(Report):
 			"//   - A list of the person index (in table 'I') for events referencing this place\n"
 			"//     (including the persons directly referencing this place)\n"
 			"//   - A list of the family index (in table 'F') for events referencing this place\n"
-			"P=[")
-		sep = "\n"
+			"\n")
 		place_list = list(self.obj_dict[Place])
 		place_list.sort(key = lambda x: self.obj_dict[Place][x][OBJDICT_INDEX])
-		for place_handle in place_list:
-			place = self.database.get_place_from_handle(place_handle)
-			sw.write(sep)
-			sw.write("[\"" + self.obj_dict[Place][place_handle][OBJDICT_GID] + "\",")
-			place_name = report_utils.place_name(self.database, place_handle)
-			sw.write("\"" + script_escape(place_name) + "\"")
-			if (not self.inc_places):
-				sw.write("]")
-				sep = ",\n"
-				continue
-			sw.write(",\n")
-			locations = []
-			if (DWR_VERSION_410):
-				ml = get_main_location(self.database, place)
-				loc = Location()
-				loc.street = ml.get(PlaceType.STREET, '')
-				loc.locality = ml.get(PlaceType.LOCALITY, '')
-				loc.city = ml.get(PlaceType.CITY, '')
-				loc.parish = ml.get(PlaceType.PARISH, '')
-				loc.county = ml.get(PlaceType.COUNTY, '')
-				loc.state = ml.get(PlaceType.STATE, '')
-				loc.postal = place.get_code()
-				loc.country = ml.get(PlaceType.COUNTRY, '')
-				locations.append(loc)
-			else:
-				if (place.main_loc):
-					ml = place.get_main_location()
-					if (ml and not ml.is_empty()): locations.append(ml)
-			altloc = place.get_alternate_locations()
-			if (altloc):
-				altloc = [nonempt for nonempt in altloc if (not nonempt.is_empty())]
-				locations += altloc
-			loctabs = []
-			for loc in locations:
-				loctab = [
-					loc.street,
-					loc.locality,
-					loc.city,
-					loc.parish,
-					loc.county,
-					loc.state,
-					loc.postal,
-					loc.country,
-				]
-				loctab = [(data or "") for data in loctab]
-				loctab = ["\"" + script_escape(data) + "\"" for data in loctab]
-				loctabs.append("[" + ",".join(loctab) + "]")
-			sw.write("[" + ",".join(loctabs) + "],\n")
-			latitude = place.get_latitude()
-			longitude = place.get_longitude()
-			if (latitude and longitude):
-				coords = conv_lat_lon(latitude, longitude, "D.D8")
-			else:
-				coords = ("", "")
-			sw.write("[\"" + "\",\"".join(coords) + "\"]\n,")
-			# Get place notes
-			sw.write("\"" + script_escape(self.get_notes_text(place)) + "\",\n")
-			# Get place media
-			sw.write(self._data_media_reference_index(place))
-			sw.write(",\n")
-			# Get place sources
-			sw.write(self._data_source_citation_index(place))
-			sw.write(",\n")
-			# Get place URL
-			sw.write(self._data_url_list(place))
-			sw.write(",\n")
-			# Get back references
-			sw.write(self._data_bkref_index(Place, place_handle, Person))
-			sw.write(",\n")
-			sw.write(self._data_bkref_index(Place, place_handle, Family))
-			sw.write("\n]")
-			sep = ",\n"
-		sw.write("\n];\n")
-		self.update_file("dwr_db_place.js", sw.getvalue())
+		self._export_table("dwr_db_place", "P", Place, header, place_list, self._data_place)
+
+
+	def _data_place(self, place_handle):
+		"""
+		Build the Javascript data of a place, as described in L{_export_places}
+		"""
+		sw = StringIO()
+		place = self.database.get_place_from_handle(place_handle)
+		sw.write("[\"" + self.obj_dict[Place][place_handle][OBJDICT_GID] + "\",")
+		place_name = report_utils.place_name(self.database, place_handle)
+		sw.write("\"" + script_escape(place_name) + "\"")
+		if (not self.inc_places):
+			sw.write("]")
+			return(sw.getvalue())
+		sw.write(",\n")
+		locations = []
+		if (DWR_VERSION_410):
+			ml = get_main_location(self.database, place)
+			loc = Location()
+			loc.street = ml.get(PlaceType.STREET, '')
+			loc.locality = ml.get(PlaceType.LOCALITY, '')
+			loc.city = ml.get(PlaceType.CITY, '')
+			loc.parish = ml.get(PlaceType.PARISH, '')
+			loc.county = ml.get(PlaceType.COUNTY, '')
+			loc.state = ml.get(PlaceType.STATE, '')
+			loc.postal = place.get_code()
+			loc.country = ml.get(PlaceType.COUNTRY, '')
+			locations.append(loc)
+		else:
+			if (place.main_loc):
+				ml = place.get_main_location()
+				if (ml and not ml.is_empty()): locations.append(ml)
+		altloc = place.get_alternate_locations()
+		if (altloc):
+			altloc = [nonempt for nonempt in altloc if (not nonempt.is_empty())]
+			locations += altloc
+		loctabs = []
+		for loc in locations:
+			loctab = [
+				loc.street,
+				loc.locality,
+				loc.city,
+				loc.parish,
+				loc.county,
+				loc.state,
+				loc.postal,
+				loc.country,
+			]
+			loctab = [(data or "") for data in loctab]
+			loctab = ["\"" + script_escape(data) + "\"" for data in loctab]
+			loctabs.append("[" + ",".join(loctab) + "]")
+		sw.write("[" + ",".join(loctabs) + "],\n")
+		latitude = place.get_latitude()
+		longitude = place.get_longitude()
+		if (latitude and longitude):
+			coords = conv_lat_lon(latitude, longitude, "D.D8")
+		else:
+			coords = ("", "")
+		sw.write("[\"" + "\",\"".join(coords) + "\"]\n,")
+		# Get place notes
+		sw.write("\"" + script_escape(self.get_notes_text(place)) + "\",\n")
+		# Get place media
+		sw.write(self._data_media_reference_index(place))
+		sw.write(",\n")
+		# Get place sources
+		sw.write(self._data_source_citation_index(place))
+		sw.write(",\n")
+		# Get place URL
+		sw.write(self._data_url_list(place))
+		sw.write(",\n")
+		# Get back references
+		sw.write(self._data_bkref_index(Place, place_handle, Person))
+		sw.write(",\n")
+		sw.write(self._data_bkref_index(Place, place_handle, Family))
+		sw.write("\n]")
+		return(sw.getvalue())
 
 
 	def get_notes_text(self, object):
@@ -1512,13 +2437,21 @@ class DynamicWebReport(Report):
 		if (not self.inc_notes): return(notesection)
 		for note_handle in notelist:
 			if (not notesection): notesection = Html("div")
-			this_note = self.database.get_note_from_handle(note_handle)
-			if this_note is not None:
-				if (self.print_notes_type):
-					notesection.extend(Html("i", str(this_note.type), class_="NoteType"))
-				notesection.extend(self.get_note_format(this_note))
+			text = self.render_cache.get("note", note_handle, self._note_text, note_handle)
+			if (text): notesection.extend(text)
 		return(notesection)
 
+	def _note_text(self, note_handle):
+		"""
+		Return the HTML text of a note (with its type if required), see L{dump_notes}
+		"""
+		this_note = self.database.get_note_from_handle(note_handle)
+		if this_note is None: return("")
+		text = ""
+		if (self.print_notes_type):
+			text = html_text(Html("i", str(this_note.type), class_="NoteType")) + "\n"
+		return(text + html_text(self.get_note_format(this_note)))
+
 	def get_note_format(self, note):
 		"""
 		will get the note from the database, and will return either the
@@ -1602,6 +2535,12 @@ class DynamicWebReport(Report):
 		"""
 		if (not self.inc_sources): return("[]")
 		if not citationlist: return("[]")
+		return(self.render_cache.get("citations", tuple(citationlist), self._citation_index_text, citationlist))
+
+	def _citation_index_text(self, citationlist):
+		"""
+		Build the sources citations indexes of a non-empty L{citationlist}, see L{_data_source_citation_index_from_list}
+		"""
 		sep = ""
 		txt = "["
 		for citation_handle in citationlist:
@@ -1733,27 +2672,24 @@ class DynamicWebReport(Report):
 
 	def copy_thumbnail(self, media, region = None):
 		"""
-		Given a handle (and optional region) make (if needed) an
-		up-to-date cache of a thumbnail, and call copy_file
-		to copy the cached thumbnail to the website.
+		Given a handle (and optional region) request (if needed) an
+		up-to-date cache of a thumbnail and its copy to the website.
+		They are performed in the media stage, see L{_create_thumbnail}.
 		Return the new path to the image.
 		"""
 		if (region and region[0] == 0 and region[1] == 0 and region[2] == 100 and region[3] == 100):
 			region = None
 		handle = media.get_handle()
 		tname = handle + (("-%d,%d-%d,%d.png" % region) if region else ".png")
-		if (media.get_mime_type()):
-			from_path = get_thumbnail_path(
-				media_path_full(self.database, media.get_path()),
-				media.get_mime_type(),
-				region)
-			if not os.path.isfile(from_path):
-				from_path = os.path.join(IMAGE_DIR, "document.png")
-		else:
-			from_path = os.path.join(IMAGE_DIR, "document.png")
 		if (tname not in self.thumbnail_created):
-			self.copy_file(from_path, tname, "thumb")
 			self.thumbnail_created.add(tname)
+			dest = os.path.join(self.target_path, "thumb", tname)
+			self.created_files.append(dest)
+			# The thumbnail is generated in the media stage, see L{_run_media_jobs}
+			media_path = None
+			if (media.get_mime_type()):
+				media_path = media_path_full(self.database, media.get_path())
+			self.media_jobs.append((self._create_thumbnail, (media_path, media.get_mime_type(), region, dest)))
 		web_path = "thumb/" + tname
 		return(web_path)
 
@@ -1859,8 +2795,8 @@ class DynamicWebReport(Report):
 		surns_keys = list(surnames.keys())
 		surns_keys.sort(key = SORT_KEY)
 		# Generate the file
-		sw1 = StringIO()
-		sw1.write(
+		writer = self.open_data_file("dwr_db_surns.js")
+		writer.write(
 			"// This file is generated\n\n"
 			"// 'SN' is sorted by surname\n"
 			"// 'SN' gives for each surname:\n"
@@ -1868,15 +2804,85 @@ class DynamicWebReport(Report):
 			"//  - the surname first letter\n"
 			"//  - the list of persion index (in table 'I') with this surname\n"
 			"\nSN = [")
-		sep = "\n"
 		for s in surns_keys:
 			# Sort persons
 			surnames[s].sort(key = lambda x: sortnames[x])
 			tab = ",".join([str(self.obj_dict[Person][x][OBJDICT_INDEX]) for x in surnames[s]])
-			sw1.write(sep + "[\"" + script_escape(s) + "\", \"" + first_letter(s).strip() + "\", [" + tab + "]]")
-			sep = ",\n"
-		sw1.write("\n];\n")
-		self.update_file("dwr_db_surns.js", sw1.getvalue())
+			writer.record("[\"" + script_escape(s) + "\", \"" + first_letter(s).strip() + "\", [" + tab + "]]")
+		writer.write("\n];\n")
+		self.close_data_file(writer)
+
+
+	def _export_search_index(self):
+		"""
+		Export the search index used by the search page, instead of scanning the whole tables.
+		The index gives, for each key, the objects (persons, media, sources and places) having a word starting with the key in:
+		their name or title, their Gramps ID, and for persons their other names and their birth and death years.
+		The index is split in shards "dwr_search_<prefix>.js", according to the first L{SEARCH_PREFIX_LENGTH} characters of the keys.
+		The file "dwr_search_index.js" lists the shards.
+		The search page loads the shards of the searched words, then the data shards of the objects found.
+		"""
+		if (not self.inc_search_index):
+			# Remove the search index of a previous report
+			self._remove_search_shards(set())
+			index_path = os.path.join(self.target_path, "dwr_search_index.js")
+			if (os.path.exists(index_path)): os.remove(index_path)
+			return
+		index = defaultdict(lambda: defaultdict(set)) #: Dictionary giving for each key: for each Javascript Array, the objects indexes
+		def add_words(var, obj_index, texts):
+			for word in normalize("NFKC", " ".join(texts)).lower().split():
+				index[word][var].add(obj_index)
+		for (person_handle, (name, gid, obj_index)) in self.obj_dict[Person].items():
+			person = self.database.get_person_from_handle(person_handle)
+			texts = [self.get_name(person) or "", gid, self.get_birth_year(person), self.get_death_year(person)]
+			for person_name in [person.get_primary_name()] + person.get_alternate_names():
+				texts.append(person_name.get_first_name())
+				texts.extend(surname.get_surname() for surname in person_name.get_surname_list())
+			add_words("I", obj_index, texts)
+		for (media_handle, (name, gid, obj_index)) in self.obj_dict[MediaObject].items():
+			media = self.database.get_object_from_handle(media_handle)
+			add_words("M", obj_index, [media.get_description() or "", gid, os.path.basename(media.get_path())])
+		for (source_handle, (name, gid, obj_index)) in self.obj_dict[Source].items():
+			add_words("S", obj_index, [name, gid])
+		for (place_handle, (name, gid, obj_index)) in self.obj_dict[Place].items():
+			add_words("P", obj_index, [name, gid])
+		# Split the index in shards
+		shards = defaultdict(dict)
+		for (word, objects) in index.items():
+			shards[self._search_shard_key(word)][word] = dict((var, sorted(indexes)) for (var, indexes) in objects.items())
+		for (key, shard) in shards.items():
+			self.update_file("dwr_search_%s.js" % key,
+				"// This file is generated\n\n"
+				"SearchIndexAdd(\"%s\", %s);\n" % (key, json.dumps(shard, sort_keys = True, separators = (",", ":"))))
+		# Remove the shards of a previous report that are not used any more
+		self._remove_search_shards(shards)
+		self.update_file("dwr_search_index.js",
+			"// This file is generated\n\n"
+			"// 'SEARCH_INDEX_SHARDS' lists the keys of the search index shards 'dwr_search_<key>.js'\n"
+			"SEARCH_INDEX_SHARDS = %s;\n"
+			"SEARCH_PREFIX_LENGTH = %i;\n"
+			"SEARCH_DATA_FILES = %s;\n"
+			"SEARCH_SHARD_SIZE = %i;\n"
+			"SEARCH_CHARSET = \"%s\";\n" % (
+				json.dumps(sorted(shards.keys())), SEARCH_PREFIX_LENGTH,
+				json.dumps(SEARCH_DATA_FILES, sort_keys = True), SHARD_SIZE, self.encoding))
+
+
+	def _remove_search_shards(self, keys):
+		"""
+		Remove the search index shards of a previous report whose keys are not in keys
+		"""
+		for f in os.listdir(self.target_path):
+			if (SEARCH_SHARD_RE.match(f) and f[len("dwr_search_"):-len(".js")] not in keys):
+				os.remove(os.path.join(self.target_path, f))
+
+
+	def _search_shard_key(self, word):
+		"""
+		Return the key of the search index shard of a word:
+		the hexadecimal UTF-16 code units of its first L{SEARCH_PREFIX_LENGTH} characters, as computed in Javascript
+		"""
+		return(binascii.hexlify(word.encode("utf-16-be")[:2 * SEARCH_PREFIX_LENGTH]).decode("ascii"))
 
 
 	def _data_families_index(self, person):
@@ -1988,12 +2994,19 @@ class DynamicWebReport(Report):
 	def get_marriage_place(self, family):
 		ev = get_marriage_or_fallback(self.database, family)
 		return(self._get_place_text(ev))
+	def format_date(self, date, gedcom = False, iso = False):
+		"""
+		Give the date as a string, see L{format_date}
+		"""
+		if (not date): return("")
+		return(self.render_cache.get("date", (date.serialize(), gedcom, iso), format_date, date, gedcom, iso))
+
 	def _get_place_text(self, event):
 		place_name = ""
 		if (event):
 			place_handle = event.get_place_handle()
 			if (place_handle and (place_handle in self.obj_dict[Place])):
-				place_name = report_utils.place_name(self.database, place_handle)
+				place_name = self.render_cache.get("place", place_handle, report_utils.place_name, self.database, place_handle)
 		return(place_name)
 
 	def get_death_age(self, person):
@@ -2004,7 +3017,7 @@ class DynamicWebReport(Report):
 		death_date = None
 		if (ev_death): death_date = ev_death.get_date_object()
 		if (birth_date):
-			alive = probably_alive(person, self.database, Today())
+			alive = self.living_status.is_alive(person.get_handle())
 			if (not alive and death_date):
 				nyears = death_date - birth_date
 				nyears.format(precision = 3)
@@ -2076,7 +3089,9 @@ class DynamicWebReport(Report):
 			self._export_html_page("person.html", self.page_name[PAGE_PERSON], "DwrMain(PAGE_INDI);", True, dbscripts)
 
 		# The search results page is required
-		self._export_html_page("search.html", _("Search results"), "DwrMain(PAGE_SEARCH);", True, dbscripts)
+		# With the search index, the search page only loads the data of the objects found
+		searchscripts = ["dwr_search_index.js"] if (self.inc_search_index) else dbscripts
+		self._export_html_page("search.html", _("Search results"), "DwrMain(PAGE_SEARCH);", True, searchscripts)
 
 		# Page for printing a family (if needed)
 		if (self.inc_families):
@@ -2298,6 +3313,7 @@ class DynamicWebReport(Report):
 			("Select the parents distribution (fan charts only)", _("Select the parents distribution (fan charts only)")),
 			("Select the shape of graph", _("Select the shape of graph")),
 			("Select the type of graph", _("Select the type of graph")),
+			("Searching...", _("Searching...")),
 			("Several matches.<br>Precise your search or choose in the lists below.", _("Several matches.<br>Precise your search or choose in the lists below.")),
 			("Show _MENU_ entries", _("Show _MENU_ entries")),
 			("Showing 0 to 0 of 0 entries", _("Showing 0 to 0 of 0 entries")),
@@ -2479,7 +3495,7 @@ class DynamicWebReport(Report):
 		# __EXPORT_DATE__ is replaced by the current date
 		# __GRAMPS_VERSION__ is replaced by the Gramps version
 		# __GRAMPS_HOMEPAGE__ is replaced by the Gramps homepage
-		text = text.replace("__EXPORT_DATE__", format_date(Today()))
+		text = text.replace("__EXPORT_DATE__", self.format_date(Today()))
 		text = text.replace("__GRAMPS_VERSION__", VERSION)
 		text = text.replace("__GRAMPS_HOMEPAGE__", "<a href='" + URL_HOMEPAGE + "' class='gramps_homepage'>Gramps</a>")
 		# Relative URL are managed
@@ -2513,31 +3529,68 @@ class DynamicWebReport(Report):
 		return(text)
 
 
-	def update_file(self, fout, txt, encoding = None):
+	def update_file(self, fout, txt, encoding = None, compare = True):
 		"""
 		Write a string in a file.
 		The file is not overwritten if the file exists and already contains the string 
 		@param fout: output file name
 		@param txt: file contents
 		@param encoding: encoding as passed to Python function codecs.open 
+		@param compare: whether to compare with the existing file. If False, the file is always written
 		"""
 		if (encoding is None): encoding = self.encoding
 		f = os.path.join(self.target_path, fout)
 		self.created_files.append(f)
-		if (os.path.exists(f)):
+		identical = False
+		if (compare and os.path.exists(f)):
 			try:
 				fr = codecs.open(f, "r", encoding = encoding, errors="xmlcharrefreplace")
 				txtr = fr.read()
 				fr.close()
-				if (txtr == txt):
-					log.info("File \"%s\" not overwritten (identical)" % fout)
-					return
+				identical = (txtr == txt)
 			except:
 				pass
-		fw = codecs.open(f, "w", encoding = encoding, errors="xmlcharrefreplace")
-		fw.write(txt)
-		fw.close()
-		log.info("File \"%s\" generated" % fout)
+		if (identical):
+			self.profiler.file_identical()
+			log.info("File \"%s\" not overwritten (identical)" % fout)
+		else:
+			fw = codecs.open(f, "w", encoding = encoding, errors="xmlcharrefreplace")
+			fw.write(txt)
+			fw.close()
+			if (self.profiler.enabled): self.profiler.file_written(os.path.getsize(f))
+			log.info("File \"%s\" generated" % fout)
+		self.archive_file(f)
+
+
+	def open_data_file(self, fout):
+		"""
+		Open a Javascript data file, written as a stream of records, see L{DataFileWriter}
+		The file is completed by L{close_data_file}
+		@param fout: output file name
+		"""
+		return(DataFileWriter(os.path.join(self.target_path, fout), self.encoding, self.options['data_gzip']))
+
+
+	def close_data_file(self, writer, identical = None):
+		"""
+		Complete a Javascript data file opened by L{open_data_file}.
+		As with L{update_file}, the file is not overwritten if the file exists and is identical
+		@param identical: whether the file is known to be identical to the existing file. If None, the files are compared
+		"""
+		fout = os.path.relpath(writer.path, self.target_path)
+		writer.close()
+		if (identical is None): identical = writer.identical()
+		writer.commit(identical)
+		files = [writer.path] + ([writer.path + ".gz"] if (writer.gz) else [])
+		self.created_files.extend(files)
+		if (identical):
+			self.profiler.file_identical()
+			log.info("File \"%s\" not overwritten (identical)" % fout)
+		else:
+			self.profiler.file_written(writer.size)
+			log.info("File \"%s\" generated" % fout)
+		for f in files:
+			self.archive_file(f)
 
 	def copy_file(self, from_fname, to_fname, to_dir=""):
 		"""
@@ -2550,7 +3603,8 @@ class DynamicWebReport(Report):
 		'to_dir' is the relative path name in the destination root. It will
 		be prepended before 'to_fname'.
 		
-		The file is not copied if the contents of 'from_fname' 'to_fname' are identical
+		The file is not copied if 'to_fname' is up to date, see L{_copy_media_file}.
+		The copy is performed in the media stage, see L{_run_media_jobs}.
 		"""
 		# log.debug("copying '%s' to '%s/%s'" % (from_fname, to_dir, to_fname))
 		dest = os.path.join(self.target_path, to_dir, to_fname)
@@ -2559,27 +3613,8 @@ class DynamicWebReport(Report):
 			os.makedirs(destdir)
 
 		if from_fname != dest:
-			try:
-				dest_temp = dest + ".temp"
-				shutil.copyfile(from_fname, dest_temp)
-				self.created_files.append(dest)
-				if (os.path.exists(dest)):
-					fr = codecs.open(dest, "rb")
-					old_bytes = fr.read()
-					fr.close()
-					fr = codecs.open(dest_temp, "rb")
-					new_bytes = fr.read()
-					fr.close()
-					if (old_bytes == new_bytes):
-						os.remove(dest_temp)
-						log.info("File \"%s\" not overwritten (identical)" % dest)
-						return
-					os.remove(dest)
-				os.rename(dest_temp, dest)
-				log.info("File \"%s\" generated" % dest)
-			except:
-				log.warning(_("Copying error: %(error)s") % {"error": sys.exc_info()[1]})
-				log.error(_("Impossible to copy \"%(src)s\" to \"%(dst)s\"") % {"src": from_fname, "dst": to_fname})
+			self.created_files.append(dest)
+			self.media_jobs.append((self._copy_media_file, (from_fname, dest)))
 		elif self.warn_dir:
 			self.user.warn(
 				_("Possible destination error") + "\n" +
@@ -2593,6 +3628,98 @@ class DynamicWebReport(Report):
 
 
 
+	def _copy_media_file(self, from_fname, dest):
+		"""
+		Copy a file to the web site, unless the destination is up to date.
+		The destination is up to date if the source file has the same size and modification time as when it was copied,
+		or the same size and MD5 digest when only the modification time changed (see L{MEDIA_CACHE_FILE}).
+		This method is called by the media stage worker threads, see L{_run_media_jobs}
+		@return: number of bytes copied
+		"""
+		rel_path = os.path.relpath(dest, self.target_path)
+		try:
+			stat_src = os.stat(from_fname)
+			cached = self.media_cache.get(rel_path)
+			if (cached and cached[0] == stat_src.st_size and
+				os.path.isfile(dest) and os.path.getsize(dest) == stat_src.st_size):
+				if (cached[1] == stat_src.st_mtime):
+					self.media_cache_new[rel_path] = cached
+					log.info("File \"%s\" not overwritten (identical)" % dest)
+					return(0)
+				digest = file_digest(from_fname)
+				if (cached[2] == digest):
+					self.media_cache_new[rel_path] = [stat_src.st_size, stat_src.st_mtime, digest]
+					log.info("File \"%s\" not overwritten (identical)" % dest)
+					return(0)
+			dest_temp = dest + ".temp"
+			digest = copy_file_digest(from_fname, dest_temp)
+			if (os.path.exists(dest)):
+				os.remove(dest)
+			os.rename(dest_temp, dest)
+			self.media_cache_new[rel_path] = [stat_src.st_size, stat_src.st_mtime, digest]
+			log.info("File \"%s\" generated" % dest)
+			return(stat_src.st_size)
+		except:
+			log.warning(_("Copying error: %(error)s") % {"error": sys.exc_info()[1]})
+			log.error(_("Impossible to copy \"%(src)s\" to \"%(dst)s\"") % {"src": from_fname, "dst": rel_path})
+			return(0)
+
+
+	def _create_thumbnail(self, media_path, mime_type, region, dest):
+		"""
+		Create (if needed) the cached thumbnail of a media, and copy it to the web site.
+		This method is called by the media stage worker threads, see L{_run_media_jobs}
+		@param media_path: full path of the media, None if the media has no MIME type
+		@return: number of bytes copied
+		"""
+		from_path = os.path.join(IMAGE_DIR, "document.png")
+		if (media_path):
+			thumb_path = get_thumbnail_path(media_path, mime_type, region)
+			if (thumb_path and os.path.isfile(thumb_path)):
+				from_path = thumb_path
+		return(self._copy_media_file(from_path, dest))
+
+
+	def _run_media_jobs(self):
+		"""
+		Copy the media files and create the thumbnails requested by L{copy_file} and L{copy_thumbnail},
+		in a pool of worker threads.
+		The copy of the files not modified since the previous report is skipped, see L{_copy_media_file}
+		"""
+		cache_path = os.path.join(self.target_path, MEDIA_CACHE_FILE)
+		try:
+			with open(cache_path) as fr:
+				self.media_cache = json.load(fr)
+		except (IOError, OSError, ValueError):
+			self.media_cache = {}
+		self.media_cache_new = {}
+		jobs = self.media_jobs
+		self.media_jobs = []
+		nb_bytes = 0
+		nb_copied = 0
+		t = time.time()
+		with self.user.progress(_("Dynamic Web Site Report"), _("Copying media files..."), len(jobs)) as step:
+			pool = ThreadPool()
+			try:
+				for (dest, size) in pool.imap_unordered(run_media_job, jobs):
+					step()
+					self.archive_file(dest)
+					if (size):
+						nb_copied += 1
+						nb_bytes += size
+						self.profiler.file_written(size)
+					else:
+						self.profiler.file_identical()
+			finally:
+				pool.close()
+				pool.join()
+		t = time.time() - t
+		log.info("Media files: %i files, %i copied (%.1f MB) in %.2f s, %.1f files/s" %
+			(len(jobs), nb_copied, nb_bytes / 1e6, t, len(jobs) / max(t, 1e-6)))
+		with open(cache_path, "w") as fw:
+			json.dump(self.media_cache_new, fw)
+
+
 	def copy_template_files(self):
 		"""
 		Copy the template files to the target directory
@@ -2650,12 +3777,15 @@ class DynamicWebReport(Report):
 					shutil.copyfile(src, dst)
 					log.info(_("Copying \"%(src)s\" to \"%(dst)s\"") % {'src': src, 'dst': dst})
 				self.created_files.append(dst)
+				self.archive_file(dst)
 
 
-	def create_archive(self):
+	def open_archive(self):
 		"""
-		Create an archive of the whole web site
+		Open the archive of the web site, if the archive is requested in the options.
+		The files are added to the archive as soon as they are generated, see L{archive_file}
 		"""
+		self.archive = None
 		if (not self.options['archive']): return
 		
 		# Get archive path and type
@@ -2673,38 +3803,35 @@ class DynamicWebReport(Report):
 		# Get base path for the files inside the archive
 		basepath = os.path.splitext(os.path.basename(arch_path))[0]
 		
-		if (ext == ".zip"):
-			try:
-				fzip = zipfile.ZipFile(arch_path, "w", zipfile.ZIP_DEFLATED, True)
-			except:
-				log.error(_("Unable to overwrite archive file \"%(path)s\"") % {"path": arch_path})
-				raise
-			for file in self.created_files:
-				arc_rel_path = file.replace(self.target_path, basepath, 1)
-				if (sys.version_info[0] < 3):
-					file = file.encode("cp437")
-					arc_rel_path = arc_rel_path.encode("cp437")
-				try:
-					fzip.write(file, arc_rel_path)
-				except:
-					log.error(_("Unable to add file \"%(file)s\" to archive \"%(archive)s\"") % {"file": file, "archive": arch_path})
-					raise
-			fzip.close()
+		try:
+			self.archive = ArchiveWriter(arch_path, ext, self.target_path, basepath)
+		except:
+			log.error(_("Unable to overwrite archive file \"%(path)s\"") % {"path": arch_path})
+			raise
+
+
+	def archive_file(self, file):
+		"""
+		Add a generated file to the archive of the web site (if any)
+		"""
+		if (not self.archive): return
+		try:
+			self.archive.add(file)
+		except:
+			log.error(_("Unable to add file \"%(file)s\" to archive \"%(archive)s\"") % {"file": file, "archive": self.archive.path})
+			raise
 
-		if (ext == ".tgz"):
-			try:
-				tgz = tarfile.open(arch_path, "w:gz")
-			except:
-				log.error(_("Unable to overwrite archive file \"%(path)s\"") % {"path": arch_path})
-				raise
-			for file in self.created_files:
-				arc_rel_path = file.replace(self.target_path, basepath, 1)
-				try:
-					tgz.add(file, arc_rel_path)
-				except:
-					log.error(_("Unable to add file \"%(file)s\" to archive \"%(archive)s\"") % {"file": path, "archive": arch_path})
-					raise
-			tgz.close()
+
+	def create_archive(self):
+		"""
+		Complete the archive of the whole web site
+		The files that were not added when generated are added, then the archive is closed
+		"""
+		if (not self.archive): return
+		for file in self.created_files:
+			self.archive_file(file)
+		self.archive.close()
+		self.archive = None
 
 
 	def build_link(self, prop, handle, obj_class):
@@ -2902,7 +4029,7 @@ class DynamicWebReport(Report):
 			event = self.database.get_event_from_handle(event_ref.ref)
 			if (event):
 				date = event.get_date_object()
-				doe = format_date(date, gedcom = True)
+				doe = self.format_date(date, gedcom = True)
 				if (event.get_place_handle()):
 					place_handle = event.get_place_handle()
 					if (place_handle):
@@ -2941,8 +4068,13 @@ class DynamicWebReport(Report):
 		 - the reference object:
 			- None in most cases
 			- for media it is a MediaRef object
-		
-		This method recursively calls the methods "_add_***"
+
+		The object graph is walked with a worklist (see L{_walk_obj_graph}):
+		each object is read from the database once, and the methods "_add_***"
+		return the references to follow instead of calling each other recursively.
+
+		The number of references followed and the time spent for each class of
+		object are stored in L{self.obj_dict_timing}
 		"""
 		_obj_class_list = (Person, Family, Event, Place, Source, Citation,
 						   MediaObject, Repository, Note, Tag)
@@ -2950,7 +4082,13 @@ class DynamicWebReport(Report):
 		# setup a dictionary of the required structure
 		self.obj_dict = defaultdict(lambda: defaultdict(set))
 		self.bkref_dict = defaultdict(lambda: defaultdict(set))
-
+		#: Dictionary giving for each class: [number of references followed, time spent]
+		self.obj_dict_timing = defaultdict(lambda: [0, 0.0])
+		#: Person sort keys, computed when the persons are added
+		self.person_sort_keys = {}
+		#: Objects change times and references, see L{_record_object}
+		self.obj_change = {}
+		self.obj_refs = {}
 
 		# initialise the dictionary to empty in case no objects of any
 		# particular class are included in the web report
@@ -2973,7 +4111,11 @@ class DynamicWebReport(Report):
 				if (not isinstance(handle, UNITYPE)):
 					handle = handle.decode("UTF-8")
 				step()
-				self._add_person(handle, "", "")
+				self._walk_obj_graph([(Person, handle, "", "", None)])
+
+		for (obj_class, (nb_refs, duration)) in self.obj_dict_timing.items():
+			log.info("Objects dictionary: %s: %i objects, %i references, %.3f s" %
+				(obj_class.__name__, len(self.obj_dict[obj_class]), nb_refs, duration))
 
 		log.debug("final object dictionary \n" +
 				  "".join(("%s: %s\n" % item) for item in self.obj_dict.items()))
@@ -2982,9 +4124,41 @@ class DynamicWebReport(Report):
 				  "".join(("%s: %s\n" % item) for item in self.bkref_dict.items()))
 
 
-	def _add_person(self, person_handle, bkref_class, bkref_handle):
+	def _walk_obj_graph(self, worklist):
 		"""
-		Add person_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add the objects of the L{worklist} to the L{self.obj_dict}, and all the objects they reference
+
+		@param worklist: list of references (class, handle, referencing object class, referencing object handle, reference object)
+		The list is used as a stack: the references returned by the "_add_***" methods are pushed in reverse order,
+		so that the objects are added in the same order as a depth-first recursive walk.
+		"""
+		add_methods = {
+			Person: self._add_person,
+			Family: self._add_family,
+			Event: self._add_event,
+			Place: self._add_place,
+			Source: self._add_source,
+			Citation: self._add_citation,
+			MediaObject: self._add_media,
+			Repository: self._add_repository,
+		}
+		timing = self.obj_dict_timing
+		while worklist:
+			(obj_class, handle, bkref_class, bkref_handle, ref) = worklist.pop()
+			t = time.time()
+			refs = add_methods[obj_class](handle, bkref_class, bkref_handle, ref)
+			counters = timing[obj_class]
+			counters[0] += 1
+			counters[1] += time.time() - t
+			if (refs):
+				refs.reverse()
+				worklist.extend(refs)
+
+
+	def _add_person(self, person_handle, bkref_class, bkref_handle, ref = None):
+		"""
+		Add person_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the person, see L{_walk_obj_graph}
 		"""
 		# Update the dictionaries of objects back references
 		self.bkref_dict[Person][person_handle].add((bkref_class, bkref_handle, None))
@@ -2993,46 +4167,42 @@ class DynamicWebReport(Report):
 		# Add person in the dictionaries of objects
 		person = self.database.get_person_from_handle(person_handle)
 		if (not person): return
+		self._record_object(person_handle, person)
 		person_name = self.get_person_name(person)
 		self.obj_dict[Person][person_handle] = [person_name, person.gramps_id, len(self.obj_dict[Person])]
+		self.person_sort_keys[person_handle] = SORT_KEY(_nd.sort_string(person.get_primary_name()))
+		refs = []
 		# Person events
-		evt_ref_list = person.get_event_ref_list()
-		if evt_ref_list:
-			for evt_ref in evt_ref_list:
-				self._add_event(evt_ref.ref, Person, person_handle, evt_ref)
+		for evt_ref in person.get_event_ref_list():
+			refs.append((Event, evt_ref.ref, Person, person_handle, evt_ref))
 		# Person citations
-		for citation_handle in person.get_citation_list():
-			self._add_citation(citation_handle, Person, person_handle)
+		citation_list = list(person.get_citation_list())
 		# Person name citations
 		for name in [person.get_primary_name()] + \
 						person.get_alternate_names():
-			for citation_handle in name.get_citation_list():
-				self._add_citation(citation_handle, Person, person_handle)
+			citation_list.extend(name.get_citation_list())
 		# LDS Ordinance citations
 		for lds_ord in person.get_lds_ord_list():
-			for citation_handle in lds_ord.get_citation_list():
-				self._add_citation(citation_handle, Person, person_handle)
+			citation_list.extend(lds_ord.get_citation_list())
 		# Attribute citations
 		for attr in person.get_attribute_list():
-			for citation_handle in attr.get_citation_list():
-				self._add_citation(citation_handle, Person, person_handle)
+			citation_list.extend(attr.get_citation_list())
+		refs.extend((Citation, citation_handle, Person, person_handle, None) for citation_handle in citation_list)
 		# Person families
-		family_handle_list = person.get_family_handle_list()
-		if family_handle_list:
-			for family_handle in person.get_family_handle_list():
-				self._add_family(family_handle, Person, person_handle)
+		for family_handle in person.get_family_handle_list():
+			refs.append((Family, family_handle, Person, person_handle, None))
 		# Person media
 		for media_ref in person.get_media_list():
-			media_handle = media_ref.get_reference_handle()
-			self._add_media(media_handle, Person, person_handle, media_ref)
+			refs.append((MediaObject, media_ref.get_reference_handle(), Person, person_handle, media_ref))
 		# Association citations
+		citation_list = []
 		for assoc in person.get_person_ref_list():
-			for citation_handle in assoc.get_citation_list():
-				self._add_citation(citation_handle, Person, person_handle)
+			citation_list.extend(assoc.get_citation_list())
 		# Addresses citations
 		for addr in person.get_address_list():
-			for citation_handle in addr.get_citation_list():
-				self._add_citation(citation_handle, Person, person_handle)
+			citation_list.extend(addr.get_citation_list())
+		refs.extend((Citation, citation_handle, Person, person_handle, None) for citation_handle in citation_list)
+		return(refs)
 
 
 	def get_person_name(self, person):
@@ -3047,9 +4217,10 @@ class DynamicWebReport(Report):
 		return _nd.display_name(name)
 
 
-	def _add_family(self, family_handle, bkref_class, bkref_handle):
+	def _add_family(self, family_handle, bkref_class, bkref_handle, ref = None):
 		"""
-		Add family_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add family_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the family, see L{_walk_obj_graph}
 		"""
 		# Update the dictionaries of objects back references
 		self.bkref_dict[Family][family_handle].add((bkref_class, bkref_handle, None))
@@ -3057,32 +4228,30 @@ class DynamicWebReport(Report):
 		if (family_handle in self.obj_dict[Family]): return
 		# Add family in the dictionaries of objects
 		family = self.database.get_family_from_handle(family_handle)
+		self._record_object(family_handle, family)
 		family_name = self.get_family_name(family)
 		self.obj_dict[Family][family_handle] = [family_name, family.gramps_id, len(self.obj_dict[Family])]
+		refs = []
 		# Family events
-		evt_ref_list = family.get_event_ref_list()
-		if evt_ref_list:
-			for evt_ref in evt_ref_list:
-				self._add_event(evt_ref.ref, Family, family_handle, evt_ref)
+		for evt_ref in family.get_event_ref_list():
+			refs.append((Event, evt_ref.ref, Family, family_handle, evt_ref))
+		citation_list = []
 		# Family child references
 		for child_ref in family.get_child_ref_list():
-			for citation_handle in child_ref.get_citation_list():
-				self._add_citation(citation_handle, Family, family_handle)
+			citation_list.extend(child_ref.get_citation_list())
 		# LDS Ordinance citations
 		for lds_ord in family.get_lds_ord_list():
-			for citation_handle in lds_ord.get_citation_list():
-				self._add_citation(citation_handle, Family, family_handle)
+			citation_list.extend(lds_ord.get_citation_list())
 		# Attributes citations
 		for attr in family.get_attribute_list():
-			for citation_handle in attr.get_citation_list():
-				self._add_citation(citation_handle, Family, family_handle)
+			citation_list.extend(attr.get_citation_list())
 		# Family citations
-		for citation_handle in family.get_citation_list():
-			self._add_citation(citation_handle, Family, family_handle)
+		citation_list.extend(family.get_citation_list())
+		refs.extend((Citation, citation_handle, Family, family_handle, None) for citation_handle in citation_list)
 		# Family media
 		for media_ref in family.get_media_list():
-			media_handle = media_ref.get_reference_handle()
-			self._add_media(media_handle, Family, family_handle, media_ref)
+			refs.append((MediaObject, media_ref.get_reference_handle(), Family, family_handle, media_ref))
+		return(refs)
 
 
 	def get_family_name(self, family):
@@ -3118,25 +4287,24 @@ class DynamicWebReport(Report):
 
 	def _add_event(self, event_handle, bkref_class, bkref_handle, event_ref):
 		"""
-		Add event_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add event_handle to the L{self.obj_dict}
+		The objects referenced by the event are recorded as referenced by the object referencing the event
+		@return: list of the references to the objects referenced by the event reference and the event, see L{_walk_obj_graph}
 		"""
-		# Check if event reference already added
-		refs = []
-		if (event_handle in self.bkref_dict[Event]):
-			refs = [bkref[BKREF_REFOBJ] for bkref in self.bkref_dict[Event][event_handle]]
-			# The event reference is already recorded
-			if (event_ref in refs): return
 		# Update the dictionaries of objects back references
+		# Each referencing object is read once, so each event reference is only recorded once
 		self.bkref_dict[Event][event_handle].add((bkref_class, bkref_handle, event_ref))
+		refs = []
 		# Event reference attributes citations
 		for attr in event_ref.get_attribute_list():
 			for citation_handle in attr.get_citation_list():
-				self._add_citation(citation_handle, bkref_class, bkref_handle)
+				refs.append((Citation, citation_handle, bkref_class, bkref_handle, None))
 		# Check if the event is already added
-		if (event_handle in self.obj_dict[Event]): return
+		if (event_handle in self.obj_dict[Event]): return(refs)
 		# Add event in the dictionaries of objects
 		event = self.database.get_event_from_handle(event_handle)
-		if (not event): return
+		if (not event): return(refs)
+		self._record_object(event_handle, event)
 		event_name = str(event.get_type())
 		event_desc = event.get_description()
 		# The event description can be Y on import from GEDCOM. See the
@@ -3151,23 +4319,23 @@ class DynamicWebReport(Report):
 		# Event place
 		place_handle = event.get_place_handle()
 		if (place_handle):
-			self._add_place(place_handle, bkref_class, bkref_handle)
+			refs.append((Place, place_handle, bkref_class, bkref_handle, None))
 		# Event citations
-		for citation_handle in event.get_citation_list():
-			self._add_citation(citation_handle, bkref_class, bkref_handle)
+		citation_list = list(event.get_citation_list())
 		# Event attributes citations
 		for attr in event.get_attribute_list():
-			for citation_handle in attr.get_citation_list():
-				self._add_citation(citation_handle, bkref_class, bkref_handle)
+			citation_list.extend(attr.get_citation_list())
+		refs.extend((Citation, citation_handle, bkref_class, bkref_handle, None) for citation_handle in citation_list)
 		# Event media
 		for media_ref in event.get_media_list():
-			media_handle = media_ref.get_reference_handle()
-			self._add_media(media_handle, bkref_class, bkref_handle, media_ref)
+			refs.append((MediaObject, media_ref.get_reference_handle(), bkref_class, bkref_handle, media_ref))
+		return(refs)
 
 
-	def _add_place(self, place_handle, bkref_class, bkref_handle):
+	def _add_place(self, place_handle, bkref_class, bkref_handle, ref = None):
 		"""
-		Add place_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add place_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the place, see L{_walk_obj_graph}
 		"""
 		# Update the dictionaries of objects back references
 		self.bkref_dict[Place][place_handle].add((bkref_class, bkref_handle, None))
@@ -3175,25 +4343,26 @@ class DynamicWebReport(Report):
 		if (place_handle in self.obj_dict[Place]): return
 		# Add place in the dictionaries of objects
 		place = self.database.get_place_from_handle(place_handle)
+		self._record_object(place_handle, place)
 		if (DWR_VERSION_412):
 			place_name = _pd.display(self.database, place)
 		else:
 			place_name = place.get_title()
 		self.obj_dict[Place][place_handle] = [place_name, place.gramps_id, len(self.obj_dict[Place])]
 
-		if (self.inc_places):
-			# Place citations
-			for citation_handle in place.get_citation_list():
-				self._add_citation(citation_handle, Place, place_handle)
-			# Place media
-			for media_ref in place.get_media_list():
-				media_handle = media_ref.get_reference_handle()
-				self._add_media(media_handle, Place, place_handle, media_ref)
+		if (not self.inc_places): return
+		# Place citations
+		refs = [(Citation, citation_handle, Place, place_handle, None) for citation_handle in place.get_citation_list()]
+		# Place media
+		for media_ref in place.get_media_list():
+			refs.append((MediaObject, media_ref.get_reference_handle(), Place, place_handle, media_ref))
+		return(refs)
 
 
-	def _add_source(self, source_handle, bkref_class, bkref_handle):
+	def _add_source(self, source_handle, bkref_class, bkref_handle, ref = None):
 		"""
-		Add source_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add source_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the source, see L{_walk_obj_graph}
 		"""
 		if (not self.inc_sources): return
 		# Update the dictionaries of objects back references
@@ -3202,22 +4371,24 @@ class DynamicWebReport(Report):
 		if (source_handle in self.obj_dict[Source]): return
 		# Add source in the dictionaries of objects
 		source = self.database.get_source_from_handle(source_handle)
+		self._record_object(source_handle, source)
 		source_name = source.get_title()
 		self.obj_dict[Source][source_handle] = [source_name, source.gramps_id, len(self.obj_dict[Source])]
+		refs = []
 		# Source repository
 		if self.inc_repositories:
 			for repo_ref in source.get_reporef_list():
-				repo_handle = repo_ref.get_reference_handle()
-				self._add_repository(repo_handle, Source, source_handle, repo_ref)
+				refs.append((Repository, repo_ref.get_reference_handle(), Source, source_handle, repo_ref))
 		# Source media
 		for media_ref in source.get_media_list():
-			media_handle = media_ref.get_reference_handle()
-			self._add_media(media_handle, Source, source_handle, media_ref)
+			refs.append((MediaObject, media_ref.get_reference_handle(), Source, source_handle, media_ref))
+		return(refs)
 
 
-	def _add_citation(self, citation_handle, bkref_class, bkref_handle):
+	def _add_citation(self, citation_handle, bkref_class, bkref_handle, ref = None):
 		"""
-		Add citation_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add citation_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the citation, see L{_walk_obj_graph}
 		"""
 		if (not self.inc_sources): return
 		# Update the dictionaries of objects back references
@@ -3226,73 +4397,69 @@ class DynamicWebReport(Report):
 		if (citation_handle in self.obj_dict[Citation]): return
 		# Add citation in the dictionaries of objects
 		citation = self.database.get_citation_from_handle(citation_handle)
+		self._record_object(citation_handle, citation)
 		citation_name = citation.get_page() or ""
 		source_handle = citation.get_reference_handle()
 		self.obj_dict[Citation][citation_handle] = [citation_name, citation.gramps_id, len(self.obj_dict[Citation])]
 		# Citation source
-		self._add_source(source_handle, Citation, citation_handle)
+		refs = [(Source, source_handle, Citation, citation_handle, None)]
 		# Citation media
 		for media_ref in citation.get_media_list():
-			media_handle = media_ref.get_reference_handle()
-			self._add_media(media_handle, Source, source_handle, media_ref)
+			refs.append((MediaObject, media_ref.get_reference_handle(), Source, source_handle, media_ref))
+		return(refs)
 
 
 	def _add_media(self, media_handle, bkref_class, bkref_handle, media_ref):
 		"""
-		Add media_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add media_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the media reference and the media, see L{_walk_obj_graph}
 		"""
 		if (not self.inc_gallery): return
-		# Check if media reference already added
-		refs = []
-		if (media_handle in self.bkref_dict[MediaObject]):
-			refs = [bkref[BKREF_REFOBJ] for bkref in self.bkref_dict[MediaObject][media_handle]]
-			# The media reference is already recorded
-			if (media_ref in refs): return
 		# Update the dictionaries of objects back references
+		# Each referencing object is read once, so each media reference is only recorded once
 		self.bkref_dict[MediaObject][media_handle].add((bkref_class, bkref_handle, media_ref))
 		# Citations for media reference, media reference attributes
-		citation_list = media_ref.get_citation_list()
+		citation_list = list(media_ref.get_citation_list())
 		for attr in media_ref.get_attribute_list():
 			citation_list.extend(attr.get_citation_list())
-		for citation_handle in citation_list:
-			self._add_citation(citation_handle, MediaObject, media_handle)
+		refs = [(Citation, citation_handle, MediaObject, media_handle, None) for citation_handle in citation_list]
 		# Check if the media is already added
-		if (media_handle in self.obj_dict[MediaObject]): return
+		if (media_handle in self.obj_dict[MediaObject]): return(refs)
 		# Add media in the dictionaries of objects
 		media = self.database.get_object_from_handle(media_handle)
+		self._record_object(media_handle, media)
 		media_name = "Media"
 		self.obj_dict[MediaObject][media_handle] = [media_name, media.gramps_id, len(self.obj_dict[MediaObject])]
 		# Citations for media, media attributes
-		citation_list = media.get_citation_list()
+		citation_list = list(media.get_citation_list())
 		for attr in media.get_attribute_list():
 			citation_list.extend(attr.get_citation_list())
-		for citation_handle in citation_list:
-			self._add_citation(citation_handle, MediaObject, media_handle)
+		refs.extend((Citation, citation_handle, MediaObject, media_handle, None) for citation_handle in citation_list)
+		return(refs)
 
 
 	def _add_repository(self, repo_handle, bkref_class, bkref_handle, repo_ref):
 		"""
-		Add repo_handle to the L{self.obj_dict}, and recursively all referenced objects
+		Add repo_handle to the L{self.obj_dict}
+		@return: list of the references to the objects referenced by the repository, see L{_walk_obj_graph}
 		"""
 		if (not self.inc_repositories): return
-		# Check if repository reference already added
-		refs = []
-		if (repo_handle in self.bkref_dict[Repository]):
-			refs = [bkref[BKREF_REFOBJ] for bkref in self.bkref_dict[Repository][repo_handle]]
-			# The repository reference is already recorded
-			if (repo_ref in refs): return
 		# Update the dictionaries of objects back references
+		# Each referencing object is read once, so each repository reference is only recorded once
 		self.bkref_dict[Repository][repo_handle].add((bkref_class, bkref_handle, repo_ref))
 		# Check if the repository is already added
 		if (repo_handle in self.obj_dict[Repository]): return
 		# Add repository in the dictionaries of objects
 		repo = self.database.get_repository_from_handle(repo_handle)
+		self._record_object(repo_handle, repo)
 		repo_name = repo.name
 		self.obj_dict[Repository][repo_handle] = [repo_name, repo.gramps_id, len(self.obj_dict[Repository])]
 		# Addresses citations
+		refs = []
 		for addr in repo.get_address_list():
 			for citation_handle in addr.get_citation_list():
-				self._add_citation(citation_handle, Repository, repo_handle)
+				refs.append((Citation, citation_handle, Repository, repo_handle, None))
+		return(refs)
 
 				
 	##############################################################################################
@@ -3344,6 +4511,7 @@ class DynamicWebReport(Report):
 		"""
 		Return a sort key for a person
 		"""
+		if (handle in self.person_sort_keys): return(self.person_sort_keys[handle])
 		person = self.database.get_person_from_handle(handle)
 		primary_name = person.get_primary_name()
 		sort_str = _nd.sort_string(primary_name)
@@ -3467,6 +4635,22 @@ class DynamicWebOptions(MenuReportOptions):
 
 		self.__archive_changed()
 
+		incremental = BooleanOption(_('Incremental update'), False)
+		incremental.set_help(_("Whether to only generate the data files of the objects modified since the previous report in the same directory"))
+		addopt("incremental", incremental)
+
+		parallel_export = BooleanOption(_('Parallel data generation'), False)
+		parallel_export.set_help(_("Whether to generate the data files of the different kinds of objects concurrently, in several processes"))
+		addopt("parallel_export", parallel_export)
+
+		profile = BooleanOption(_('Profiling report'), False)
+		profile.set_help(_("Whether to write a report of the time, database accesses, files and memory used by each stage of the generation, in the file \"%(file)s\" of the web site directory") % {"file": PROFILE_FILE})
+		addopt("profile", profile)
+
+		data_gzip = BooleanOption(_('Precompressed data files'), False)
+		data_gzip.set_help(_("Whether to write a gzip compressed copy \"<file>.js.gz\" of each data file, for the web servers serving precompressed files"))
+		addopt("data_gzip", data_gzip)
+
 		title = StringOption(_("Web site title"), _("My Family Tree"))
 		title.set_help(_("The title of the web site"))
 		addopt("title", title)
@@ -3677,6 +4861,10 @@ class DynamicWebOptions(MenuReportOptions):
 		inc_gendex.set_help(_('Whether to include a GENDEX file or not'))
 		addopt("inc_gendex", inc_gendex)
 
+		inc_search_index = BooleanOption(_('Include a search index'), False)
+		inc_search_index.set_help(_('Whether to generate a search index, so that the search page only loads the data of the objects found'))
+		addopt("inc_search_index", inc_search_index)
+
 
 	def __add_trees_options(self, menu):
 		category_name = _("Trees")
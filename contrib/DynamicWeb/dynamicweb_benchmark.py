@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU General Public License as published by the Free Software Foundation; either version 2 of the License, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License along with this program; if not, write to the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# $Id: $
+
+"""
+Dynamic Web Report benchmark script
+
+This script generates synthetic family trees of any size (see L{generate_tree}),
+imports them in Gramps databases, runs the dynamic web report on them with the profiling report,
+and compares the wall time, memory and output size of each stage with a stored baseline (see L{BASELINE_FILE}).
+The trees are deterministic: the same settings and seed always give the same tree.
+
+The script is to be launched from its directory, as dynamicweb_test.py
+
+Arguments = [-l] [-s] [-t tolerance] [-g] [scenario names]
+
+Usage examples:
+- List the scenarios
+	python dynamicweb_benchmark.py -l
+- Run the scenarios "small" and "medium", and compare with the baseline
+	python dynamicweb_benchmark.py small medium
+- Run the scenario "large", and store the results as the baseline
+	python dynamicweb_benchmark.py -s large
+- Only generate the tree of the scenario "huge" (Gramps XML file)
+	python dynamicweb_benchmark.py -g huge
+
+The script exits with status 1 if a metric regresses past the baseline.
+"""
+
+from __future__ import print_function
+import copy, os, os.path, subprocess, sys, traceback, time, json, gzip, random, struct, zlib, argparse
+from xml.sax.saxutils import escape, quoteattr
+
+plugin_path = os.path.abspath(".")
+results_path = os.path.join(plugin_path, "benchmark_results")
+
+#: Baseline of the benchmark metrics, giving for each scenario the metrics of L{run_scenario}
+BASELINE_FILE = os.path.join(plugin_path, "dynamicweb_benchmark_baseline.json")
+
+#: Profiling report written by the dynamic web report (see dynamicweb.PROFILE_FILE)
+PROFILE_FILE = "dwr_profile.json"
+
+#: Relative increase of each kind of metric tolerated before failing, see L{compare_metrics}
+TOLERANCES = {
+	"wall_time": 0.25,
+	"cpu_time": 0.25,
+	"peak_memory_kb": 0.10,
+	"bytes_written": 0.05,
+	"output_bytes": 0.05,
+}
+
+#: Times below this duration (in seconds) are too noisy to be compared
+MIN_TIME = 0.5
+
+#: Benchmark scenarios. The tree settings are the arguments of L{generate_tree}
+scenarios = {
+	"small": {
+		'people': 10000,
+		'generations': 8,
+		'collapse': 0.02,
+		'notes': 0.5,
+		'media': 0.05,
+		'citations': 1.0,
+	},
+	"medium": {
+		'people': 100000,
+		'generations': 10,
+		'collapse': 0.02,
+		'notes': 0.5,
+		'media': 0.02,
+		'citations': 1.0,
+	},
+	"large": {
+		'people': 300000,
+		'generations': 12,
+		'collapse': 0.05,
+		'notes': 0.5,
+		'media': 0.01,
+		'citations': 1.0,
+	},
+	"huge": {
+		'people': 1000000,
+		'generations': 15,
+		'collapse': 0.05,
+		'notes': 0.3,
+		'media': 0.005,
+		'citations': 0.5,
+	},
+	"collapse": {
+		'people': 50000,
+		'generations': 20,
+		'collapse': 0.5,
+		'notes': 0.2,
+		'media': 0.0,
+		'citations': 0.5,
+	},
+}
+
+#: Report options of the benchmark, added to the options of dynamicweb_test.py
+benchmark_options = {
+	'archive': False,
+	'incremental': False,
+	'parallel_export': False,
+	'profile': True,
+	'headernote': "",
+	'footernote': "",
+	'custom_note_0': "",
+	'filter': 0,
+}
+
+
+##############################################################
+# Synthetic tree
+
+FIRST_NAMES = {
+	"M": ["Adam", "Bernard", "Charles", "David", "Edouard", "François", "Georg", "Henrik", "Ivan", "Jan", "Karl", "Louis", "Marek", "Nils", "Olaf", "Pierre"],
+	"F": ["Anna", "Béatrice", "Clara", "Dorota", "Elsa", "Françoise", "Greta", "Hélène", "Ingrid", "Jeanne", "Katarzyna", "Louise", "Marie", "Nina", "Olga", "Paula"],
+}
+SURNAMES = ["Müller", "Martin", "Nowak", "Smith", "Jensen", "Rossi", "García", "Novák", "Horváth", "Peeters", "Johansson", "Dubois", "Kowalski", "Schmidt", "Bauer", "Łukasik"]
+PLACE_NAMES = ["Aach", "Bourg", "Castel", "Dorf", "Eck", "Furt", "Gard", "Haven", "Isle", "Jork", "Kirch", "Lund", "Mont", "Neuf", "Ost", "Port"]
+
+#: Fixed change time of the objects, so that the trees are identical for the same seed
+CHANGE_TIME = 1420070400
+
+#: Number of persons around a person, in creation order, among which a related spouse is chosen (see L{generate_tree})
+COUSIN_WINDOW = 12
+
+
+def count(rand, rate):
+	"""Return a random number of items, of average rate"""
+	n = int(rate)
+	if (rand.random() < rate - n): n += 1
+	return(n)
+
+
+def png_image(seed):
+	"""Return a small PNG image, of a color depending on the seed"""
+	(width, height) = (32, 24)
+	color = struct.pack("BBB", (seed * 67) % 256, (seed * 131) % 256, (seed * 199) % 256)
+	raw = b"".join(b"\0" + color * width for y in range(height))
+	def chunk(kind, data):
+		return(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+	return(b"\x89PNG\r\n\x1a\n" +
+		chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+		chunk(b"IDAT", zlib.compress(raw)) +
+		chunk(b"IEND", b""))
+
+
+def generate_tree(filename, people, generations, collapse, notes, media, citations, seed = 0):
+	"""
+	Write a synthetic family tree in a Gramps XML file (compressed).
+	The tree is built generation by generation, with about the same number of persons in each generation.
+	The families of a generation are formed by persons of the previous generation:
+	with probability L{collapse}, the spouse is a relative (a cousin born close to the person, creating pedigree collapse),
+	otherwise the spouse comes from outside the tree (without parents).
+	The children are then shared among the families.
+	The persons have a birth event, a death event for the older ones, and the families have a marriage event.
+	@param filename: Gramps XML file
+	@param people: number of persons
+	@param generations: number of generations
+	@param collapse: probability for a spouse to be a relative (pedigree collapse rate)
+	@param notes: average number of notes per person
+	@param media: average number of media objects per person. The media files are written in the directory "<filename>_media"
+	@param citations: average number of citations per person (and per event)
+	@param seed: random generator seed
+	@return: number of each kind of object
+	"""
+	rand = random.Random(seed)
+	persons = [] #: List of the persons: [gender, first name, surname, birth year, childof family index, parentin family indexes]
+	families = [] #: List of the families: [father index, mother index, marriage year, children indexes]
+	gen_sizes = [people // generations] * generations
+	gen_sizes[-1] += people - sum(gen_sizes)
+	start_year = 2000 - 30 * generations
+
+	def add_person(gen, surname = None, childof = None):
+		gender = rand.choice("MF")
+		persons.append([gender, rand.choice(FIRST_NAMES[gender]), surname or rand.choice(SURNAMES),
+			start_year + 30 * gen + rand.randint(-5, 5), childof, []])
+		return(len(persons) - 1)
+
+	previous = [add_person(0) for i in range(gen_sizes[0])]
+	for gen in range(1, generations):
+		# Form the couples among the previous generation
+		married = set()
+		couples = []
+		nb_outside = 0
+		nb_couples = max(1, gen_sizes[gen] // 3)
+		for i in sorted(rand.sample(range(len(previous)), min(nb_couples, len(previous)))):
+			p = previous[i]
+			if (p in married): continue
+			spouse = None
+			if (rand.random() < collapse):
+				for j in range(i + 1, min(i + COUSIN_WINDOW, len(previous))):
+					q = previous[j]
+					if (q not in married and persons[q][0] != persons[p][0] and
+						(persons[q][4] is None or persons[q][4] != persons[p][4])):
+						spouse = q
+						break
+			if (spouse is None):
+				spouse = add_person(gen - 1)
+				persons[spouse][0] = "F" if (persons[p][0] == "M") else "M"
+				persons[spouse][1] = rand.choice(FIRST_NAMES[persons[spouse][0]])
+				nb_outside += 1
+			married.update([p, spouse])
+			couples.append((p, spouse) if (persons[p][0] == "M") else (spouse, p))
+		# Share the children among the couples, the outside spouses are counted in the generation size
+		nb_children = max(1, gen_sizes[gen] - nb_outside)
+		shares = sorted(rand.randrange(len(couples)) for i in range(nb_children))
+		current = []
+		for (c, (father, mother)) in enumerate(couples):
+			year = max(persons[father][3], persons[mother][3]) + rand.randint(18, 30)
+			families.append([father, mother, year, []])
+			f = len(families) - 1
+			persons[father][5].append(f)
+			persons[mother][5].append(f)
+		for c in shares:
+			f = len(families) - len(couples) + c
+			child = add_person(gen, persons[families[f][0]][2], f)
+			families[f][3].append(child)
+			current.append(child)
+		previous = current
+
+	nb_places = max(10, len(persons) // 100)
+	nb_sources = max(5, len(persons) // 200)
+	objects = {"people": len(persons), "families": len(families), "places": nb_places, "sources": nb_sources, "events": 0, "notes": 0, "media": 0, "citations": 0}
+	media_dir = os.path.splitext(filename)[0] + "_media"
+	if (media and not os.path.isdir(media_dir)): os.makedirs(media_dir)
+
+	fw = gzip.GzipFile(filename, "wb", mtime = 0)
+	def write(text):
+		fw.write(text.encode("UTF-8"))
+	write(
+		'<?xml version="1.0" encoding="UTF-8"?>\n'
+		'<!DOCTYPE database PUBLIC "-//Gramps//DTD Gramps XML 1.7.1//EN"\n'
+		'"http://gramps-project.org/xml/1.7.1/grampsxml.dtd">\n'
+		'<database xmlns="http://gramps-project.org/xml/1.7.1/">\n'
+		'  <header>\n'
+		'    <created date="2015-01-01" version="4.2.0"/>\n'
+		'    <researcher>\n'
+		'      <resname>DynamicWeb benchmark (seed %i)</resname>\n'
+		'    </researcher>\n'
+		'  </header>\n' % seed)
+
+	def citation_refs(n):
+		refs = ""
+		for i in range(count(rand, n)):
+			refs += '      <citationref hlink="_C%08i"/>\n' % objects["citations"]
+			citation_list.append(rand.randrange(nb_sources))
+			objects["citations"] += 1
+		return(refs)
+	citation_list = [] #: Source index of each citation
+
+	# Events
+	write('  <events>\n')
+	person_events = [[] for p in persons]
+	family_events = []
+	for (p, person) in enumerate(persons):
+		lines = [("Birth", person[3])]
+		if (person[3] < 1930): lines.append(("Death", person[3] + rand.randint(1, 95)))
+		for (event_type, year) in lines:
+			e = objects["events"]
+			write(
+				'    <event handle="_E%08i" change="%i" id="E%06i">\n'
+				'      <type>%s</type>\n'
+				'      <dateval val="%04i-%02i-%02i"/>\n'
+				'      <place hlink="_P%08i"/>\n'
+				'%s'
+				'    </event>\n' % (e, CHANGE_TIME, e, event_type, year, rand.randint(1, 12), rand.randint(1, 28),
+				rand.randrange(nb_places), citation_refs(citations / 2.0)))
+			person_events[p].append(e)
+			objects["events"] += 1
+	for (f, family) in enumerate(families):
+		e = objects["events"]
+		write(
+			'    <event handle="_E%08i" change="%i" id="E%06i">\n'
+			'      <type>Marriage</type>\n'
+			'      <dateval val="%04i"/>\n'
+			'      <place hlink="_P%08i"/>\n'
+			'    </event>\n' % (e, CHANGE_TIME, e, family[2], rand.randrange(nb_places)))
+		family_events.append(e)
+		objects["events"] += 1
+	write('  </events>\n')
+
+	# Persons
+	write('  <people>\n')
+	person_notes = []
+	for (p, (gender, first_name, surname, year, childof, parentin)) in enumerate(persons):
+		refs = ""
+		for e in person_events[p]:
+			refs += '      <eventref hlink="_E%08i" role="Primary"/>\n' % e
+		for i in range(count(rand, media)):
+			refs += '      <objref hlink="_O%08i"/>\n' % objects["media"]
+			with open(os.path.join(media_dir, "m%08i.png" % objects["media"]), "wb") as fm:
+				fm.write(png_image(objects["media"]))
+			objects["media"] += 1
+		if (childof is not None): refs += '      <childof hlink="_F%08i"/>\n' % childof
+		for f in parentin:
+			refs += '      <parentin hlink="_F%08i"/>\n' % f
+		for i in range(count(rand, notes)):
+			refs += '      <noteref hlink="_N%08i"/>\n' % len(person_notes)
+			person_notes.append(p)
+		refs += citation_refs(citations / 2.0)
+		write(
+			'    <person handle="_I%08i" change="%i" id="I%06i">\n'
+			'      <gender>%s</gender>\n'
+			'      <name type="Birth Name">\n'
+			'        <first>%s</first>\n'
+			'        <surname>%s</surname>\n'
+			'      </name>\n'
+			'%s'
+			'    </person>\n' % (p, CHANGE_TIME, p, gender, escape(first_name), escape(surname), refs))
+	write('  </people>\n')
+
+	# Families
+	write('  <families>\n')
+	for (f, (father, mother, year, children)) in enumerate(families):
+		write(
+			'    <family handle="_F%08i" change="%i" id="F%06i">\n'
+			'      <rel type="Married"/>\n'
+			'      <father hlink="_I%08i"/>\n'
+			'      <mother hlink="_I%08i"/>\n'
+			'      <eventref hlink="_E%08i" role="Family"/>\n'
+			'%s'
+			'    </family>\n' % (f, CHANGE_TIME, f, father, mother, family_events[f],
+			"".join('      <childref hlink="_I%08i"/>\n' % c for c in children)))
+	write('  </families>\n')
+
+	# Citations, sources, places, media, notes
+	write('  <citations>\n')
+	for (c, s) in enumerate(citation_list):
+		write(
+			'    <citation handle="_C%08i" change="%i" id="C%06i">\n'
+			'      <page>p. %i</page>\n'
+			'      <confidence>2</confidence>\n'
+			'      <sourceref hlink="_S%08i"/>\n'
+			'    </citation>\n' % (c, CHANGE_TIME, c, rand.randint(1, 500), s))
+	write('  </citations>\n')
+	write('  <sources>\n')
+	for s in range(nb_sources):
+		write(
+			'    <source handle="_S%08i" change="%i" id="S%06i">\n'
+			'      <stitle>Register %i of %s</stitle>\n'
+			'    </source>\n' % (s, CHANGE_TIME, s, s, escape(rand.choice(PLACE_NAMES))))
+	write('  </sources>\n')
+	write('  <places>\n')
+	for pl in range(nb_places):
+		name = "%s-%s %i" % (rand.choice(PLACE_NAMES), rand.choice(PLACE_NAMES).lower(), pl)
+		write(
+			'    <placeobj handle="_P%08i" change="%i" id="P%06i" type="City">\n'
+			'      <ptitle>%s</ptitle>\n'
+			'      <pname value=%s/>\n'
+			'      <coord long="%.5f" lat="%.5f"/>\n'
+			'    </placeobj>\n' % (pl, CHANGE_TIME, pl, escape(name), quoteattr(name),
+			rand.uniform(-10.0, 30.0), rand.uniform(35.0, 65.0)))
+	write('  </places>\n')
+	write('  <objects>\n')
+	for m in range(objects["media"]):
+		write(
+			'    <object handle="_O%08i" change="%i" id="O%06i">\n'
+			'      <file src=%s mime="image/png" description="Picture %i"/>\n'
+			'    </object>\n' % (m, CHANGE_TIME, m, quoteattr(os.path.join(media_dir, "m%08i.png" % m)), m))
+	write('  </objects>\n')
+	write('  <notes>\n')
+	for (n, p) in enumerate(person_notes):
+		person = persons[p]
+		write(
+			'    <note handle="_N%08i" change="%i" id="N%06i" type="Person Note">\n'
+			'      <text>%s</text>\n'
+			'    </note>\n' % (n, CHANGE_TIME, n, escape(
+			"%s %s was born in %i. " % (person[1], person[2], person[3]) * rand.randint(1, 8))))
+	write('  </notes>\n')
+	write('</database>\n')
+	fw.close()
+	objects["notes"] = len(person_notes)
+	return(objects)
+
+
+##############################################################
+# Benchmark
+
+def scenario_name(name, settings, seed):
+	"""Return the name of the database of a scenario, depending on all its settings"""
+	return("dwr_bench_%s_%s_%i" % (name, "_".join(str(settings[key]) for key in sorted(settings)), seed))
+
+
+def import_tree(name, settings, seed):
+	"""
+	Generate the tree of a scenario and import it in a Gramps database, unless already done
+	@return: database name
+	"""
+	dbname = scenario_name(name, settings, seed)
+	filename = os.path.join(results_path, dbname + ".gramps")
+	marker = os.path.join(results_path, dbname + ".imported")
+	if (os.path.exists(marker)): return(dbname)
+	print("=" * 80)
+	print("Generating tree \"%s\"" % filename)
+	print("=" * 80)
+	t = time.time()
+	objects = generate_tree(filename, seed = seed, **settings)
+	print("Generated in %.1f s: %s" % (time.time() - t, ", ".join("%i %s" % (objects[key], key) for key in sorted(objects))))
+	print("=" * 80)
+	print("Importing tree \"%s\" in database \"%s\"" % (filename, dbname))
+	print("=" * 80)
+	os.chdir(gramps_path)
+	if (subprocess.call([sys.executable, os.path.join(gramps_path, "Gramps.py"), "-y", "-C", dbname, "-i", filename]) != 0):
+		raise Exception("Import of \"%s\" failed" % filename)
+	with open(marker, "w") as fw:
+		json.dump(objects, fw)
+	return(dbname)
+
+
+def directory_size(path):
+	size = 0
+	for (dirpath, dirnames, filenames) in os.walk(path):
+		size += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+	return(size)
+
+
+def run_scenario(name, settings, seed):
+	"""
+	Run the report on the tree of a scenario
+	@return: metrics of the run, in the form:
+		{"total": {metric: value}, "stages": {stage name: {metric: value}}}
+	The stages metrics are read in the profiling report of the report (see L{PROFILE_FILE}),
+	the metrics of the stages run several times are summed (peak memory: maximum).
+	The total peak memory is the one of the report process, read in the profiling report too:
+	the peak memory of the child processes would include the tree import and the previous scenarios.
+	"""
+	from dynamicweb_test import default_options
+	dbname = import_tree(name, settings, seed)
+	target = os.path.join(results_path, dbname)
+	o = copy.deepcopy(default_options)
+	o.update(benchmark_options)
+	o.update({
+		'title': dbname,
+		'target': target,
+	})
+	param = ",".join([
+		(key + "=" + (str(value) if isinstance(value, (int, bool)) else value))
+		for (key, value) in o.items()
+	])
+	print("=" * 80)
+	print("Running report on database \"%s\"" % dbname)
+	print("=" * 80)
+	os.chdir(gramps_path)
+	t = time.time()
+	if (subprocess.call([sys.executable, os.path.join(gramps_path, "Gramps.py"), "-q", "-O", dbname, "-a", "report", "-p", param]) != 0):
+		raise Exception("Report on \"%s\" failed" % dbname)
+	wall_time = time.time() - t
+	with open(os.path.join(target, PROFILE_FILE)) as fr:
+		profile = json.load(fr)
+	stages = {}
+	for stage in profile["stages"]:
+		metrics = stages.setdefault(stage["stage"], {"wall_time": 0.0, "cpu_time": 0.0, "bytes_written": 0, "peak_memory_kb": 0})
+		for key in ("wall_time", "cpu_time", "bytes_written"):
+			metrics[key] += stage[key]
+		metrics["peak_memory_kb"] = max(metrics["peak_memory_kb"], stage["peak_memory_kb"] or 0)
+	return({
+		"total": {
+			"wall_time": round(wall_time, 3),
+			"peak_memory_kb": profile["peak_memory_kb"],
+			"output_bytes": directory_size(target),
+		},
+		"stages": stages,
+	})
+
+
+def compare_metrics(name, metrics, baseline, tolerance_factor = 1.0):
+	"""
+	Compare the metrics of a scenario with its baseline
+	@param tolerance_factor: factor applied to the L{TOLERANCES}
+	@return: list of the regressions messages
+	"""
+	regressions = []
+	items = [("total", metrics["total"], baseline["total"])]
+	for (stage, values) in sorted(metrics["stages"].items()):
+		if (stage in baseline["stages"]): items.append((stage, values, baseline["stages"][stage]))
+	for (label, values, base_values) in items:
+		for (key, value) in sorted(values.items()):
+			base = base_values.get(key)
+			if (value is None or not base or key not in TOLERANCES): continue
+			if (key.endswith("_time") and max(value, base) < MIN_TIME): continue
+			limit = base * (1.0 + TOLERANCES[key] * tolerance_factor)
+			status = "ok"
+			if (value > limit):
+				status = "REGRESSION"
+				regressions.append("%s: %s %s = %s, baseline %s (+%.0f%%)" % (name, label, key, value, base, 100.0 * (value - base) / base))
+			print("%-10s %-30s %-16s %14s %14s  %s" % (name, label, key, value, base, status))
+	return(regressions)
+
+
+def main(names, save_baseline, tolerance_factor, generate_only, seed):
+	if (not os.path.isdir(results_path)): os.mkdir(results_path)
+	if (generate_only):
+		for name in names:
+			filename = os.path.join(results_path, scenario_name(name, scenarios[name], seed) + ".gramps")
+			objects = generate_tree(filename, seed = seed, **scenarios[name])
+			print("%s: %s" % (filename, ", ".join("%i %s" % (objects[key], key) for key in sorted(objects))))
+		return(0)
+	baselines = {}
+	if (os.path.exists(BASELINE_FILE)):
+		with open(BASELINE_FILE) as fr:
+			baselines = json.load(fr)
+	regressions = []
+	for name in names:
+		metrics = run_scenario(name, scenarios[name], seed)
+		key = scenario_name(name, scenarios[name], seed)
+		if (save_baseline):
+			baselines[key] = metrics
+		elif (key in baselines):
+			regressions.extend(compare_metrics(name, metrics, baselines[key], tolerance_factor))
+		else:
+			print("No baseline for scenario \"%s\"" % name)
+	if (save_baseline):
+		with open(BASELINE_FILE, "w") as fw:
+			json.dump(baselines, fw, indent = 1, sort_keys = True)
+		print("Baseline saved in \"%s\"" % BASELINE_FILE)
+	for message in regressions:
+		print(message)
+	return(1 if (regressions) else 0)
+
+
+##############################################################
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "Dynamic Web Report benchmark")
+	parser.add_argument("names", nargs = "*", help = "scenarios to run")
+	parser.add_argument("-l", "--list", action = "store_true", help = "list the scenarios")
+	parser.add_argument("-s", "--save-baseline", action = "store_true", help = "store the results as the baseline")
+	parser.add_argument("-t", "--tolerance", type = float, default = 1.0, help = "factor applied to the tolerated regressions")
+	parser.add_argument("-g", "--generate", action = "store_true", help = "only generate the trees")
+	parser.add_argument("--seed", type = int, default = 0)
+	args = parser.parse_args()
+	if (args.list):
+		for (name, settings) in sorted(scenarios.items()):
+			print("%-10s %s" % (name, ", ".join("%s=%s" % (key, settings[key]) for key in sorted(settings))))
+		sys.exit(0)
+	names = args.names or ["small"]
+	for name in names:
+		if (name not in scenarios): parser.error("unknown scenario \"%s\"" % name)
+	if (not args.generate):
+		gramps_path = os.environ["GRAMPS_RESOURCES"]
+		if (not os.path.exists(gramps_path)): raise Exception("Gramps path GRAMPS_RESOURCES not found")
+		sys.path.append(gramps_path)
+	try:
+		sys.exit(main(names, args.save_baseline, args.tolerance, args.generate, args.seed))
+	except Exception as ex:
+		sys.stderr.write(str(ex))
+		sys.stderr.write("\n")
+		traceback.print_exc()
+		sys.exit(1)
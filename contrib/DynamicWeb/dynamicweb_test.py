@@ -19,11 +19,13 @@ And with various options.
 
 The script is to be launched from its directory
 
-Arguments = [-i] [test numbers]
+Arguments = [-i] [-u] [test numbers]
 
 Usage examples:
 - Import example database
 	python dynamicweb_test.py -i
+- Run the incremental update test (modifies the example database)
+	python dynamicweb_test.py -u
 - Run tests 0 and 2
 	python dynamicweb_test.py 0 2
 - Run all tests
@@ -31,7 +33,7 @@ Usage examples:
 """
 
 from __future__ import print_function
-import copy, re, os, os.path, subprocess, sys, traceback, locale, shutil, time, glob
+import copy, re, os, os.path, subprocess, sys, traceback, locale, shutil, time, glob, json
 
 # os.environ["LANGUAGE"] = "en_US"
 # os.environ["LANG"] = "en_US.UTF-8"
@@ -50,6 +52,9 @@ if sys.version_info[0] < 3:
     sys.setdefaultencoding('utf8')
 from dynamicweb import *
 from dynamicweb import _
+from gramps.gen.db import DbTxn
+from gramps.gen.dbstate import DbState
+from gramps.cli.clidbman import CLIDbManager
 
 
 default_options = {
@@ -343,11 +348,7 @@ def main(test_nums):
 		os.environ.update(test_set['environ'])
 		
 		# Call GRAMPS CLI
-		if (sys.version_info[0] < 3):
-			param = param.encode("UTF-8")
-		os.chdir(gramps_path)
-		# subprocess.call([sys.executable, os.path.join(gramps_path, "Gramps.py"), "-d", ".DynamicWeb", "-q", "-O", "dynamicweb_example", "-a", "report", "-p", param])
-		subprocess.call([sys.executable, os.path.join(gramps_path, "Gramps.py"), "-q", "-O", "dynamicweb_example", "-a", "report", "-p", param])
+		run_report(param)
 		
 		# Update index pages
 		if (test_set['link']):
@@ -380,6 +381,117 @@ def main(test_nums):
 	
 	
 
+def run_report(param):
+	if (sys.version_info[0] < 3):
+		param = param.encode("UTF-8")
+	os.chdir(gramps_path)
+	# subprocess.call([sys.executable, os.path.join(gramps_path, "Gramps.py"), "-d", ".DynamicWeb", "-q", "-O", "dynamicweb_example", "-a", "report", "-p", param])
+	subprocess.call([sys.executable, os.path.join(gramps_path, "Gramps.py"), "-q", "-O", "dynamicweb_example", "-a", "report", "-p", param])
+
+
+##############################################################
+# Incremental update test
+
+def incremental_test():
+	"""
+	Check that the incremental update regenerates the place and source data files
+	when only an object referencing the place or source is modified
+	(an event of a person moved to the place, a citation of the source).
+	"""
+	results_path = os.path.join(plugin_path, "test_results")
+	results_path = os.path.abspath(results_path)
+	if (not os.path.isdir(results_path)): os.mkdir(results_path)
+	target = os.path.join(results_path, "test_incremental")
+	if (os.path.exists(target)): shutil.rmtree(target)
+	o = copy.deepcopy(default_options)
+	o.update({
+		'title': "Incremental update test",
+		'target': target,
+		'archive': False,
+		'incremental': True,
+	})
+	param = ",".join([
+		(key + "=" + (str(value) if isinstance(value, (int, bool)) else value))
+		for (key, value) in o.items()
+	])
+	os.environ.update({
+		'LANGUAGE': "en_US",
+		'LANG': "en_US.UTF-8",
+	})
+	print("=" * 80)
+	print("Incremental update test")
+	print("=" * 80)
+	run_report(param)
+	before = manifest_fingerprints(target)
+	(place_handle, source_handle) = modify_referrers()
+	run_report(param)
+	after = manifest_fingerprints(target)
+	ok = True
+	for (what, handle) in (("place", place_handle), ("source", source_handle)):
+		if (before.get(handle) is None or before.get(handle) == after.get(handle)):
+			print("FAILED: the data of the %s %s were not regenerated" % (what, handle))
+			ok = False
+		else:
+			print("OK: the data of the %s %s were regenerated" % (what, handle))
+	if (not ok): raise Exception("Incremental update test failed")
+
+
+def manifest_fingerprints(target):
+	"""
+	Return the fingerprints of the objects in the manifest of the report in the target directory
+	"""
+	with open(os.path.join(target, MANIFEST_FILE)) as fr:
+		manifest = json.load(fr)
+	return(dict(
+		(obj[0], obj[2])
+		for shard in manifest["shards"].values()
+		for obj in shard["objects"]
+	))
+
+
+def modify_referrers():
+	"""
+	Move an event of a person to another place, and modify a citation of a source, in the database "dynamicweb_example"
+	@return: the handles of the place and of the source
+	"""
+	db_path = dict(CLIDbManager(DbState()).family_tree_list())["dynamicweb_example"]
+	database = DbBsddb()
+	database.load(db_path, None)
+	try:
+		# Move an event of a person to a place where the person has no other event
+		events = [
+			(event, person_handle)
+			for event in database.iter_events()
+			if (event.get_place_handle())
+			for (class_name, person_handle) in database.find_backlink_handles(event.get_handle(), ["Person"])
+		]
+		(event, person_handle) = events[0]
+		person = database.get_person_from_handle(person_handle)
+		person_places = set(
+			database.get_event_from_handle(event_ref.ref).get_place_handle()
+			for event_ref in person.get_event_ref_list()
+		)
+		place_handle = [
+			other_event.get_place_handle()
+			for (other_event, other_handle) in events
+			if (other_event.get_place_handle() not in person_places)
+		][0]
+		with DbTxn("Incremental update test", database) as trans:
+			event.set_place_handle(place_handle)
+			database.commit_event(event, trans)
+		source_handle = None
+		for citation in database.iter_citations():
+			if (not citation.get_reference_handle()): continue
+			source_handle = citation.get_reference_handle()
+			with DbTxn("Incremental update test", database) as trans:
+				citation.set_page(citation.get_page() + " (modified)")
+				database.commit_citation(citation, trans)
+			break
+	finally:
+		database.close()
+	return(place_handle, source_handle)
+
+
 ##############################################################
 # Plugin version
 
@@ -427,6 +539,10 @@ if __name__ == '__main__':
 		if (len(sys.argv) == 2 and sys.argv[1] == "-i"):
 			import_data()
 			sys.exit(0);
+		# Incremental update test argument
+		if (len(sys.argv) == 2 and sys.argv[1] == "-u"):
+			incremental_test()
+			sys.exit(0);
 		# Tests numbers arguments
 		test_nums = range(len(test_list))
 		if (len(sys.argv) > 1):
@@ -2839,12 +2839,21 @@ function OsmMove(event)
 //================================================== Search by name
 //=================================================================
 
-function SearchFromString(ss, data, fextract)
+function SearchTerms(ss)
 {
+	// Split the searched text in normalized terms
 	ss = unorm.nfkc(ss).toLowerCase();
 	var terms = ss.match(/[^\s]+/ig);
+	if (terms == null) return([]);
+	return(terms);
+}
+
+
+function SearchFromString(ss, data, fextract)
+{
+	var terms = SearchTerms(ss);
 	var results = [];
-	if (terms == null) return(results);
+	if (terms.length == 0) return(results);
 	for (var x = 0; x < data.length; x++)
 	{
 		var found = true;
@@ -2861,11 +2870,12 @@ function SearchFromString(ss, data, fextract)
 }
 
 
-function SearchObjects()
+function SearchTypes()
 {
-	var types = [
+	return([
 		{
 			data: I,
+			table: 'I',
 			fextract: function(idx) {
 				return(I[idx][I_NAME] + ' ' + I[idx][I_BIRTH_YEAR] + ' ' + I[idx][I_DEATH_YEAR]);
 			},
@@ -2875,6 +2885,7 @@ function SearchObjects()
 		},
 		{
 			data: M,
+			table: 'M',
 			fextract: function(mdx) {return(M[mdx][M_TITLE] + ' ' + M[mdx][M_PATH]);},
 			text: _('Media found:'),
 			findex: htmlMediaIndex,
@@ -2882,6 +2893,7 @@ function SearchObjects()
 		},
 		{
 			data: S,
+			table: 'S',
 			fextract: function(sdx) {return(S[sdx][S_TITLE]);},
 			text: _('Sources found:'),
 			findex: htmlSourcesIndex,
@@ -2889,12 +2901,32 @@ function SearchObjects()
 		},
 		{
 			data: P,
+			table: 'P',
 			fextract: function(pdx) {return(P[pdx][P_NAME]);},
 			text: _('Places found:'),
 			findex: htmlPlacesIndex,
 			fref: placeHref
 		}
-	];
+	]);
+}
+
+
+function SearchObjects()
+{
+	if (typeof(SEARCH_INDEX_SHARDS) != 'undefined') return(SearchObjectsIndexed());
+	var types = SearchTypes();
+	var results = [];
+	for (var x = 0; x < types.length; x++)
+	{
+		results.push(SearchFromString(search.Txt, types[x].data, types[x].fextract));
+	}
+	return(SearchResultsHtml(types, results));
+}
+
+
+function SearchResultsHtml(types, results_list)
+{
+	// Build the search page from the objects found, given for each type of object
 	var x;
 	var nb_found = 0;
 	var fref;
@@ -2902,9 +2934,8 @@ function SearchObjects()
 	var html = '';
 	for (x = 0; x < types.length; x++)
 	{
-		var results;
 		var type = types[x];
-		results = SearchFromString(search.Txt, type.data, type.fextract);
+		var results = results_list[x];
 		nb_found += results.length;
 		if (results.length == 1 && x == 0)
 		{
@@ -2944,6 +2975,176 @@ function SearchObjects()
 }
 
 
+//=================================================================
+//==================================================== Search index
+//=================================================================
+
+// The search index (see 'dwr_search_index.js') is split in shards 'dwr_search_<key>.js'
+// Each shard gives, for the words starting with its key, the indexes of the objects in the tables I, M, S, P
+// The search page loads the shards of the searched terms, then only the data shards of the objects found
+
+var SearchIndex = {}; // Search index shards loaded, by key
+
+function SearchIndexAdd(key, words)
+{
+	// Called by the search index shards
+	SearchIndex[key] = words;
+}
+
+
+function SearchKey(term)
+{
+	// Key of the search index shard of a term:
+	// hexadecimal UTF-16 code units of its first SEARCH_PREFIX_LENGTH characters
+	var key = '';
+	for (var i = 0; i < Math.min(term.length, SEARCH_PREFIX_LENGTH); i++)
+	{
+		key += ('000' + term.charCodeAt(i).toString(16)).slice(-4);
+	}
+	return(key);
+}
+
+
+function SearchShardsKeys(term)
+{
+	// Keys of the search index shards of the words starting with a term
+	// Terms shorter than the keys prefix need several shards
+	var key = SearchKey(term);
+	var keys = [];
+	for (var i = 0; i < SEARCH_INDEX_SHARDS.length; i++)
+	{
+		if (SEARCH_INDEX_SHARDS[i].substr(0, key.length) == key) keys.push(SEARCH_INDEX_SHARDS[i]);
+	}
+	return(keys);
+}
+
+
+function SearchLoadScripts(jobs, callback)
+{
+	// Load the scripts 'jobs[i].src' one after the other, calling 'jobs[i].before' (if any) before loading each, then call 'callback'
+	if (jobs.length == 0) return(callback());
+	var job = jobs[0];
+	if (job.before) job.before();
+	var script = document.createElement('script');
+	script.src = job.src;
+	script.charset = SEARCH_CHARSET;
+	script.onload = script.onerror = function() {
+		SearchLoadScripts(jobs.slice(1), callback);
+	};
+	document.getElementsByTagName('head')[0].appendChild(script);
+}
+
+
+function SearchIndexMatch(terms)
+{
+	// Return, for each table (I, M, S, P), the sorted indexes of the objects having a word starting with each of the terms
+	var results = null;
+	var table;
+	for (var j = 0; j < terms.length; j++)
+	{
+		var term = terms[j];
+		var found = {};
+		var keys = SearchShardsKeys(term);
+		for (var k = 0; k < keys.length; k++)
+		{
+			var words = SearchIndex[keys[k]] || {};
+			for (var word in words)
+			{
+				if (word.substr(0, term.length) != term) continue;
+				for (table in words[word])
+				{
+					if (!found[table]) found[table] = {};
+					for (var x = 0; x < words[word][table].length; x++) found[table][words[word][table][x]] = true;
+				}
+			}
+		}
+		if (results == null)
+		{
+			results = found;
+			continue;
+		}
+		// Keep the objects found for all the terms
+		for (table in results)
+		{
+			for (var idx in results[table])
+			{
+				if (!found[table] || !found[table][idx]) delete results[table][idx];
+			}
+		}
+	}
+	var lists = {};
+	for (table in (results || {}))
+	{
+		lists[table] = [];
+		for (var idx in results[table]) lists[table].push(parseInt(idx));
+		lists[table].sort(function(a, b) {return(a - b);});
+	}
+	return(lists);
+}
+
+
+function SearchDataJobs(table, indexes)
+{
+	// Scripts to load for the objects of a table: the data shards containing the objects, in increasing order
+	// The data shard n adds the objects from n * SEARCH_SHARD_SIZE to the table, hence the table length is set before loading it
+	var jobs = [];
+	var last = -1;
+	for (var x = 0; x < indexes.length; x++)
+	{
+		var n = Math.floor(indexes[x] / SEARCH_SHARD_SIZE);
+		if (n == last) continue;
+		last = n;
+		jobs.push({
+			src: SEARCH_DATA_FILES[table] + '_' + n + '.js',
+			before: (function(n) {return(function() {window[table].length = n * SEARCH_SHARD_SIZE;});})(n)
+		});
+	}
+	return(jobs);
+}
+
+
+function SearchObjectsIndexed()
+{
+	// Search the objects with the search index
+	// The page is built when the search index shards and the data of the objects found are loaded
+	var types = SearchTypes();
+	var terms = SearchTerms(search.Txt);
+	if (terms.length == 0) return(SearchResultsHtml(types, [[], [], [], []]));
+	// Only the data of the objects found is loaded: the index columns showing other objects are not available
+	INDEX_SHOW_PARTNER = false;
+	INDEX_SHOW_PARENTS = false;
+	INDEX_SHOW_BKREF_TYPE = false;
+	var jobs = [];
+	var loaded = {};
+	for (var j = 0; j < terms.length; j++)
+	{
+		var keys = SearchShardsKeys(terms[j]);
+		for (var k = 0; k < keys.length; k++)
+		{
+			if (loaded[keys[k]]) continue;
+			loaded[keys[k]] = true;
+			jobs.push({src: 'dwr_search_' + keys[k] + '.js'});
+		}
+	}
+	SearchLoadScripts(jobs, function() {
+		var found = SearchIndexMatch(terms);
+		var data_jobs = [];
+		var results = [];
+		for (var x = 0; x < types.length; x++)
+		{
+			results.push(found[types[x].table] || []);
+			data_jobs = data_jobs.concat(SearchDataJobs(types[x].table, results[x]));
+		}
+		SearchLoadScripts(data_jobs, function() {
+			$('#body-page').html(SearchResultsHtml(types, results));
+			handleCitations();
+			handleTitles();
+		});
+	});
+	return('<p>' + _('Searching...') + '</p>');
+}
+
+
 //=================================================================
 //======================================================= Gramps ID
 //=================================================================
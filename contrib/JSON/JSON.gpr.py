@@ -2,7 +2,7 @@ register(EXPORT,
          id    = 'JSON Export',
          name  = _('JSON Export'),
          description =  _('This is a JSON export'),
-         version = '1.0.2',
+         version = '1.0.3',
          gramps_target_version = '4.2',
          status = STABLE, 
          fname = 'JSONExport.py',
@@ -16,7 +16,7 @@ register(IMPORT,
          id    = 'JSON Import',
          name  = _('JSON Import'),
          description =  _('This is a JSON import'),
-         version = '1.0.2',
+         version = '1.0.4',
          gramps_target_version = '4.2',
          status = STABLE, 
          fname = 'JSONImport.py',
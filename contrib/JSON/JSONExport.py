@@ -18,12 +18,32 @@
 #
 #
 
+"Export to JSON Lines"
+
 #------------------------------------------------------------------------
 #
 # Python modules
 #
 #------------------------------------------------------------------------
 import sys
+import io
+import json
+import gzip
+import time
+import multiprocessing
+from collections import deque
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#------------------------------------------------------------------------
+#
+# Set up logging
+#
+#------------------------------------------------------------------------
+import logging
+LOG = logging.getLogger(".ExportJSON")
 
 #------------------------------------------------------------------------
 #
@@ -36,119 +56,139 @@ from gramps.gen.lib import (Note, Person, Event, Family,
                             Repository, Place, MediaObject, 
                             Source, Tag, Citation)
 
+# (map, class) of the primary objects, in export order:
+OBJECTS = [
+    ("note_map", Note),
+    ("event_map", Event),
+    ("person_map", Person),
+    ("family_map", Family),
+    ("repository_map", Repository),
+    ("place_map", Place),
+    ("source_map", Source),
+    ("citation_map", Citation),
+    ("media_map", MediaObject),
+    ("tag_map", Tag),
+    ]
+
+# Number of objects sent at once to a worker process:
+CHUNK_SIZE = 500
+
+# Number of chunks being serialized at a time by the pool of processes:
+QUEUE_SIZE = 32
+
 def exportData(database, filename, 
-               error_dialog=None, option_box=None, callback=None):
+               error_dialog=None, option_box=None, callback=None,
+               processes=None):
+    """
+    Export the database as JSON Lines, one object per line. The objects
+    are serialized from the raw map data by a pool of processes (all of
+    the processors by default, none if processes is 1).
+    A filename ending with .gz or .zst is written compressed.
+    """
     if not callable(callback): 
         callback = lambda percent: None # dummy
 
-    with OpenFileOrStdout(filename) as fp:
-
-        total = (len(database.note_map) + 
-                 len(database.person_map) +
-                 len(database.event_map) + 
-                 len(database.family_map) +
-                 len(database.repository_map) +
-                 len(database.place_map) +
-                 len(database.media_map) +
-                 len(database.citation_map) +
-                 len(database.source_map) +
-                 len(database.tag_map))
-        count = 0.0
+    with open_output(filename) as fp:
 
-        # ---------------------------------
-        # Notes
-        # ---------------------------------
-        for handle in database.note_map.keys():
-            serial = database.note_map[handle]
-            write_line(fp, Note.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Event
-        # ---------------------------------
-        for handle in database.event_map.keys():
-            serial = database.event_map[handle]
-            write_line(fp, Event.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Person
-        # ---------------------------------
-        for handle in database.person_map.keys():
-            serial = database.person_map[handle]
-            write_line(fp, Person.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Family
-        # ---------------------------------
-        for handle in database.family_map.keys():
-            serial = database.family_map[handle]
-            write_line(fp, Family.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Repository
-        # ---------------------------------
-        for handle in database.repository_map.keys():
-            serial = database.repository_map[handle]
-            write_line(fp, Repository.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Place 
-        # ---------------------------------
-        for handle in database.place_map.keys():
-            serial = database.place_map[handle]
-            write_line(fp, Place.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Source
-        # ---------------------------------
-        for handle in database.source_map.keys():
-            serial = database.source_map[handle]
-            write_line(fp, Source.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Citation
-        # ---------------------------------
-        for handle in database.citation_map.keys():
-            serial = database.citation_map[handle]
-            write_line(fp, Citation.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Media
-        # ---------------------------------
-        for handle in database.media_map.keys():
-            serial = database.media_map[handle]
-            write_line(fp, MediaObject.create(serial))
-            count += 1
-            callback(100 * count/total)
-
-        # ---------------------------------
-        # Tag
-        # ---------------------------------
-        for handle in database.tag_map.keys():
-            serial = database.tag_map[handle]
-            write_line(fp, Tag.create(serial))
-            count += 1
-            callback(100 * count/total)
+        total = sum(len(getattr(database, map_name)) 
+                    for (map_name, cls) in OBJECTS)
+        count = 0.0
+        start = time.time()
+
+        pool = make_pool(processes)
+        try:
+            if pool:
+                results = serialize_chunks(pool, iter_chunks(database))
+            else:
+                results = (serialize_chunk(chunk) 
+                           for chunk in iter_chunks(database))
+            for (size, lines) in results:
+                fp.write(lines)
+                count += size
+                callback(100 * count/total)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        elapsed = time.time() - start
+        LOG.info("Exported %d objects in %.1f s (%.0f objects/s)", 
+                 count, elapsed, count / max(elapsed, 1e-6))
 
     return True
 
+def iter_chunks(database):
+    """
+    Yield lists of (class, raw data) of at most CHUNK_SIZE objects.
+    """
+    for (map_name, cls) in OBJECTS:
+        the_map = getattr(database, map_name)
+        chunk = []
+        for handle in the_map.keys():
+            chunk.append((cls, the_map[handle]))
+            if len(chunk) == CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def serialize_chunks(pool, chunks):
+    """
+    Yield the serialized chunks in order, serializing them in the pool of
+    processes. At most QUEUE_SIZE chunks are being serialized at a time,
+    so that the maps are not read far ahead of the lines written.
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(serialize_chunk, (chunk,)))
+        while len(pending) >= QUEUE_SIZE or (pending and
+                                             pending[0].ready()):
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def serialize_chunk(chunk):
+    """
+    Return the number of objects of a chunk, and their JSON lines.
+    """
+    return (len(chunk), 
+            "".join(to_json(cls.create(serial)) for (cls, serial) in chunk))
+
+def to_json(obj):
+    """
+    Return the JSON line of an object.
+    """
+    return json.dumps(obj.to_struct(), separators=(",", ":")) + "\n"
+
 def write_line(fp, obj):
     """
     Write a single object to the file.
     """
-    fp.write(str(obj.to_struct()) + "\n")
+    fp.write(to_json(obj))
+
+def make_pool(processes):
+    """
+    Return a pool of processes, or None to work in this process.
+    The workers are forked, so that they share the loaded addon.
+    """
+    if processes == 1:
+        return None
+    try:
+        context = multiprocessing.get_context("fork")
+    except (AttributeError, ValueError):
+        return None
+    return context.Pool(processes)
+
+def open_output(filename):
+    """
+    Open the output text file, compressed according to its extension.
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "wt")
+    elif filename.endswith(".zst"):
+        if zstandard is None:
+            raise EnvironmentError("the zstandard module is needed "
+                                   "to write %s" % filename)
+        compressor = zstandard.ZstdCompressor()
+        return io.TextIOWrapper(compressor.stream_writer(open(filename, "wb")))
+    return OpenFileOrStdout(filename)
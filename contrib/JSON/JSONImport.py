@@ -25,6 +25,19 @@
 # Standard Python Modules
 #
 #-------------------------------------------------------------------------
+import os
+import ast
+import gzip
+import io
+import json
+import time
+import itertools
+import multiprocessing
+from collections import deque
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 #------------------------------------------------------------------------
 #
@@ -46,41 +59,324 @@ from gramps.gen.plug.utils import OpenFileOrStdin
 from gramps.gen.config import config
 from gramps.gen.merge.diff import from_struct
 
-def importData(dbase, filename, user):
-    """Function called by Gramps to import data on persons in CSV format."""
+# Database method adding each class of object:
+ADD_METHODS = {
+    "Person": "add_person",
+    "Family": "add_family",
+    "Event": "add_event",
+    "MediaObject": "add_object",
+    "Repository": "add_repository",
+    "Tag": "add_tag",
+    "Source": "add_source",
+    "Citation": "add_citation",
+    "Note": "add_note",
+    "Place": "add_place",
+    }
+
+# Database method telling whether an object exists, for each class:
+HAS_METHODS = {
+    "Person": "has_person_handle",
+    "Family": "has_family_handle",
+    "Event": "has_event_handle",
+    "MediaObject": "has_object_handle",
+    "Repository": "has_repository_handle",
+    "Tag": "has_tag_handle",
+    "Source": "has_source_handle",
+    "Citation": "has_citation_handle",
+    "Note": "has_note_handle",
+    "Place": "has_place_handle",
+    }
+
+# Number of lines sent at once to a worker process:
+CHUNK_SIZE = 500
+
+# Number of chunks being decoded at a time by the pool of processes:
+QUEUE_SIZE = 32
+
+# Number of objects added in each transaction, after which a checkpoint
+# is saved:
+COMMIT_SIZE = 50000
+
+# Extension of the checkpoint file, saved next to the imported file:
+CHECKPOINT_EXT = ".checkpoint"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def importData(dbase, filename, user, processes=None,
+               commit_size=COMMIT_SIZE):
+    """
+    Function called by Gramps to import data in JSON Lines format.
+    The lines are decoded by a pool of processes (all of the processors
+    by default, none if processes is 1), and added to the database here.
+
+    The objects are committed every commit_size objects, or in a single
+    transaction if commit_size is None. After each commit, the position
+    in the file is saved in a checkpoint file next to it: importing the
+    same file in the same tree again resumes where an import that failed
+    stopped, skipping the objects that are already in the tree.
+    """
     dbase.disable_signals()
+    count = skipped = 0
+    start = time.time()
+    resumable = commit_size and filename != "-"
+    offset = 0
+    if resumable:
+        (offset, count) = load_checkpoint(filename, dbase)
+        if offset:
+            LOG.info("Resuming the import of %s at byte %d, after %d objects",
+                     filename, offset, count)
+    first = count
     try:
-        with DbTxn(_("JSON import"), dbase, batch=True) as trans:
-            with OpenFileOrStdin(filename, 'b') as fp:
-                line = fp.readline()
-                while line:
-                    json = eval(line)
-                    obj = from_struct(json)
-                    if json["_class"] == "Person":
-                        dbase.add_person(obj, trans)
-                    elif json["_class"] == "Family":
-                        dbase.add_family(obj, trans)
-                    elif json["_class"] == "Event":
-                        dbase.add_event(obj, trans)
-                    elif json["_class"] == "MediaObject":
-                        dbase.add_object(obj, trans)
-                    elif json["_class"] == "Repository":
-                        dbase.add_repository(obj, trans)
-                    elif json["_class"] == "Tag":
-                        dbase.add_tag(obj, trans)
-                    elif json["_class"] == "Source":
-                        dbase.add_source(obj, trans)
-                    elif json["_class"] == "Citation":
-                        dbase.add_citation(obj, trans)
-                    elif json["_class"] == "Note":
-                        dbase.add_note(obj, trans)
-                    elif json["_class"] == "Place":
-                        dbase.add_place(obj, trans)
-                    else:
-                        LOG.warn("ignored: " + json)
-                    line = fp.readline()
+        size = os.path.getsize(filename) if filename != "-" else None
+        with open_input(filename) as fp:
+            if offset:
+                skip_input(fp, offset)
+            resumed = (count, input_position(fp) or 0)
+            # Position in the file after each chunk, in chunk order:
+            offsets = deque()
+            def chunks():
+                position = offset
+                for chunk in iter_chunks(fp):
+                    position += sum(len(line) for line in chunk)
+                    offsets.append(position)
+                    yield chunk
+            pool = make_pool(processes)
+            try:
+                if pool:
+                    results = decode_chunks(pool, chunks())
+                else:
+                    results = (decode_chunk(chunk) for chunk in chunks())
+                position = offset
+                finished = False
+                while not finished:
+                    finished = True
+                    added = 0
+                    with DbTxn(_("JSON import"), dbase, batch=True) as trans:
+                        for objects in results:
+                            position = offsets.popleft()
+                            for (class_name, obj) in objects:
+                                if class_name not in ADD_METHODS:
+                                    LOG.warn("ignored: " + class_name)
+                                elif offset and getattr(
+                                        dbase, HAS_METHODS[class_name])(
+                                        obj.handle):
+                                    skipped += 1
+                                else:
+                                    getattr(dbase, ADD_METHODS[class_name])(
+                                        obj, trans)
+                                    count += 1
+                                    added += 1
+                            report_progress(user, fp, size, count, resumed,
+                                            start)
+                            if commit_size and added >= commit_size:
+                                finished = False
+                                break
+                    if resumable:
+                        save_checkpoint(filename, dbase, position, count)
+            finally:
+                if pool:
+                    pool.close()
+                    pool.join()
+        if resumable:
+            remove_checkpoint(filename)
     except EnvironmentError as err:
         user.notify_error(_("%s could not be opened\n") % filename, str(err))
 
+    elapsed = time.time() - start
+    LOG.info("Imported %d objects in %.1f s (%.0f objects/s), "
+             "%d existing objects skipped", count - first, elapsed,
+             (count - first) / max(elapsed, 1e-6), skipped)
     dbase.enable_signals()
     dbase.request_rebuild()
+
+def report_progress(user, fp, size, count, resumed, start):
+    """
+    Report the progress of the import, its throughput and the estimated
+    time remaining, through the user callback. resumed is the number of
+    objects and the position in the file where this run started.
+    """
+    elapsed = max(time.time() - start, 1e-6)
+    text = _("%(count)d objects imported, %(rate)d objects/s") % {
+        "count": count, "rate": (count - resumed[0]) / elapsed}
+    position = input_position(fp)
+    percent = 0
+    if size and position and position > resumed[1]:
+        percent = min(100.0 * position / size, 100.0)
+        remaining = int(elapsed * max(size - position, 0) /
+                        (position - resumed[1]))
+        text += ", " + _("%d:%02d:%02d remaining") % (
+            remaining // 3600, remaining // 60 % 60, remaining % 60)
+    user.callback(percent, text)
+
+def checkpoint_name(filename):
+    return filename + CHECKPOINT_EXT
+
+def checkpoint_key(filename, dbase):
+    """
+    Return what identifies an import of a file in a tree: a checkpoint
+    saved for another tree or another version of the file is ignored.
+    """
+    stat = os.stat(filename)
+    return {"size": stat.st_size,
+            "mtime": int(stat.st_mtime),
+            "database": dbase.get_save_path()}
+
+def load_checkpoint(filename, dbase):
+    """
+    Return the position in the file and the number of objects imported
+    of the last checkpoint of the import of a file in a tree, or (0, 0).
+    """
+    try:
+        with open(checkpoint_name(filename)) as fp:
+            checkpoint = json.load(fp)
+    except (EnvironmentError, ValueError):
+        return (0, 0)
+    if checkpoint.get("key") != checkpoint_key(filename, dbase):
+        return (0, 0)
+    return (checkpoint["offset"], checkpoint["count"])
+
+def save_checkpoint(filename, dbase, offset, count):
+    """
+    Save the position in the file after the last object committed. The
+    checkpoint file is replaced at once, so that it is never truncated.
+    """
+    name = checkpoint_name(filename)
+    with open(name + ".tmp", "w") as fp:
+        json.dump({"key": checkpoint_key(filename, dbase),
+                   "offset": offset, "count": count}, fp)
+    replace_file(name + ".tmp", name)
+
+def replace_file(from_path, to_path):
+    """
+    Rename a file, replacing the destination file if any. Python 2 has
+    no os.replace, and os.rename does not replace a file under Windows:
+    the destination is removed first.
+    """
+    if hasattr(os, "replace"):
+        os.replace(from_path, to_path)
+    else:
+        if os.path.exists(to_path):
+            os.remove(to_path)
+        os.rename(from_path, to_path)
+
+def remove_checkpoint(filename):
+    if os.path.exists(checkpoint_name(filename)):
+        os.remove(checkpoint_name(filename))
+
+def iter_chunks(fp):
+    """
+    Yield lists of at most CHUNK_SIZE lines of a file.
+    """
+    while True:
+        chunk = list(itertools.islice(fp, CHUNK_SIZE))
+        if not chunk:
+            break
+        yield chunk
+
+def decode_chunk(lines):
+    """
+    Return the (class name, object) of each line of a chunk.
+    """
+    objects = []
+    for line in lines:
+        if not line.strip():
+            continue
+        struct = decode_line(line)
+        if struct["_class"] in ADD_METHODS:
+            objects.append((struct["_class"], from_struct(struct)))
+        else:
+            objects.append((struct["_class"], None))
+    return objects
+
+def decode_chunks(pool, chunks):
+    """
+    Yield the decoded chunks in the order of the file, decoding them in
+    the pool of processes. At most QUEUE_SIZE chunks are being decoded
+    at a time, so that the file is not read far ahead of the objects
+    added to the database.
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(decode_chunk, (chunk,)))
+        while len(pending) >= QUEUE_SIZE or (pending and
+                                             pending[0].ready()):
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def decode_line(line):
+    """
+    Decode a JSON line. Files written by the former versions of the
+    export hold Python literals instead, which are still read, safely.
+    """
+    try:
+        return json.loads(line.decode("utf-8"))
+    except ValueError:
+        return ast.literal_eval(line.decode("utf-8"))
+
+def make_pool(processes):
+    """
+    Return a pool of processes, or None to work in this process.
+    The workers are forked, so that they share the loaded addon.
+    """
+    if processes == 1:
+        return None
+    try:
+        context = multiprocessing.get_context("fork")
+    except (AttributeError, ValueError):
+        return None
+    return context.Pool(processes)
+
+def skip_input(fp, offset):
+    """
+    Skip offset bytes of the (uncompressed) input.
+    """
+    seekable = getattr(fp, "seekable", None)
+    if seekable is None:
+        # Python 2 file objects cannot tell whether they are seekable
+        try:
+            fp.seek(offset)
+            return
+        except (EnvironmentError, ValueError):
+            pass
+    elif seekable():
+        fp.seek(offset)
+        return
+    while offset:
+        data = fp.read(min(offset, 1 << 20))
+        if not data:
+            break
+        offset -= len(data)
+
+def input_position(fp):
+    """
+    Return the position in the input file, before uncompressing it, or
+    None if it is unknown.
+    """
+    raw = getattr(fp, "raw_input", None) or getattr(fp, "fileobj", None) or fp
+    try:
+        return raw.tell()
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+
+def open_input(filename):
+    """
+    Open the input binary file, uncompressing it according to its
+    first bytes.
+    """
+    if filename != "-":
+        with open(filename, "rb") as fp:
+            magic = fp.read(4)
+        if magic.startswith(GZIP_MAGIC):
+            return gzip.open(filename, "rb")
+        elif magic == ZSTD_MAGIC:
+            if zstandard is None:
+                raise EnvironmentError("the zstandard module is needed "
+                                       "to read %s" % filename)
+            decompressor = zstandard.ZstdDecompressor()
+            raw = open(filename, "rb")
+            fp = io.BufferedReader(decompressor.stream_reader(raw))
+            fp.raw_input = raw
+            return fp
+    return OpenFileOrStdin(filename, 'b')
@@ -0,0 +1,117 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2013       Doug Blank <doug.blank@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""
+JSON import/export throughput benchmark script
+
+Serializes and decodes synthetic people with the former repr/eval
+format, and with JSON Lines in this process and in a pool of processes,
+and prints the throughput of each in objects/sec.
+
+The script is to be launched from its directory
+
+Usage example:
+    GRAMPS_RESOURCES=/PATHTO/gramps python json_benchmark.py 50000
+"""
+
+from __future__ import print_function
+import os, sys, time, argparse
+
+gramps_path = os.environ.get("GRAMPS_RESOURCES")
+if gramps_path:
+    sys.path.append(gramps_path)
+sys.path.append(".")
+
+from gramps.gen.lib import Person, Name, Surname, EventRef, Attribute
+from gramps.gen.utils.id import create_id
+import JSONExport
+import JSONImport
+
+def make_people(count):
+    """
+    Return the raw data of count people.
+    """
+    people = []
+    for i in range(count):
+        person = Person()
+        person.set_handle(create_id())
+        person.set_gramps_id("I%06d" % i)
+        name = Name()
+        name.set_first_name("Given%d" % i)
+        surname = Surname()
+        surname.set_surname("Surname%d" % (i % 1000))
+        name.add_surname(surname)
+        person.set_primary_name(name)
+        event_ref = EventRef()
+        event_ref.set_reference_handle(create_id())
+        person.add_event_ref(event_ref)
+        attribute = Attribute()
+        attribute.set_value("value %d" % i)
+        person.add_attribute(attribute)
+        people.append(person.serialize())
+    return people
+
+def report(label, count, elapsed):
+    print("%-22s %8d objects %7.2f s %10.0f objects/s" %
+          (label, count, elapsed, count / max(elapsed, 1e-6)))
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON addon benchmark")
+    parser.add_argument("people", type=int, nargs="?", default=50000)
+    args = parser.parse_args()
+    people = make_people(args.people)
+    chunks = [[(Person, serial) for serial in people[i:i + JSONExport.CHUNK_SIZE]]
+              for i in range(0, len(people), JSONExport.CHUNK_SIZE)]
+
+    # Former format: Python literals, read back with eval
+    start = time.time()
+    lines = [str(Person.create(serial).to_struct()) for serial in people]
+    report("repr export", len(lines), time.time() - start)
+    start = time.time()
+    for line in lines:
+        eval(line)
+    report("eval import", len(lines), time.time() - start)
+
+    for processes in [1, None]:
+        label = "single process" if processes == 1 else "process pool"
+        pool = JSONExport.make_pool(processes)
+        start = time.time()
+        if pool:
+            results = JSONExport.serialize_chunks(pool, chunks)
+        else:
+            results = map(JSONExport.serialize_chunk, chunks)
+        text = "".join(part for (size, part) in results)
+        report("JSON export, " + label, len(people), time.time() - start)
+        lines = [line.encode("utf-8") for line in text.splitlines(True)]
+        line_chunks = [lines[i:i + JSONImport.CHUNK_SIZE]
+                       for i in range(0, len(lines), JSONImport.CHUNK_SIZE)]
+        start = time.time()
+        if pool:
+            results = JSONImport.decode_chunks(pool, line_chunks)
+        else:
+            results = map(JSONImport.decode_chunk, line_chunks)
+        count = sum(len(objects) for objects in results)
+        report("JSON import, " + label, count, time.time() - start)
+        if pool:
+            pool.close()
+            pool.join()
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,7 @@ register(QUICKREPORT,
          id    = 'NumberOfDescendantsQuickview',
          name  = _("Number of descendants"),
          description= _("Shows the number of descendants of the current person"),
-         version = '3.4.20',
+         version = '3.4.21',
          gramps_target_version = '4.2',
          status = STABLE,
          fname = 'NumberOfDescendantsQuickview.py',
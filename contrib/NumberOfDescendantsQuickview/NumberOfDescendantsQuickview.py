@@ -29,6 +29,10 @@ Display the number of a person's descendants.
 # Standard Python modules
 #
 #------------------------------------------------------------------------
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 #------------------------------------------------------------------------
 #
@@ -41,12 +45,24 @@ from gramps.gen.simple import SimpleDoc
 from gramps.gui.plug.quick import QuickTable
 from gramps.gen.const import GRAMPS_LOCALE as glocale
 from gramps.gen.utils.alive import probably_alive
+from gramps.gen.utils.db import get_death_or_fallback
 try:
     _trans = glocale.get_addon_translator(__file__)
 except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
 
+# Database signals after which the descendant graph of a database is
+# built again:
+_INVALIDATE_SIGNALS = [
+    "person-add", "person-update", "person-delete", "person-rebuild",
+    "family-add", "family-update", "family-delete", "family-rebuild",
+    "event-update", "event-delete", "event-rebuild",
+    ]
+
+# Living status of the persons in DescendantGraph.status:
+_UNKNOWN, _DEAD, _ALIVE = -1, 0, 1
+
 #------------------------------------------------------------------------
 #
 # Main report function
@@ -62,62 +78,45 @@ def run(database, document, person):
     sdoc.title(_("Number of %s's descendants") % name)
     sdoc.paragraph("")
 
-    total    = []
-    seen     = []
-    outlived = []
-    alive    = []
-    handles  = []
-
-    _count_descendants(database, person, death_date, 0,
-            total, seen, outlived, alive, handles)
-
-    # Bring all lists to the same length. No list can be longer than "total".
-    while len(seen) < len(total):
-        seen.append(0)
-    while len(outlived) < len(total):
-        outlived.append(0)
-    while len(alive) < len(total):
-        alive.append(0)
+    graph = get_graph(database)
+    root_death = death_date.get_sort_value() if death_date else 0
+    generations = graph.count_descendants(person.handle, root_death)
 
     rel_calc = get_relationship_calculator()
 
     stab = QuickTable(document)
+    columns = [_("Generation"), _("Total"), _("Unique"), _("Duplicates")]
     if death_date:
-        stab.columns(
-                _("Generation"),
-                _("Total"),
-                _("Seen"),
-                _("Outlived"),
-                _("Now alive"))
-    else:
-        stab.columns(
-                _("Generation"),
-                _("Total"),
-                _("Now alive"))
+        columns += [_("Seen"), _("Outlived")]
+    columns += [_("Now alive"), _("Deceased"), _("Birth years")]
+    stab.columns(*columns)
+    keys = ["total", "unique", "duplicates"]
+    if death_date:
+        keys += ["seen", "outlived"]
+    keys += ["alive", "deceased"]
     n = 0
-    for (a, b, c, d, h) in zip(total, seen, outlived, alive, handles):
+    for counts in generations:
         n += 1
         generation = rel_calc.get_plural_relationship_string(0, n)
-        if death_date:
-            # stab.row([generation, "PersonList"] + h, a, b, c, d) # Needs 3.2
-            stab.row(generation, a, b, c, d)
-        else:
-            # stab.row([generation, "PersonList"] + h, a, d) # Needs 3.2
-            stab.row(generation, a, d)
+        stab.row(generation, *([counts[key] for key in keys] +
+                               [_format_years(counts["birth_years"])]))
         stab.row_sort_val(0, n)
 
-    if death_date:
-        # stab.row([_("Total"), "PersonList"] + sum(handles, []), # Needs 3.2
-        stab.row(_("Total"),
-                 sum(total), sum(seen), sum(outlived), sum(alive))
-    else:
-        # stab.row([_("Total"), "PersonList"] + sum(handles, []), # Needs 3.2
-        stab.row(_("Total"),
-                 sum(total), sum(alive))
+    totals = dict((key, sum(counts[key] for counts in generations))
+                  for key in keys)
+    years = [counts["birth_years"] for counts in generations
+             if counts["birth_years"]]
+    stab.row(_("Total"), *([totals[key] for key in keys] + [_format_years(
+        (min(y[0] for y in years), max(y[1] for y in years))
+        if years else None)]))
     stab.row_sort_val(0, n + 1)
 
     stab.write(sdoc)
 
+    sdoc.paragraph(_("Unique = number of descendants not already counted in "
+        "a previous generation, or through another line"))
+    sdoc.paragraph(_("Duplicates = number of times descendants are counted "
+        "again, through another line (pedigree collapse)"))
     if death_date:
         sdoc.paragraph(_("Seen = number of descendants whose birth %s has "
             "lived to see") % name)
@@ -125,59 +124,252 @@ def run(database, document, person):
             "was still alive") % name)
 
 
+def _format_years(years):
+    if not years:
+        return ""
+    if years[0] == years[1]:
+        return str(years[0])
+    return "%d-%d" % years
+
+
 #------------------------------------------------------------------------
 #
-# Recursively count descendants
+# Descendant graph
 #
 #------------------------------------------------------------------------
-def _count_descendants(database, person, root_death_date, generation,
-        total, seen, outlived, alive, handles):
-
-    # "total", "seen", "outlived" and "alive" are lists with the respective
-    # descendant count per generation. "handles" is a list of lists of person
-    # handles per generation. These parameters are modified by this function!
-
-    for family_handle in person.get_family_handle_list():
-        family = database.get_family_from_handle(family_handle)
-
-        for child_ref in family.get_child_ref_list():
-            child = database.get_person_from_handle(child_ref.ref)
-
-            birth_date = _get_date(database, child.get_birth_ref())
-            death_date = _get_date(database, child.get_death_ref())
-
-            # Total number of descendants.
-            _increment(total, 0, 1, generation)
-
-            # Number of descendants born during lifetime of queried person.
-            if root_death_date and birth_date and \
-                    birth_date.match(root_death_date, "<<"):
-                _increment(seen, 0, 1, generation)
-
-            # Number of descendants that queried person outlived.
-            if root_death_date and death_date and \
-                    death_date.match(root_death_date, "<<"):
-                _increment(outlived, 0, 1, generation)
-
-            # Number of descendants now alive.
-            if probably_alive(child, database):
-                _increment(alive, 0, 1, generation)
-
-            # Handle to this descendant.
-            _increment(handles, [], [child.handle], generation)
-
-            _count_descendants(database, child, root_death_date, generation + 1,
-                    total, seen, outlived, alive, handles)
-
-
-# Helper function to increment the nth item of a list, and if necessary expand
-# the length of the list to n items beforehand.
-# Used for counting (startwith=0, increment=1) and for building lists
-# (startwith=[], increment=[item_to_add]).
-def _increment(variable, startwith, increment, generation):
-    while len(variable) <= generation:
-        variable.append(startwith)
-    variable[generation] += increment
+_graphs = {}
+
+def get_graph(database):
+    """
+    Return the DescendantGraph of a database, built once, and built again
+    when the persons, families or events of the database change.
+    """
+    graph = _graphs.get(id(database))
+    if graph is None or graph.database is not database:
+        graph = DescendantGraph(database)
+        _graphs.clear()
+        _graphs[id(database)] = graph
+        if hasattr(database, "connect"):
+            for signal in _INVALIDATE_SIGNALS:
+                database.connect(signal, graph.invalidate)
+    elif not graph.valid:
+        graph.build()
+    return graph
+
+
+class DescendantGraph(object):
+    """
+    The persons of a database indexed by integers, with the parent to child
+    links as an adjacency array: the children of the person i are
+    children[offsets[i]:offsets[i + 1]]. The birth and death dates are
+    kept as sort values (0 if unknown), and the birth years.
+
+    The arrays are NumPy arrays if NumPy is available, lists otherwise.
+    """
+    def __init__(self, database):
+        self.database = database
+        self.build()
+
+    def invalidate(self, *args):
+        self.valid = False
+
+    def build(self):
+        database = self.database
+        dates = {}
+        for event in database.iter_events():
+            date = event.get_date_object()
+            if not date.is_empty():
+                dates[event.handle] = (date.get_sort_value(), date.get_year())
+        self.handles = []
+        self.index = {}
+        person_families = []
+        birth = []
+        death = []
+        birth_year = []
+        status = []
+        for person in database.iter_people():
+            self.index[person.handle] = len(self.handles)
+            self.handles.append(person.handle)
+            person_families.append(person.get_family_handle_list())
+            birth_ref = person.get_birth_ref()
+            death_ref = person.get_death_ref()
+            (sort_value, year) = dates.get(birth_ref.ref, (0, 0)) \
+                if birth_ref else (0, 0)
+            birth.append(sort_value)
+            birth_year.append(year)
+            death.append(dates.get(death_ref.ref, (0, 0))[0]
+                         if death_ref else 0)
+            # The living status of the persons without death event, or
+            # burial or other fallback, is given by probably_alive when
+            # needed:
+            if death_ref or get_death_or_fallback(database, person):
+                status.append(_DEAD)
+            else:
+                status.append(_UNKNOWN)
+        family_children = {}
+        for family in database.iter_families():
+            family_children[family.handle] = [
+                self.index[child_ref.ref]
+                for child_ref in family.get_child_ref_list()
+                if child_ref.ref in self.index]
+        offsets = [0]
+        children = []
+        for family_handles in person_families:
+            for family_handle in family_handles:
+                children.extend(family_children.get(family_handle, []))
+            offsets.append(len(children))
+        if np is not None:
+            self.offsets = np.array(offsets, dtype=np.int64)
+            self.children = np.array(children, dtype=np.int64)
+            self.birth = np.array(birth, dtype=np.int64)
+            self.death = np.array(death, dtype=np.int64)
+            self.birth_year = np.array(birth_year, dtype=np.int64)
+            self.status = np.array(status, dtype=np.int8)
+        else:
+            self.offsets = offsets
+            self.children = children
+            self.birth = birth
+            self.death = death
+            self.birth_year = birth_year
+            self.status = status
+        self.valid = True
+
+    def _resolve_status(self, indexes):
+        """
+        Compute with probably_alive the living status of the persons whose
+        status is unknown, among the given persons.
+        """
+        for i in indexes:
+            if self.status[i] == _UNKNOWN:
+                person = self.database.get_person_from_handle(self.handles[i])
+                self.status[i] = _ALIVE if probably_alive(
+                    person, self.database) else _DEAD
+
+    def count_descendants(self, handle, root_death=0):
+        """
+        Count the descendants of a person, generation by generation.
+
+        The descendants are expanded level by level from a frontier of
+        (person, number of lines from the root person) pairs, so that a
+        descendant reached through several lines is only expanded once.
+
+        Return a list giving for each generation a dictionary of counts:
+        total (counting a descendant once per line), unique (descendants
+        not found before), duplicates (total - unique), seen and outlived
+        (descendants born or dead before root_death, the sort value of
+        the death date of the root person, if any), alive and deceased,
+        and birth_years: the (first, last) known birth years, or None.
+        """
+        if np is not None:
+            expand = self._expand_numpy
+            stats = self._stats_numpy
+            visited = np.zeros(len(self.handles), dtype=bool)
+            frontier = (np.array([self.index[handle]], dtype=np.int64),
+                        np.ones(1, dtype=np.int64))
+        else:
+            expand = self._expand_python
+            stats = self._stats_python
+            visited = [False] * len(self.handles)
+            frontier = ([self.index[handle]], [1])
+        visited[self.index[handle]] = True
+        generations = []
+        # A person cannot have more generations of descendants than there
+        # are persons, unless they are their own ancestor:
+        while len(generations) < len(self.handles):
+            frontier = expand(*frontier)
+            if not len(frontier[0]):
+                break
+            generations.append(stats(frontier[0], frontier[1], visited,
+                                     root_death))
+        return generations
+
+    def _expand_numpy(self, persons, lines):
+        """
+        Return the children of the persons, with their number of lines.
+        """
+        starts = self.offsets[persons]
+        lengths = self.offsets[persons + 1] - starts
+        size = int(lengths.sum())
+        if not size:
+            return (persons[:0], lines[:0])
+        # Position of each child in the adjacency array:
+        shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        children = self.children[np.arange(size) + shifts]
+        (children, inverse) = np.unique(children, return_inverse=True)
+        child_lines = np.zeros(len(children), dtype=np.int64)
+        np.add.at(child_lines, inverse, np.repeat(lines, lengths))
+        return (children, child_lines)
+
+    def _stats_numpy(self, persons, lines, visited, root_death):
+        new = ~visited[persons]
+        visited[persons] = True
+        unknown = persons[self.status[persons] == _UNKNOWN]
+        if len(unknown):
+            self._resolve_status(unknown)
+        status = self.status[persons]
+        counts = {
+            "total": int(lines.sum()),
+            "unique": int(new.sum()),
+            "alive": int(lines[status == _ALIVE].sum()),
+            "deceased": int(lines[status == _DEAD].sum()),
+            "seen": 0,
+            "outlived": 0,
+            "birth_years": None,
+            }
+        counts["duplicates"] = counts["total"] - counts["unique"]
+        if root_death:
+            birth = self.birth[persons]
+            death = self.death[persons]
+            counts["seen"] = int(lines[(birth != 0) &
+                                       (birth < root_death)].sum())
+            counts["outlived"] = int(lines[(death != 0) &
+                                           (death < root_death)].sum())
+        years = self.birth_year[persons]
+        years = years[years != 0]
+        if len(years):
+            counts["birth_years"] = (int(years.min()), int(years.max()))
+        return counts
+
+    def _expand_python(self, persons, lines):
+        child_lines = {}
+        for (person, count) in zip(persons, lines):
+            for child in self.children[self.offsets[person]:
+                                       self.offsets[person + 1]]:
+                child_lines[child] = child_lines.get(child, 0) + count
+        children = sorted(child_lines)
+        return (children, [child_lines[child] for child in children])
+
+    def _stats_python(self, persons, lines, visited, root_death):
+        self._resolve_status(persons)
+        counts = {
+            "total": sum(lines),
+            "unique": 0,
+            "alive": 0,
+            "deceased": 0,
+            "seen": 0,
+            "outlived": 0,
+            "birth_years": None,
+            }
+        years = []
+        for (person, count) in zip(persons, lines):
+            if not visited[person]:
+                visited[person] = True
+                counts["unique"] += 1
+            if self.status[person] == _ALIVE:
+                counts["alive"] += count
+            else:
+                counts["deceased"] += count
+            if root_death:
+                if 0 < self.birth[person] < root_death:
+                    counts["seen"] += count
+                if 0 < self.death[person] < root_death:
+                    counts["outlived"] += count
+            if self.birth_year[person]:
+                years.append(self.birth_year[person])
+        counts["duplicates"] = counts["total"] - counts["unique"]
+        if years:
+            counts["birth_years"] = (min(years), max(years))
+        return counts
 
 
 #------------------------------------------------------------------------
@@ -24,7 +24,7 @@ register(REPORT,
          name=_("Pedigree Chart"),
          description=_("Alternate version of the traditional pedigree chart."),
          status = STABLE,
-         version = '1.0.25',
+         version = '1.0.26',
          fname="PedigreeChart.py",
          gramps_target_version="4.2",
          authors=['Jakim Friant'],
@@ -31,11 +31,6 @@
 # standard python modules
 #
 #------------------------------------------------------------------------
-try:
-    import numpy as np
-except ImportError:
-    import _matrixops as np
-from collections import deque
 import time
 #from xml.sax.saxutils import escape
 
@@ -53,6 +48,7 @@ from gramps.gen.plug.report import Report, MenuReportOptions
 from gramps.gen.plug.docgen import fontscale
 from gramps.gen.plug.menu import BooleanOption, NumberOption, PersonOption
 from gramps.gen.plug.report.utils import pt2cm, cm2pt
+from gramps.gen.errors import ReportError
 #from gen.plug.menu import TextOption
 from gramps.gen.const import GRAMPS_LOCALE as glocale
 try:
@@ -61,108 +57,19 @@ except ValueError:
     _trans = glocale.translation
 _ = _trans.gettext
 
-_LINKS_BEGIN = 8
-_PEOPLE_PER_PAGE = 15
-_MIN_PERSON_LIMIT = 1
-_GENERATIONS_PER_PAGE = 4
-_MAX_INDEX_PER_PAGE = 2**_GENERATIONS_PER_PAGE
-_MAX_PAGES = 1000
-_PLACEHOLDER = "_" * 12
-_ARROW = np.matrix([[-0.5 ,  0.55],
-                    [ 0.0 ,  0.55],
-                    [ 0.0 ,  0.75],
-                    [ 0.5 ,  0.25],
-                    [ 0.0 , -0.25],
-                    [ 0.0 , -0.05],
-                    [-0.5 , -0.05],
-                    [-0.5 ,  0.55]])
-_SOURCE_ARROW_OFFSET = 2 # cm
-_LINE_X_OFFSET = 1 # cm
-_GUTTER_SIZE = 0.25 # cm
-
-def PageCounter(initial_value=0):
-    """A generator to return sequential page numbers."""
-    v = initial_value
-    while v < initial_value + _MAX_PAGES:
-        yield v
-        v += 1
-    return
-
 #------------------------------------------------------------------------
 #
-# PageLinks class
+# PedigreeChart modules
 #
 #------------------------------------------------------------------------
-class PageLinks:
-    """
-    Manages a two-way index for the person handle and a corrisponding page link
-    that list the index where this person's tree resumes.
-
-    """
-    def __init__(self, depth, max_generations):
-        """
-        Create the indexes for each person handle and page link.
-
-        depth: used to track the number of subsequent pages to determine when
-               we reach the generation limit.
-
-        """
-        self._index_by_handle = dict()
-        self._index_by_page = dict()
-        self.depth = depth
-        self.gen_limit = max_generations - (depth * _GENERATIONS_PER_PAGE)
-
-    def add(self, person_handle, current_page, link_to_page):
-        """
-        Add a new person and page link to the set of indexes.
-
-        person_map: a list of person_handles that will be printed on this page
-        page_link_counter: a generator that returns the next page number
-
-        """
-        self._index_by_handle[person_handle] = (current_page, link_to_page)
-        self._index_by_page[link_to_page] = person_handle
-
-    def __str__(self):
-        """Return a string with the person handles sorted by page order."""
-        links_out = self.handlesByPage()
-        return repr(links_out)
-
-    def empty(self):
-        """Return true if the length of the primary index is 0."""
-        return (len(self._index_by_handle) > 0)
-
-    def handlesByPage(self):
-        """Return a list of person handles in the order of their page number."""
-        return [self._index_by_page[k] for k in sorted(self._index_by_page.keys())]
-
-    def getHandle(self, page):
-        """Return a person handle for the given page number."""
-        return self._index_by_page[page]
-
-    def getSourcePage(self, p_handle):
-        """Return the source page number for the given handle."""
-        return self._index_by_handle[p_handle][0]
-
-    def getSource(self, p_handle):
-        """Return a string with the page number for the given person handle."""
-        if p_handle in self._index_by_handle:
-            source_text = str(self._index_by_handle[p_handle][0])
-        else:
-            source_text = ""
-        return source_text
-
-    def getLinkPage(self, p_handle):
-        """Return the page number that this person handle is linked to"""
-        return self._index_by_handle[p_handle][1]
+from _layout import (LEFT_ARROW, PageLimitError, SlotGeometry, assign_pages,
+                     place_arrows, place_links)
 
-    def getLink(self, p_handle):
-        """Return a string with the link page number if the page limit has not been reached"""
-        if self.gen_limit > _MIN_PERSON_LIMIT and p_handle in self._index_by_handle:
-            link_text = str(self._index_by_handle[p_handle][1])
-        else:
-            link_text = ""
-        return link_text
+_MAX_PAGES = 1000
+_PLACEHOLDER = "_" * 12
+_SOURCE_ARROW_OFFSET = 2 # cm
+_LINE_X_OFFSET = 1 # cm
+_GUTTER_SIZE = 0.25 # cm
 
 #------------------------------------------------------------------------
 #
@@ -301,9 +208,9 @@ class PersonBox:
         Return the index of this person's descendant (one level up).
         """
         if self.isMother():
-            descendant_index = (self.index - 1) / 2
+            descendant_index = (self.index - 1) // 2
         else:
-            descendant_index = self.index / 2
+            descendant_index = self.index // 2
         return descendant_index
 
     def isMother(self):
@@ -388,10 +295,12 @@ class PedigreeChart(Report):
 #                             gramps.gen.datehandler.displayer.display(report_date)))
         self.footer = gramps.gen.datehandler.displayer.display(report_date)
 
-        self.map = {}
-        self.page_number = PageCounter(1)
-        self.page_link_counter = PageCounter(2)
-        self.generation_index = 1
+        # (father, mother, family continues) of the persons, by handle
+        self._parents = {}
+        # widths of the page numbers written in the link arrows
+        self._link_widths = {}
+        # link arrows of the pages, by (page number, slot)
+        self.links = {}
 
         page_width = self.doc.get_usable_width()
         page_height = self.doc.get_usable_height()
@@ -434,6 +343,17 @@ class PedigreeChart(Report):
                         15: (self.columns[3], page_height * 60 / 64)   # 60
         }
 
+        # The boxes of the fathers show the marriage too, so they have one
+        # more line than the boxes of the mothers and of the center person.
+        self.geometry = SlotGeometry(self.coordinates, self.max_box_size,
+                                     self.get_font_height('PC-box') * 1.4,
+                                     _LINE_X_OFFSET)
+
+        # The arrow back to the source page is at the same place on every page
+        self.source_link = (0.5, page_height / 2 + _SOURCE_ARROW_OFFSET +
+                            self.get_font_height('PC-box'))
+        self.source_arrow = place_arrows(LEFT_ARROW, [self.source_link])[0]
+
     def write_report(self):
         """
         Create the report for the selected person
@@ -444,121 +364,98 @@ class PedigreeChart(Report):
 
           3) continue with each subsequent page and generate lists there too
 
-        """
-        page_queue = deque([])
-        # Generate the first page
-        page_links = self._fill_page(self.center_person.get_handle())
-        page_queue.append(page_links)
-        while len(page_queue) > 0:
-            page_links = page_queue.popleft()
-            for person_handle in page_links.handlesByPage():
-                new_links = self._fill_page(person_handle, page_links.depth, page_links.getSourcePage(person_handle))
-                page_queue.append(new_links)
-
-    def _fill_page(self, person_handle, depth = 0, source_page = None):
-        """Create a tree of up to 15 people for this page
-
-        person_handle - the base person for this page
-        depth - the current generation depth, used to figure out when to stop
-        source_page - the previous page where person_handle is listed
+        All of the pages are laid out first, then written in order.
 
         """
-        current_page = next(self.page_number)
-        self.map = {}
-        gen_limit = self.max_generations - (depth * _GENERATIONS_PER_PAGE)
-        self._get_parents(person_handle, 1, gen_limit)
-        # create links to subsequent pages, if we haven't reached the genearation limit
-        # TODO: need to check the generation limit before creating the links!
-        #print '[DEBUG] depth = %2d, gen_limit = %2d, max_gen = %2d' % (depth, gen_limit, self.max_generations)
-        page_links = PageLinks(depth + 1, self.max_generations)
-        # we only want to print the page if it shows more than one person
-        if gen_limit > _MIN_PERSON_LIMIT:
-            for i in range(_LINKS_BEGIN, _PEOPLE_PER_PAGE + 1):
-                if i in self.map:
-                    if self.map[i].familyContinues():
-                        page_links.add(self.map[i].person_handle, current_page, next(self.page_link_counter))
-            # generate the page
-            self.doc.start_page()
-            self.doc.center_text('PC-title', self.title,
-                                 self.doc.get_usable_width() / 2, 0)
-
-            # print a link back to the source page (if any)
-            if source_page is not None:
-                self._draw_source_arrow(str(source_page))
-
-            for index in sorted(self.map.keys()):
-                person_box = self.map[index]
-
-                (x, y) = person_box.getPos()
-                (w, h) = person_box.getSize()
-                self.doc.draw_box(person_box.style_name, person_box.getLines(), x, y, w, h)
-
-                # show a page link if it's there
-                link_text = page_links.getLink(person_box.person_handle)
-                if link_text != "":
-                    self._draw_link_arrow(link_text, y, h)
-
-                # draw the line back to the descendant box
-                if x > self.columns[0]:
-                    descendant = self.map[person_box.getDescendant()]
-                    (dx, dy) = descendant.getPos()
-                    (dw, dh) = descendant.getSize()
-                    x1 = x
-                    y1 = y + h / 2
-                    x2 = dx + _LINE_X_OFFSET
-                    if person_box.isMother():
-                        y2 = dy + dh
-                    else:
-                        y2 = dy
-                    # determine if this person is adopted and draw a
-                    # dashed line if that is the case
-                    line_style = person_box.getRelationshipStyle(descendant.person_handle)
-                    self.doc.draw_line(line_style, x1, y1, x2, y1)
-                    self.doc.draw_line(line_style, x2, y2, x2, y1)
-
-                    if self.show_parent_tags:
-                        if person_box.isMother():
-                            tx = x - self.parent_tag_len
-                            ty = y + (self.parent_tag_height * 3)
-                            self.doc.draw_text('PC-caption', _('Mother'), tx, ty)
-                        else:
-                            tx = x - self.parent_tag_len
-                            self.doc.draw_text('PC-caption', _('Father'), tx, y)
-            # write out the footer
-            footer = self.footer + "\n" + _("Page %d" % current_page)
-            footer_top = self.doc.get_usable_height() - (self.get_font_height('PC-box') * 1.2 * len(footer.split("\n")))
-            self.doc.draw_text('PC-box', footer, 0, footer_top)
-#            self.doc.center_text('PC-box', _("Page %d" % current_page),
-#                                 self.doc.get_usable_width() / 2,
-#                                 self.doc.get_usable_height() - self.get_font_height('PC-box') * 1.2)
-            self.doc.end_page()
-        # return the list of links
-        return page_links
-
-    def _get_parents(self, person_handle, index, gen_limit):
+        try:
+            pages = assign_pages(self.center_person.get_handle(),
+                                 self._get_parents, self.max_generations,
+                                 _MAX_PAGES)
+        except PageLimitError:
+            raise ReportError(_("The chart would have more than %d pages, "
+                                "choose fewer generations") % _MAX_PAGES)
+        self.links = place_links(pages, self.geometry, self._get_link_width,
+                                 self.doc.get_usable_width())
+        for page in pages:
+            self._write_page(page)
+
+    def _write_page(self, page):
+        """Write a page of up to 15 people
+
+        page - the page laid out by assign_pages
+
         """
-        Generate a list of the person's parents and their parents
-        recursively up to max_generations.
+        self.doc.start_page()
+        self.doc.center_text('PC-title', self.title,
+                             self.doc.get_usable_width() / 2, 0)
+
+        # print a link back to the source page (if any)
+        if page.source is not None:
+            self._draw_source_arrow(str(page.source))
+
+        boxes = dict((index, PersonBox(index, page.slots[index], self))
+                     for index in page.indexes())
+
+        for index in sorted(boxes):
+            person_box = boxes[index]
 
-        person_handle: the center person
-        index: the current index position of this person
-        gen_limit: maximum number of generations for this page
+            (x, y, w, h) = self.geometry.box(index)
+            self.doc.draw_box(person_box.style_name, person_box.getLines(), x, y, w, h)
 
-        This function is based on AncestorTree.apply_filter().
+            # show a page link if it's there
+            if (page.number, index) in self.links:
+                self._draw_link_arrow(*self.links[page.number, index])
 
+            # draw the line back to the descendant box
+            if index > 1:
+                descendant = boxes[person_box.getDescendant()]
+                # determine if this person is adopted and draw a
+                # dashed line if that is the case
+                line_style = person_box.getRelationshipStyle(descendant.person_handle)
+                for (x1, y1, x2, y2) in self.geometry.connectors[index]:
+                    self.doc.draw_line(line_style, x1, y1, x2, y2)
+
+                if self.show_parent_tags:
+                    if person_box.isMother():
+                        tx = x - self.parent_tag_len
+                        ty = y + (self.parent_tag_height * 3)
+                        self.doc.draw_text('PC-caption', _('Mother'), tx, ty)
+                    else:
+                        tx = x - self.parent_tag_len
+                        self.doc.draw_text('PC-caption', _('Father'), tx, y)
+        # write out the footer
+        footer = self.footer + "\n" + _("Page %d" % page.number)
+        footer_top = self.doc.get_usable_height() - (self.get_font_height('PC-box') * 1.2 * len(footer.split("\n")))
+        self.doc.draw_text('PC-box', footer, 0, footer_top)
+        self.doc.end_page()
+
+    def _get_parents(self, person_handle):
         """
-        if (not person_handle) or (index >= _MAX_INDEX_PER_PAGE) or (index >= 2**gen_limit):
-        #if (not person_handle) or (index >= 2**self.max_generations):
-            return
+        Return a tuple with the handles of the father and mother of the
+        person, and whether the person has a primary family.
 
-        self.map[index] = PersonBox(index, person_handle, self)
+        The parents are read once, even if the person is shown on several
+        pages.
 
-        person = self.database.get_person_from_handle(person_handle)
-        family_handle = person.get_main_parents_family_handle()
-        if family_handle:
-            family = self.database.get_family_from_handle(family_handle)
-            self._get_parents(family.get_father_handle(), index * 2, gen_limit)
-            self._get_parents(family.get_mother_handle(), index * 2 + 1, gen_limit)
+        """
+        if person_handle not in self._parents:
+            person = self.database.get_person_from_handle(person_handle)
+            family_handle = person.get_main_parents_family_handle()
+            father_handle = mother_handle = None
+            if family_handle:
+                family = self.database.get_family_from_handle(family_handle)
+                father_handle = family.get_father_handle()
+                mother_handle = family.get_mother_handle()
+            self._parents[person_handle] = (father_handle, mother_handle,
+                                            family_handle is not None)
+        return self._parents[person_handle]
+
+    def _get_link_width(self, link_text):
+        """Return the width of the page number written in a link arrow."""
+        if link_text not in self._link_widths:
+            self._link_widths[link_text] = pt2cm(
+                self.doc.string_width(self.get_font('PC-box'), link_text))
+        return self._link_widths[link_text]
 
     # helper function from FamilyTree by Reinhard Mueller
     def get_font_height(self, style_name):
@@ -582,36 +479,23 @@ class PedigreeChart(Report):
         The position for this arrow is the same on every page.
 
         """
-        link_x = 0.5
-        link_y = self.doc.get_usable_height() / 2 + _SOURCE_ARROW_OFFSET + self.get_font_height('PC-box')
-        # reverse the direction of the arrow
-        flip = np.matrix([[-1,  0], [ 0,  1]])
-        left_arrow = _ARROW * flip
-        # calculate the position of the arrow
-        loc = np.matrix([link_x, link_y])
-        path = left_arrow + loc
-        self.doc.draw_path('PC-line', path.A)
+        (link_x, link_y) = self.source_link
+        self.doc.draw_path('PC-line', self.source_arrow)
         # write the text inside the arrow
         self.doc.draw_text('PC-box', link_text, link_x, link_y)
 
-    def _draw_link_arrow(self, link_text, y, h):
+    def _draw_link_arrow(self, link_text, location, path):
         """Draw a path on the document that points to the next page
         where the ancestors continue.
 
         link_text - a string with the page number
-        y - the vertical position of the referenced person box
-        h - the height of the person box, used to calculate the arrows position
+        location - the (x, y) position of the link text
+        path - the outline of the arrow at this position
 
         """
-        # calculate the size of the link text
-        w = pt2cm(self.doc.string_width(self.get_font('PC-box'), link_text))
-        link_x = self.doc.get_usable_width() - w
-        link_y = y + h / 2
-        # calculate the position of the arrow
-        loc = np.matrix([link_x, link_y])
-        path = _ARROW + loc
-        self.doc.draw_path('PC-line', path.A)
+        self.doc.draw_path('PC-line', path)
         # write the text inside the arrow
+        (link_x, link_y) = location
         self.doc.draw_text('PC-box', link_text, link_x, link_y)
 
 #------------------------------------------------------------------------
@@ -0,0 +1,354 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2010       Jakim Friant
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+# $Id$
+
+"""
+Layout engine of the PedigreeChart report.
+
+The boxes, connectors and arrows of a slot (the index of a person on a page,
+1-15) are at the same place on every page, so their geometry is computed once
+for all of the slots. The pages are then assigned to the ancestors level by
+level: the pages of a level are filled, and the pages they link to numbered,
+all at once.
+
+NumPy arrays are used if the numpy package can be imported, plain tuples
+otherwise.
+
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GENERATIONS_PER_PAGE = 4
+SLOTS_PER_PAGE = 2**GENERATIONS_PER_PAGE
+LINKS_BEGIN = 8
+MIN_PERSON_LIMIT = 1
+
+# Outline of the arrows linking the pages, pointing right
+ARROW = ((-0.5 ,  0.55),
+         ( 0.0 ,  0.55),
+         ( 0.0 ,  0.75),
+         ( 0.5 ,  0.25),
+         ( 0.0 , -0.25),
+         ( 0.0 , -0.05),
+         (-0.5 , -0.05),
+         (-0.5 ,  0.55))
+
+# The same arrow, pointing left
+LEFT_ARROW = tuple((-x, y) for (x, y) in ARROW)
+
+def place_arrows(arrow, locations):
+    """
+    Return the outlines of the arrow moved to each of the (x, y) locations.
+    """
+    if np is not None:
+        if not len(locations):
+            return []
+        return np.array(arrow)[np.newaxis, :, :] + \
+               np.array(locations, dtype=float)[:, np.newaxis, :]
+    return [[(x + lx, y + ly) for (x, y) in arrow] for (lx, ly) in locations]
+
+class PageLimitError(Exception):
+    """Raised when a chart would have more than the maximum number of pages."""
+
+#------------------------------------------------------------------------
+#
+# PageLinks class
+#
+#------------------------------------------------------------------------
+class PageLinks:
+    """
+    Manages a two-way index for the person handle and a corrisponding page link
+    that list the index where this person's tree resumes.
+
+    """
+    def __init__(self, depth, max_generations):
+        """
+        Create the indexes for each person handle and page link.
+
+        depth: used to track the number of subsequent pages to determine when
+               we reach the generation limit.
+
+        """
+        self._index_by_handle = dict()
+        self._index_by_page = dict()
+        self.depth = depth
+        self.gen_limit = max_generations - (depth * GENERATIONS_PER_PAGE)
+
+    def add(self, person_handle, current_page, link_to_page):
+        """
+        Add a new person and page link to the set of indexes.
+
+        person_map: a list of person_handles that will be printed on this page
+        page_link_counter: a generator that returns the next page number
+
+        """
+        self._index_by_handle[person_handle] = (current_page, link_to_page)
+        self._index_by_page[link_to_page] = person_handle
+
+    def __str__(self):
+        """Return a string with the person handles sorted by page order."""
+        links_out = self.handlesByPage()
+        return repr(links_out)
+
+    def empty(self):
+        """Return true if the length of the primary index is 0."""
+        return (len(self._index_by_handle) > 0)
+
+    def handlesByPage(self):
+        """Return a list of person handles in the order of their page number."""
+        return [self._index_by_page[k] for k in sorted(self._index_by_page.keys())]
+
+    def getHandle(self, page):
+        """Return a person handle for the given page number."""
+        return self._index_by_page[page]
+
+    def getSourcePage(self, p_handle):
+        """Return the source page number for the given handle."""
+        return self._index_by_handle[p_handle][0]
+
+    def getSource(self, p_handle):
+        """Return a string with the page number for the given person handle."""
+        if p_handle in self._index_by_handle:
+            source_text = str(self._index_by_handle[p_handle][0])
+        else:
+            source_text = ""
+        return source_text
+
+    def getLinkPage(self, p_handle):
+        """Return the page number that this person handle is linked to"""
+        return self._index_by_handle[p_handle][1]
+
+    def getLink(self, p_handle):
+        """Return a string with the link page number if the page limit has not been reached"""
+        if self.gen_limit > MIN_PERSON_LIMIT and p_handle in self._index_by_handle:
+            link_text = str(self._index_by_handle[p_handle][1])
+        else:
+            link_text = ""
+        return link_text
+
+#------------------------------------------------------------------------
+#
+# SlotGeometry class
+#
+#------------------------------------------------------------------------
+class SlotGeometry:
+    """
+    Positions and sizes of the boxes of the slots of a page, and of the
+    connectors between each box and the box of its descendant.
+
+    The arrays are indexed by slot, slot 0 is not used.
+
+    """
+    def __init__(self, coordinates, box_width, line_height, line_x_offset):
+        """
+        coordinates - dictionary giving the (x, y) position of each slot
+        box_width - width of the boxes
+        line_height - height of a line of text in the boxes: the boxes of
+                      the fathers have 4 lines (with the marriage), the
+                      boxes of the mothers and of the page person 3
+        line_x_offset - horizontal offset of the connectors on the boxes of
+                        the descendants
+
+        """
+        slots = range(SLOTS_PER_PAGE)
+        if np is not None:
+            slots = np.arange(SLOTS_PER_PAGE)
+            self.x = np.zeros(SLOTS_PER_PAGE)
+            self.y = np.zeros(SLOTS_PER_PAGE)
+            for (index, (x, y)) in coordinates.items():
+                self.x[index] = x
+                self.y[index] = y
+            self.w = np.full(SLOTS_PER_PAGE, float(box_width))
+            self.h = np.where(slots % 2, 3, 4) * line_height
+            # The connectors go from the middle of the left side of the box
+            # to the bottom (mothers) or top (fathers) of the descendant box
+            descendant = slots // 2
+            x1 = self.x
+            y1 = self.y + self.h / 2
+            x2 = self.x[descendant] + line_x_offset
+            y2 = np.where(slots % 2, self.y[descendant] + self.h[descendant],
+                          self.y[descendant])
+            self.connectors = np.stack([np.stack([x1, y1, x2, y1], axis=1),
+                                        np.stack([x2, y2, x2, y1], axis=1)],
+                                       axis=1)
+        else:
+            self.x = [0.0] * SLOTS_PER_PAGE
+            self.y = [0.0] * SLOTS_PER_PAGE
+            for (index, (x, y)) in coordinates.items():
+                self.x[index] = x
+                self.y[index] = y
+            self.w = [float(box_width)] * SLOTS_PER_PAGE
+            self.h = [(3 if i % 2 else 4) * line_height for i in slots]
+            self.connectors = []
+            for i in slots:
+                d = i // 2
+                x1 = self.x[i]
+                y1 = self.y[i] + self.h[i] / 2
+                x2 = self.x[d] + line_x_offset
+                y2 = self.y[d] + self.h[d] if i % 2 else self.y[d]
+                self.connectors.append(((x1, y1, x2, y1), (x2, y2, x2, y1)))
+
+    def box(self, index):
+        """Return the (x, y, w, h) of the box of a slot."""
+        return (float(self.x[index]), float(self.y[index]),
+                float(self.w[index]), float(self.h[index]))
+
+    def link_locations(self, indexes, text_widths, page_width):
+        """
+        Return the (x, y) locations of the arrows to the next pages, right
+        aligned on the page, for the boxes of the given slots.
+        """
+        if np is not None:
+            indexes = np.asarray(indexes, dtype=int)
+            return np.column_stack([
+                page_width - np.asarray(text_widths, dtype=float),
+                self.y[indexes] + self.h[indexes] / 2])
+        return [(page_width - w, self.y[i] + self.h[i] / 2)
+                for (i, w) in zip(indexes, text_widths)]
+
+#------------------------------------------------------------------------
+#
+# Page class
+#
+#------------------------------------------------------------------------
+class Page:
+    """
+    A page of the chart, with the person of each slot.
+
+    number - the page number
+    depth - number of pages before this one from the first page
+    source - the page number of the previous page where the page person is
+             shown, None for the first page
+    gen_limit - the generation limit for this page
+    slots - the person handle of each slot (None if empty)
+    links - the PageLinks of the persons continued on other pages
+
+    """
+    def __init__(self, number, depth, source, gen_limit, slots):
+        self.number = number
+        self.depth = depth
+        self.source = source
+        self.gen_limit = gen_limit
+        self.slots = slots
+        self.links = None
+
+    def indexes(self):
+        """Return the slots having a person, in order."""
+        return [i for i in range(1, SLOTS_PER_PAGE) if self.slots[i]]
+
+def assign_pages(root_handle, get_parents, max_generations, max_pages=None):
+    """
+    Return the printed pages of the chart, in order.
+
+    root_handle - the person on the first page
+    get_parents - function returning for a person handle a tuple (father
+                  handle, mother handle, continues), continues telling
+                  whether the person has a main parents family
+    max_generations - the generation limit of the chart
+    max_pages - the maximum number of pages, PageLimitError is raised if the
+                chart has more
+
+    The first page is numbered 1. The persons of slots 8-15 of a printed
+    page who have parents continue on new pages, numbered in the order of
+    their pages and slots, and each of these pages is numbered as its link.
+    The pages beyond the generation limit are numbered, but not printed.
+
+    """
+    pages = []
+    level = [(root_handle, None)]
+    depth = 0
+    next_number = 1
+    while level:
+        gen_limit = max_generations - depth * GENERATIONS_PER_PAGE
+        next_number += len(level)
+        if max_pages is not None and next_number - 1 > max_pages:
+            raise PageLimitError(next_number - 1)
+        # we only want to print the page if it shows more than one person
+        if gen_limit <= MIN_PERSON_LIMIT:
+            break
+        # Fill the slots of every page of the level, slot by slot, so that
+        # each column holds the persons of a slot on all of the pages
+        columns = [[None] * len(level) for i in range(SLOTS_PER_PAGE)]
+        columns[1] = [handle for (handle, source) in level]
+        for i in range(2, min(SLOTS_PER_PAGE, 2**gen_limit)):
+            which = i % 2
+            columns[i] = [get_parents(handle)[which] if handle else None
+                          for handle in columns[i // 2]]
+        level_pages = []
+        first = next_number - len(level)
+        for (p, ((handle, source), slots)) in enumerate(zip(level,
+                                                           zip(*columns))):
+            page = Page(first + p, depth, source, gen_limit, slots)
+            page.links = PageLinks(depth + 1, max_generations)
+            level_pages.append(page)
+        # Number the links to the pages of the next level
+        link_columns = [[bool(handle) and get_parents(handle)[2]
+                         for handle in column]
+                        for column in columns[LINKS_BEGIN:]]
+        if np is not None:
+            # flat indexes of the links, in the order of pages and slots
+            continues = np.array(link_columns, dtype=bool).T
+            flat = np.flatnonzero(continues)
+            links = zip((flat // len(link_columns)).tolist(),
+                        (flat % len(link_columns)).tolist())
+        else:
+            links = [(p, i) for p in range(len(level_pages))
+                     for i in range(len(link_columns))
+                     if link_columns[i][p]]
+        level = []
+        for (number, (p, i)) in enumerate(links, next_number):
+            page = level_pages[p]
+            handle = page.slots[LINKS_BEGIN + i]
+            page.links.add(handle, page.number, number)
+            level.append((handle, page.number))
+        pages.extend(level_pages)
+        depth += 1
+    return pages
+
+def place_links(pages, geometry, text_width, page_width):
+    """
+    Return a dictionary giving, for the (page number, slot) of each box
+    continued on another page, the link text, the (x, y)
+    location of the text and the outline of the arrow around it.
+
+    The arrows of all of the pages are placed at once.
+
+    text_width - function returning the width of a link text
+
+    """
+    keys = []
+    texts = []
+    indexes = []
+    for page in pages:
+        for index in page.indexes():
+            link_text = page.links.getLink(page.slots[index])
+            if link_text != "":
+                keys.append((page.number, index))
+                texts.append(link_text)
+                indexes.append(index)
+    locations = geometry.link_locations(indexes,
+                                        [text_width(text) for text in texts],
+                                        page_width)
+    return dict(zip(keys, zip(texts, locations,
+                              place_arrows(ARROW, locations))))
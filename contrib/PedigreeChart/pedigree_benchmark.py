@@ -0,0 +1,259 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2010       Jakim Friant
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""
+Pedigree Chart layout benchmark script
+
+Lays out the pages of charts of 10 to 20 generations of a synthetic
+ancestry with the _layout.py engine, with NumPy arrays and with plain
+tuples, and with the former page by page layout, and prints the time
+taken by each. The layout does not need Gramps, the drawing is left out.
+
+The script is to be launched from its directory
+
+Usage examples:
+- Compare the layouts for 10 to 20 generations
+    python pedigree_benchmark.py
+- Same with at most 5000 persons per generation, and no pedigree collapse
+    python pedigree_benchmark.py --width 5000 --collapse 0
+"""
+
+from __future__ import print_function
+import sys, time, random, argparse
+
+sys.path.append(".")
+
+import _layout
+
+# Page size of the report on A4 paper, in cm
+PAGE_WIDTH = 19.0
+PAGE_HEIGHT = 27.7
+LINE_HEIGHT = 9 / 28.35 * 1.4
+LINK_TEXT_WIDTH = 0.5
+
+#-------------------------------------------------------------------------
+#
+# Synthetic ancestry
+#
+#-------------------------------------------------------------------------
+def make_ancestry(generations, width, collapse, seed=0):
+    """
+    Return a dictionary giving the (father, mother, continues) of each person
+    of generations of ancestors of the person "I0", as returned by
+    PedigreeChart._get_parents.
+
+    Each generation has at most width persons, the parents being drawn at
+    random among them once the limit is reached, and the parents of a
+    person are then shared with another person with the collapse
+    probability.
+    """
+    rand = random.Random(seed)
+    parents = {}
+    current = ["I0"]
+    count = 1
+    for generation in range(generations):
+        size = min(2 * len(current), width)
+        previous = ["I%d" % i for i in range(count, count + size)]
+        count += size
+        families = []
+        for (i, handle) in enumerate(current):
+            if families and rand.random() < collapse:
+                parents[handle] = rand.choice(families)
+            elif 2 * i + 1 < size:
+                parents[handle] = (previous[2 * i], previous[2 * i + 1], True)
+            else:
+                parents[handle] = tuple(rand.sample(previous, 2)) + (True,)
+            families.append(parents[handle])
+        current = previous
+    for handle in current:
+        parents[handle] = (None, None, False)
+    return parents
+
+#-------------------------------------------------------------------------
+#
+# Layouts
+#
+#-------------------------------------------------------------------------
+def make_coordinates():
+    """Return the coordinates of the slots, as PedigreeChart computes them."""
+    columns = [0.25] + [PAGE_WIDTH * n / 40 for n in (6, 12, 25, 32)]
+    heights = [32, 16, 48, 8, 24, 40, 56, 4, 13, 20, 28, 36, 45, 52, 60]
+    return dict((index, (columns[len(bin(index)) - 3],
+                         PAGE_HEIGHT * heights[index - 1] / 64))
+                for index in range(1, 16))
+
+class Lookups:
+    """
+    Return the parents of the persons, counting the lookups, each of which
+    reads a person and a family from the database in the report.
+    """
+    def __init__(self, parents):
+        self.parents = parents
+        self.count = 0
+
+    def __call__(self, handle):
+        self.count += 1
+        return self.parents[handle]
+
+def engine_layout(parents, max_generations):
+    """
+    Lay out the chart with _layout.py, and return the number of pages
+    printed, of items (boxes, connectors and arrows) placed on them and of
+    lookups of the parents.
+    """
+    geometry = _layout.SlotGeometry(make_coordinates(),
+                                    PAGE_WIDTH * 7 / 40 - 0.25,
+                                    LINE_HEIGHT, 1)
+    cache = {}
+    lookups = Lookups(parents)
+    def get_parents(handle):
+        if handle not in cache:
+            cache[handle] = lookups(handle)
+        return cache[handle]
+    pages = _layout.assign_pages("I0", get_parents, max_generations)
+    links = _layout.place_links(pages, geometry,
+                                lambda text: LINK_TEXT_WIDTH, PAGE_WIDTH)
+    printed = items = 0
+    for page in pages:
+        printed += 1
+        for index in page.indexes():
+            geometry.box(index)
+            if index > 1:
+                items += len(geometry.connectors[index])
+            items += 1
+    items += len(links)
+    return (printed, items, lookups.count)
+
+def former_layout(parents, max_generations):
+    """
+    Lay out the chart page by page as PedigreeChart did before _layout.py:
+    the slots of each page are filled recursively, and the geometry of
+    each box, connector and arrow is computed when it is drawn.
+    """
+    numpy = _layout.np
+    coordinates = make_coordinates()
+    box_width = PAGE_WIDTH * 7 / 40 - 0.25
+    lookups = Lookups(parents)
+    pages = [("I0", 0, None)]
+    number = 0
+    link_number = 2
+    printed = items = 0
+    while number < len(pages):
+        (handle, depth, source) = pages[number]
+        number += 1
+        gen_limit = max_generations - depth * _layout.GENERATIONS_PER_PAGE
+        slots = {}
+        def fill(handle, index):
+            if (not handle or index >= _layout.SLOTS_PER_PAGE or
+                index >= 2**gen_limit):
+                return
+            slots[index] = handle
+            (father, mother, continues) = lookups(handle)
+            fill(father, index * 2)
+            fill(mother, index * 2 + 1)
+        fill(handle, 1)
+        if gen_limit <= _layout.MIN_PERSON_LIMIT:
+            continue
+        printed += 1
+        links = {}
+        for index in range(_layout.LINKS_BEGIN, _layout.SLOTS_PER_PAGE):
+            if index in slots and lookups(slots[index])[2]:
+                links[slots[index]] = link_number
+                pages.append((slots[index], depth + 1, number))
+                link_number += 1
+        def size(index):
+            return (box_width, LINE_HEIGHT * (3 if index % 2 else 4))
+        arrows = []
+        for index in sorted(slots):
+            (x, y) = coordinates[index]
+            (w, h) = size(index)
+            items += 1
+            if (gen_limit - _layout.GENERATIONS_PER_PAGE >
+                _layout.MIN_PERSON_LIMIT and slots[index] in links):
+                location = (PAGE_WIDTH - LINK_TEXT_WIDTH, y + h / 2)
+                if numpy is not None:
+                    arrows.append((numpy.matrix(_layout.ARROW) +
+                                   numpy.matrix(location)).A)
+                else:
+                    arrows.append([(px + location[0], py + location[1])
+                                   for (px, py) in _layout.ARROW])
+            if index > 1:
+                (dx, dy) = coordinates[index // 2]
+                (dw, dh) = size(index // 2)
+                y2 = dy + dh if index % 2 else dy
+                lines = ((x, y + h / 2, dx + 1, y + h / 2),
+                         (dx + 1, y2, dx + 1, y + h / 2))
+                items += len(lines)
+        items += len(arrows)
+    return (printed, items, lookups.count)
+
+def bench(name, function, parents, max_generations, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = function(parents, max_generations)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("  %-8s %5d pages, %7d items, %7d lookups in %.3f s" %
+          ((name,) + result + (best,)))
+    return result[:2]
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pedigree Chart layout benchmarks")
+    parser.add_argument("--min", type=int, default=10,
+                        help="smallest number of generations")
+    parser.add_argument("--max", type=int, default=20,
+                        help="largest number of generations")
+    parser.add_argument("--width", type=int, default=20000,
+                        help="maximum number of persons in a generation")
+    parser.add_argument("--collapse", type=float, default=0.02,
+                        help="probability of sharing the parents of "
+                             "another person")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    numpy = _layout.np
+    start = time.time()
+    parents = make_ancestry(args.max, args.width, args.collapse, args.seed)
+    print("synthetic ancestry of %d persons in %.2f s" %
+          (len(parents), time.time() - start))
+    for generations in range(args.min, args.max + 1):
+        print("%d generations:" % generations)
+        # the report option is one less than its generation limit
+        max_generations = generations + 1
+        results = []
+        # the former layout placed the arrows with NumPy matrices if it could
+        _layout.np = numpy
+        results.append(bench("former", former_layout, parents,
+                             max_generations, args.repeat))
+        if numpy is not None:
+            results.append(bench("numpy", engine_layout, parents,
+                                 max_generations, args.repeat))
+        _layout.np = None
+        results.append(bench("tuples", engine_layout, parents,
+                             max_generations, args.repeat))
+        if len(set(results)) != 1:
+            print("  the layouts differ!")
+    _layout.np = numpy
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,22 @@
 
 import sqlite3 as sqlite
 import time
+import re
+import random
+import threading
+import multiprocessing
+from collections import deque
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+#------------------------------------------------------------------------
+#
+# GTK modules
+#
+#------------------------------------------------------------------------
+from gi.repository import Gtk
 
 #------------------------------------------------------------------------
 #
@@ -50,7 +66,11 @@ log = logging.getLogger(".ExportSql")
 # Gramps modules
 #
 #------------------------------------------------------------------------
+import gramps.gen.utils.id
 from gramps.gen.utils.id import create_id
+from gramps.gui.plug.export import WriterOptionBox
+from gramps.gen.lib import EventType
+from gramps.gen.proxy.proxybase import ProxyDbBase
 from gramps.gen.const import GRAMPS_LOCALE as glocale
 try:
     trans = glocale.get_addon_translator(__file__)
@@ -59,6 +79,8 @@ except ValueError:
 _ = trans.gettext
 ngettext = trans.ngettext
 
+INSERT_TABLE = re.compile(r"\s*insert\s+into\s+(\w+)", re.IGNORECASE)
+
 #-------------------------------------------------------------------------
 #
 # Export functions
@@ -106,6 +128,8 @@ def makeDB(db):
     db.query("""drop table url;""")
     db.query("""drop table datamap;""")
     db.query("""drop table tag;""")
+    db.query("""drop table export_meta;""")
+    dropSummaries(db)
 
     db.query("""CREATE TABLE note (
                   handle CHARACTER(25) PRIMARY KEY,
@@ -143,9 +167,6 @@ def makeDB(db):
                   origin_type1 TEXT,
                   connector TEXT);""")
 
-    db.query("""CREATE INDEX idx_surname_handle ON 
-                  surname(handle);""")
-
     db.query("""CREATE TABLE date (
                   handle CHARACTER(25) PRIMARY KEY,
                   calendar INTEGER, 
@@ -256,9 +277,6 @@ def makeDB(db):
                  to_type CHARACTER(25), 
                  to_handle CHARACTER(25));""")
 
-    db.query("""CREATE INDEX idx_link_to ON 
-                  link(from_type, from_handle, to_type);""")
-
     db.query("""CREATE TABLE markup (
                  handle CHARACTER(25) PRIMARY KEY,
                  markup0 INTEGER, 
@@ -351,6 +369,232 @@ def makeDB(db):
                  change INTEGER);
                  """)
 
+    # Export information, such as the high-water mark of the changes:
+    db.query("""CREATE TABLE export_meta (
+                 key_field TEXT PRIMARY KEY,
+                 value_field TEXT);
+                 """)
+
+def makeIndexes(db):
+    """
+    Create the secondary indexes, once the tables are loaded.
+    The handle of date, markup and the other secondary tables is their
+    primary key, and the secondary objects are reached through the link
+    table, so the link indexes serve both directions.
+    """
+    db.query("""CREATE INDEX idx_link_to ON 
+                  link(from_type, from_handle, to_type);""")
+    db.query("""CREATE INDEX idx_link_to_handle ON 
+                  link(to_type, to_handle);""")
+    db.query("""CREATE INDEX idx_surname_handle ON 
+                  surname(handle);""")
+    db.query("""CREATE INDEX idx_event_ref_ref ON 
+                  event_ref(ref);""")
+    db.query("""CREATE INDEX idx_child_ref_ref ON 
+                  child_ref(ref);""")
+    db.query("""CREATE INDEX idx_media_ref_ref ON 
+                  media_ref(ref);""")
+    db.query("""CREATE INDEX idx_repository_ref_ref ON 
+                  repository_ref(ref);""")
+    db.query("""CREATE INDEX idx_family_father ON 
+                  family(father_handle);""")
+    db.query("""CREATE INDEX idx_family_mother ON 
+                  family(mother_handle);""")
+    db.query("""CREATE INDEX idx_citation_source ON 
+                  citation(source_handle);""")
+    for table in ["note", "person", "event", "family", "repository",
+                  "place", "citation", "source", "media"]:
+        db.query("""CREATE INDEX idx_%s_gid ON %s(gid);""" % (table, table))
+
+SUMMARY_TABLES = ["person_summary", "family_summary", "citation_usage"]
+
+def dropSummaries(db):
+    for table in SUMMARY_TABLES:
+        db.query("""drop table %s;""" % table)
+
+def makeSummaries(db):
+    """
+    Create the summary tables, denormalized from the exported tables
+    so that they can be queried without joins:
+     - person_summary: primary name, birth and death date and place
+     - family_summary: parents names, marriage date and place, number
+       of children
+     - citation_usage: number of references to each citation, per type
+       of referencing object
+    They are rebuilt from the other tables at each export, once these
+    are indexed.
+    """
+    dropSummaries(db)
+
+    # Helper tables; the first row inserted for a key wins
+    db.query("""CREATE TEMP TABLE primary_name (
+                 person_handle CHARACTER(25) PRIMARY KEY,
+                 first_name TEXT,
+                 surname TEXT);""")
+    db.query("""INSERT OR IGNORE INTO primary_name
+                 SELECT link.from_handle, name.first_name,
+                        (SELECT surname.surname FROM surname
+                         WHERE surname.handle = name.handle
+                         ORDER BY surname.primary_surname DESC,
+                                  surname.rowid LIMIT 1)
+                 FROM link JOIN name ON name.handle = link.to_handle
+                 WHERE link.from_type = 'person' AND link.to_type = 'name'
+                   AND name.primary_name
+                 ORDER BY link.rowid;""")
+    db.query("""CREATE TEMP TABLE event_summary (
+                 handle CHARACTER(25) PRIMARY KEY,
+                 the_type0 INTEGER,
+                 sortval INTEGER,
+                 year INTEGER,
+                 place_handle CHARACTER(25),
+                 place TEXT);""")
+    db.query("""INSERT OR IGNORE INTO event_summary
+                 SELECT event.handle, event.the_type0,
+                        NULLIF(date.sortval, 0), NULLIF(date.year1, 0),
+                        place.handle, place.title
+                 FROM event
+                 LEFT JOIN link AS date_link ON 
+                     date_link.from_type = 'event' AND
+                     date_link.from_handle = event.handle AND
+                     date_link.to_type = 'date'
+                 LEFT JOIN date ON date.handle = date_link.to_handle
+                 LEFT JOIN link AS place_link ON 
+                     place_link.from_type = 'event' AND
+                     place_link.from_handle = event.handle AND
+                     place_link.to_type = 'place'
+                 LEFT JOIN place ON place.handle = place_link.to_handle;""")
+
+    db.query("""CREATE TABLE person_summary (
+                 handle CHARACTER(25) PRIMARY KEY,
+                 gid CHARACTER(25),
+                 gender INTEGER,
+                 first_name TEXT,
+                 surname TEXT,
+                 birth_sortval INTEGER,
+                 birth_year INTEGER,
+                 birth_place_handle CHARACTER(25),
+                 birth_place TEXT,
+                 death_sortval INTEGER,
+                 death_year INTEGER,
+                 death_place_handle CHARACTER(25),
+                 death_place TEXT);""")
+    db.query("""INSERT INTO person_summary
+                 SELECT person.handle, person.gid, person.gender,
+                        primary_name.first_name, primary_name.surname,
+                        birth.sortval, birth.year, 
+                        birth.place_handle, birth.place,
+                        death.sortval, death.year, 
+                        death.place_handle, death.place
+                 FROM person
+                 LEFT JOIN primary_name ON 
+                     primary_name.person_handle = person.handle
+                 LEFT JOIN event_summary AS birth ON 
+                     birth.handle = person.birth_ref_handle
+                 LEFT JOIN event_summary AS death ON 
+                     death.handle = person.death_ref_handle;""")
+
+    # The first marriage event of each family:
+    db.query("""CREATE TEMP TABLE family_marriage (
+                 family_handle CHARACTER(25) PRIMARY KEY,
+                 sortval INTEGER,
+                 year INTEGER,
+                 place_handle CHARACTER(25),
+                 place TEXT);""")
+    db.query("""INSERT OR IGNORE INTO family_marriage
+                 SELECT link.from_handle, event_summary.sortval,
+                        event_summary.year, event_summary.place_handle,
+                        event_summary.place
+                 FROM link 
+                 JOIN event_ref ON event_ref.handle = link.to_handle
+                 JOIN event_summary ON event_summary.handle = event_ref.ref
+                 WHERE link.from_type = 'family' AND 
+                       link.to_type = 'event_ref' AND 
+                       event_summary.the_type0 = ?
+                 ORDER BY link.rowid;""", EventType.MARRIAGE)
+    db.query("""CREATE TABLE family_summary (
+                 handle CHARACTER(25) PRIMARY KEY,
+                 gid CHARACTER(25),
+                 the_type0 INTEGER,
+                 the_type1 TEXT,
+                 father_handle CHARACTER(25),
+                 father_first_name TEXT,
+                 father_surname TEXT,
+                 mother_handle CHARACTER(25),
+                 mother_first_name TEXT,
+                 mother_surname TEXT,
+                 marriage_sortval INTEGER,
+                 marriage_year INTEGER,
+                 marriage_place_handle CHARACTER(25),
+                 marriage_place TEXT,
+                 child_count INTEGER);""")
+    db.query("""INSERT INTO family_summary
+                 SELECT family.handle, family.gid, 
+                        family.the_type0, family.the_type1,
+                        family.father_handle, 
+                        father.first_name, father.surname,
+                        family.mother_handle, 
+                        mother.first_name, mother.surname,
+                        family_marriage.sortval, family_marriage.year,
+                        family_marriage.place_handle, family_marriage.place,
+                        (SELECT COUNT(*) FROM link 
+                         WHERE link.from_type = 'family' AND 
+                               link.from_handle = family.handle AND
+                               link.to_type = 'child_ref')
+                 FROM family
+                 LEFT JOIN primary_name AS father ON 
+                     father.person_handle = family.father_handle
+                 LEFT JOIN primary_name AS mother ON 
+                     mother.person_handle = family.mother_handle
+                 LEFT JOIN family_marriage ON 
+                     family_marriage.family_handle = family.handle;""")
+
+    db.query("""CREATE TABLE citation_usage (
+                 citation_handle CHARACTER(25),
+                 gid CHARACTER(25),
+                 page TEXT,
+                 confidence INTEGER,
+                 source_handle CHARACTER(25),
+                 source_title TEXT,
+                 from_type CHARACTER(25),
+                 ref_count INTEGER);""")
+    db.query("""INSERT INTO citation_usage
+                 SELECT citation.handle, citation.gid, citation.page,
+                        citation.confidence, citation.source_handle, 
+                        source.title, link.from_type, COUNT(link.from_handle)
+                 FROM citation
+                 LEFT JOIN source ON source.handle = citation.source_handle
+                 LEFT JOIN link ON link.to_type = 'citation' AND
+                                   link.to_handle = citation.handle
+                 GROUP BY citation.handle, link.from_type;""")
+
+    for table in ["primary_name", "event_summary", "family_marriage"]:
+        db.query("""drop table temp.%s;""" % table)
+
+    db.query("""CREATE INDEX idx_person_summary_gid ON 
+                  person_summary(gid);""")
+    db.query("""CREATE INDEX idx_person_summary_surname ON 
+                  person_summary(surname, first_name);""")
+    db.query("""CREATE INDEX idx_person_summary_birth ON 
+                  person_summary(birth_sortval);""")
+    db.query("""CREATE INDEX idx_person_summary_birth_place ON 
+                  person_summary(birth_place_handle);""")
+    db.query("""CREATE INDEX idx_person_summary_death ON 
+                  person_summary(death_sortval);""")
+    db.query("""CREATE INDEX idx_person_summary_death_place ON 
+                  person_summary(death_place_handle);""")
+    db.query("""CREATE INDEX idx_family_summary_gid ON 
+                  family_summary(gid);""")
+    db.query("""CREATE INDEX idx_family_summary_father ON 
+                  family_summary(father_handle);""")
+    db.query("""CREATE INDEX idx_family_summary_mother ON 
+                  family_summary(mother_handle);""")
+    db.query("""CREATE INDEX idx_family_summary_marriage ON 
+                  family_summary(marriage_sortval);""")
+    db.query("""CREATE INDEX idx_citation_usage_citation ON 
+                  citation_usage(citation_handle);""")
+    db.query("""CREATE INDEX idx_citation_usage_source ON 
+                  citation_usage(source_handle);""")
+
 class Database(object):
     """
     The db connection.
@@ -358,9 +602,14 @@ class Database(object):
     def __init__(self, database):
         self.batch = False
         self.database = database
-        self.db = sqlite.connect(self.database)
+        # The pipeline export writes from a thread of its own
+        self.db = sqlite.connect(self.database, check_same_thread=False)
         self.cursor = self.db.cursor()
 
+    def flush(self):
+        """ Nothing is buffered """
+        pass
+
     def query(self, q, *args):
         args = list(args)
         if q.strip().upper().startswith("DROP"):
@@ -380,11 +629,80 @@ class Database(object):
                 raise
             return self.cursor.fetchall()
 
+    def query_many(self, q, rows):
+        """ Run a statement for each of the rows of arguments """
+        for args in rows:
+            self.query(q, *args)
+
     def close(self):
         """ Closes and writes out tables """
         self.cursor.close()
         self.db.close()
 
+class BatchDatabase(Database):
+    """
+    A db connection buffering the inserts of each statement, and writing
+    them with executemany, committing every transaction_size rows.
+    """
+    def __init__(self, database, batch_size=10000, transaction_size=100000):
+        Database.__init__(self, database)
+        self.batch = True
+        self.batch_size = batch_size
+        self.transaction_size = transaction_size
+        self.buffers = {}   # statement -> list of rows
+        self.pending = 0    # rows written since the last commit
+        self.stats = {}     # table -> [rows, seconds]
+
+    def query(self, q, *args):
+        match = INSERT_TABLE.match(q)
+        if match:
+            if q in self.buffers:
+                rows = self.buffers[q]
+            else:
+                rows = self.buffers[q] = []
+            rows.append(args)
+            if len(rows) >= self.batch_size:
+                self.flush_statement(q, match.group(1).lower())
+            return []
+        self.flush()
+        return Database.query(self, q, *args)
+
+    def query_many(self, q, rows):
+        match = INSERT_TABLE.match(q)
+        if not match:
+            return Database.query_many(self, q, rows)
+        self.buffers.setdefault(q, []).extend(rows)
+        if len(self.buffers[q]) >= self.batch_size:
+            self.flush_statement(q, match.group(1).lower())
+
+    def flush_statement(self, q, table):
+        rows = self.buffers.pop(q)
+        start = time.time()
+        try:
+            self.cursor.executemany(q, rows)
+        except:
+            print("ERROR: query :", q)
+            raise
+        stat = self.stats.setdefault(table, [0, 0.0])
+        stat[0] += len(rows)
+        stat[1] += time.time() - start
+        self.pending += len(rows)
+        if not self.batch or self.pending >= self.transaction_size:
+            self.db.commit()
+            self.pending = 0
+
+    def flush(self):
+        """ Write out all of the buffered rows """
+        for q in list(self.buffers.keys()):
+            self.flush_statement(q, INSERT_TABLE.match(q).group(1).lower())
+
+    def report(self):
+        """ Print the rows/sec written per table """
+        for table in sorted(self.stats):
+            rows, seconds = self.stats[table]
+            print("%-15s %9d rows %8.2f s %10.0f rows/s" %
+                  (table, rows, seconds, rows / max(seconds, 1e-6)))
+
 def export_location_list(db, from_type, from_handle, locations):
     for location in locations:
         export_location(db, from_type, from_handle, location)
@@ -448,8 +766,15 @@ def export_lds(db, from_type, from_handle, data):
 def export_citation_ref(db, from_type, from_handle, citation_handle):
     export_link(db, from_type, from_handle, "citation", citation_handle)
 
-def export_source(db, handle, gid, title, author, pubinfo, abbrev, change, 
-                  private):
+def export_source(db, data):
+    (handle, gid, title,
+     author, pubinfo,
+     note_list,
+     media_list,
+     abbrev,
+     change, datamap,
+     reporef_list,
+     private) = data
     db.query("""INSERT into source (
              handle, 
              gid, 
@@ -468,6 +793,10 @@ def export_source(db, handle, gid, title, author, pubinfo, abbrev, change,
              abbrev, 
              change,
              private)
+    export_list(db, "source", handle, "note", note_list) 
+    export_media_ref_list(db, "source", handle, media_list)
+    export_datamap_dict(db, "source", handle, datamap)
+    export_repository_ref_list(db, "source", handle, reporef_list)
 
 def export_note(db, data):
     (handle, gid, styled_text, format, note_type,
@@ -859,14 +1188,496 @@ def export_repository_ref_list(db, from_type, from_handle, reporef_list):
         # finally, link this to parent
         export_link(db, from_type, from_handle, "repository_ref", handle)
 
+def export_family(db, data):
+    (handle, gid, father_handle, mother_handle,
+     child_ref_list, the_type, event_ref_list, media_list,
+     attribute_list, lds_seal_list, citation_list, note_list,
+     change, tags, private) = data
+    # father_handle and/or mother_handle can be None
+    db.query("""INSERT INTO family (
+             handle, 
+             gid, 
+             father_handle, 
+             mother_handle,
+             the_type0, 
+             the_type1, 
+             change, 
+             tags, 
+             private) values (?,?,?,?,?,?,?,?,?);""",
+             handle, gid, father_handle, mother_handle,
+             the_type[0], the_type[1], change, ",".join(tags), 
+             private)
+
+    export_child_ref_list(db, "family", handle, "child_ref", child_ref_list)
+    export_list(db, "family", handle, "note", note_list)
+    export_attribute_list(db, "family", handle, attribute_list)
+    export_citation_list(db, "family", handle, citation_list)
+    export_media_ref_list(db, "family", handle, media_list)
+
+    # Event Reference information
+    for event_ref in event_ref_list:
+        export_event_ref(db, "family", handle, event_ref)
+        
+    # -------------------------------------
+    # LDS 
+    # -------------------------------------
+    for ldsord in lds_seal_list:
+        export_lds(db, "family", handle, ldsord)
+
+def export_repository(db, data):
+    (handle, gid, the_type, name, note_list,
+     address_list, urls, change, private) = data
+
+    db.query("""INSERT INTO repository (
+             handle, 
+             gid, 
+             the_type0, 
+             the_type1,
+             name, 
+             change, 
+             private) VALUES (?,?,?,?,?,?,?);""",
+             handle, gid, the_type[0], the_type[1],
+             name, change, private)
+    
+    export_list(db, "repository", handle, "note", note_list)
+    export_url_list(db, "repository", handle, urls)
+
+    for address in address_list:
+        export_address(db, "repository", handle, address)
+
+def export_place(db, data):
+    (handle, gid, title, long, lat,
+     main_loc, alt_location_list,
+     urls,
+     media_list,
+     citation_list,
+     note_list,
+     change, private) = data
+
+    db.query("""INSERT INTO place (
+             handle, 
+             gid, 
+             title, 
+             long, 
+             lat, 
+             change, 
+             private) values (?,?,?,?,?,?,?);""",
+             handle, gid, title, long, lat,
+             change, private)
+
+    export_url_list(db, "place", handle, urls)
+    export_media_ref_list(db, "place", handle, media_list)
+    export_citation_list(db, "place", handle, citation_list)
+    export_list(db, "place", handle, "note", note_list) 
+
+    # Main Location with parish:
+    # No need; we have the handle, but ok:
+    export_location(db, "place_main", handle, main_loc)
+    # But we need to link these:
+    export_location_list(db, "place_alt", handle, alt_location_list)
+
+def export_citation(db, data):
+    (handle,                           #  0
+     gid,                        #  1
+     date, #  2
+     page,                    #  3
+     confidence,                       #  4
+     source_handle,                    #  5
+     note_list,              #  6
+     media_list,             #  7
+     datamap,                          #  8
+     change,                           #  9
+     private) = data
+    db.query("""INSERT into citation (
+             handle, 
+             gid, 
+             source_handle,
+             confidence,
+             page,
+             change,
+             private
+             ) VALUES (?,?,?,?,?,?,?);""",
+             handle, 
+             gid,
+             source_handle,
+             confidence,
+             page,
+             change,
+             private)
+    export_datamap_dict(db, "citation", handle, datamap)
+    export_date(db, "citation", handle, date)
+    export_list(db, "citation", handle, "note", note_list) 
+    export_media_ref_list(db, "citation", handle, media_list) 
+
+def export_media(db, data):
+    (handle, gid, path, mime, desc,
+     attribute_list,
+     citation_list,
+     note_list,
+     change,
+     date,
+     tags,
+     private) = data
+
+    db.query("""INSERT INTO media (
+        handle, 
+        gid, 
+        path, 
+        mime, 
+        desc,
+        change, 
+        tags, 
+        private) VALUES (?,?,?,?,?,?,?,?);""",
+             handle, gid, path, mime, desc, 
+             change, ",".join(tags), private)
+    export_date(db, "media", handle, date)
+    export_list(db, "media", handle, "note", note_list) 
+    export_citation_list(db, "media", handle, citation_list)
+    export_attribute_list(db, "media", handle, attribute_list)
+
+def export_tag(db, data):
+    (handle, name, color, priority, change) = data
+    db.query("""INSERT INTO tag (
+        handle, 
+        name,
+        color,
+        priority,
+        change) VALUES (?,?,?,?,?);""",
+             handle, name, color, priority, change)
+
+#-------------------------------------------------------------------------
+#
+# Incremental export
+#
+#-------------------------------------------------------------------------
+# Secondary objects, owned by the object linking to them:
+OWNED_TYPES = ["address", "attribute", "child_ref", "datamap", "date",
+               "event_ref", "lds", "location", "markup", "media_ref", "name",
+               "person_ref", "repository_ref", "url"]
+
+# Places also link their locations under these types:
+LINK_FROM_TYPES = {"place": ["place", "place_main", "place_alt"]}
+
+def delete_links(db, from_type, from_handle):
+    """
+    Delete the links of an object, and the secondary objects it owns.
+    """
+    for link_type in LINK_FROM_TYPES.get(from_type, [from_type]):
+        rows = db.query("""select to_type, to_handle from link 
+                           where from_type = ? and from_handle = ?;""",
+                        link_type, from_handle)
+        for (to_type, to_handle) in rows:
+            if to_type in OWNED_TYPES:
+                delete_links(db, to_type, to_handle)
+                db.query("delete from %s where handle = ?;" % to_type,
+                         to_handle)
+        db.query("""delete from link 
+                    where from_type = ? and from_handle = ?;""",
+                 link_type, from_handle)
+    if from_type == "name":
+        db.query("delete from surname where handle = ?;", from_handle)
+
+def delete_object(db, table, handle):
+    """
+    Delete a primary object, with its links and secondary objects.
+    """
+    delete_links(db, table, handle)
+    db.query("delete from %s where handle = ?;" % table, handle)
+
+def get_meta(db, key_field):
+    """
+    Return a value of the export_meta table, or None.
+    """
+    if not db.query("""select name from sqlite_master 
+                       where type = 'table' and name = 'export_meta';"""):
+        return None
+    rows = db.query("select value_field from export_meta where key_field = ?;",
+                    key_field)
+    if rows:
+        return rows[0][0]
+    return None
+
+def set_meta(db, key_field, value_field):
+    db.query("""insert or replace into export_meta (
+                  key_field, 
+                  value_field) values (?, ?);""",
+             key_field, value_field)
+
+# (table, handles iterator, object getter, export function):
+PRIMARY_OBJECTS = [
+    ("note", "iter_note_handles", "get_note_from_handle", export_note),
+    ("event", "iter_event_handles", "get_event_from_handle", export_event),
+    ("person", "iter_person_handles", "get_person_from_handle", export_person),
+    ("family", "iter_family_handles", "get_family_from_handle", export_family),
+    ("repository", "iter_repository_handles", "get_repository_from_handle",
+     export_repository),
+    ("place", "iter_place_handles", "get_place_from_handle", export_place),
+    ("citation", "iter_citation_handles", "get_citation_from_handle",
+     export_citation),
+    ("source", "iter_source_handles", "get_source_from_handle", export_source),
+    ("media", "iter_media_object_handles", "get_object_from_handle",
+     export_media),
+    ("tag", "iter_tag_handles", "get_tag_from_handle", export_tag),
+    ]
+
+EXPORT_FUNCTIONS = dict((table, export_object) for
+                        (table, iter_handles, get_object, export_object)
+                        in PRIMARY_OBJECTS)
+
+#-------------------------------------------------------------------------
+#
+# Pipeline export
+#
+#-------------------------------------------------------------------------
+# Number of objects sent at once to a worker process:
+CHUNK_SIZE = 500
+# Number of chunks being flattened, and waiting to be written:
+QUEUE_SIZE = 32
+# Raw data map of the primary objects of each table, and the position of
+# the change time in their data (see the export functions):
+PRIMARY_MAPS = {
+    "note": ("note_map", 5),
+    "event": ("event_map", 10),
+    "person": ("person_map", 17),
+    "family": ("family_map", 12),
+    "repository": ("repository_map", 7),
+    "place": ("place_map", 11),
+    "citation": ("citation_map", 9),
+    "source": ("source_map", 8),
+    "media": ("media_map", 8),
+    "tag": ("tag_map", 4),
+    }
+
+class RowCollector(object):
+    """
+    Stands for the db connection in the worker processes: the rows are
+    collected per statement, to be written by the parent. The rows of
+    each table keep their order.
+    """
+    def __init__(self):
+        self.batch = True
+        self.statements = {}
+        self.rows = []  # [(statement, list of arguments)]
+
+    def query(self, q, *args):
+        if q not in self.statements:
+            self.statements[q] = []
+            self.rows.append((q, self.statements[q]))
+        self.statements[q].append(args)
+        return []
+
+class RowWriter(threading.Thread):
+    """
+    Thread writing the rows of the flattened chunks, in the order they
+    are put in its bounded queue.
+    """
+    def __init__(self, db):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.db = db
+        self.queue = Queue(QUEUE_SIZE)
+        self.error = None
+
+    def run(self):
+        while True:
+            rows = self.queue.get()
+            if rows is None:
+                break
+            if self.error is not None:
+                continue # keep draining, so that put() does not block
+            try:
+                for (q, args_list) in rows:
+                    self.db.query_many(q, args_list)
+            except Exception as error:
+                self.error = error
+
+    def put(self, rows):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(rows)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+def init_worker():
+    """
+    Reseed the generators of create_id in a forked worker, which would
+    otherwise create the same handles as the other workers.
+    """
+    random.seed()
+    for value in vars(gramps.gen.utils.id).values():
+        if isinstance(value, random.Random):
+            value.seed()
+
+def make_pool(processes):
+    """
+    Return a pool of processes, or None to work in this process (also
+    by default on a single processor).
+    The workers are forked, so that they share the loaded addon.
+    """
+    if processes == 1 or (processes is None and
+                          multiprocessing.cpu_count() == 1):
+        return None
+    try:
+        context = multiprocessing.get_context("fork")
+    except (AttributeError, ValueError):
+        return None
+    return context.Pool(processes, init_worker)
+
+def iter_chunks(database):
+    """
+    Yield (table, serialized objects) for chunks of at most CHUNK_SIZE
+    primary objects, in export order. The raw data are read from the
+    maps of the database, the workers flatten them without the objects
+    being created here. A filtered database (a proxy) has no maps: its
+    objects are read and serialized.
+    """
+    raw = not isinstance(database, ProxyDbBase)
+    for (table, iter_handles, get_object, export_object) in PRIMARY_OBJECTS:
+        if raw:
+            the_map = getattr(database, PRIMARY_MAPS[table][0])
+            serials = (the_map[handle] for handle in the_map.keys())
+        else:
+            objects = (getattr(database, get_object)(handle)
+                       for handle in getattr(database, iter_handles)())
+            serials = (obj.serialize() for obj in objects if obj is not None)
+        chunk = []
+        for data in serials:
+            chunk.append(data)
+            if len(chunk) == CHUNK_SIZE:
+                yield (table, chunk)
+                chunk = []
+        if chunk:
+            yield (table, chunk)
+
+def flatten_chunk(table, chunk):
+    """
+    Return the number of objects of a chunk, the rows they are exported
+    to, and their highest change time.
+    """
+    collector = RowCollector()
+    export_object = EXPORT_FUNCTIONS[table]
+    change_index = PRIMARY_MAPS[table][1]
+    change = -1
+    for data in chunk:
+        export_object(collector, data)
+        change = max(change, data[change_index])
+    return (len(chunk), collector.rows, change)
+
+def write_chunks(db, pool, chunks, callback=None):
+    """
+    Flatten the chunks in the pool of processes, and write their rows
+    with a single writer thread, in the order of the chunks. At most
+    QUEUE_SIZE chunks are being flattened at a time, and as many are
+    waiting to be written.
+    Return the number of objects written and their highest change time.
+    """
+    if not callable(callback): 
+        callback = lambda count: None # dummy
+    writer = RowWriter(db)
+    writer.start()
+    pending = deque()
+    count = 0
+    high_water_mark = -1
+    try:
+        for (table, chunk) in chunks:
+            pending.append(pool.apply_async(flatten_chunk, (table, chunk)))
+            while len(pending) >= QUEUE_SIZE or (pending and
+                                                 pending[0].ready()):
+                (size, rows, change) = pending.popleft().get()
+                writer.put(rows)
+                count += size
+                high_water_mark = max(high_water_mark, change)
+                callback(count)
+        while pending:
+            (size, rows, change) = pending.popleft().get()
+            writer.put(rows)
+            count += size
+            high_water_mark = max(high_water_mark, change)
+            callback(count)
+    finally:
+        writer.close()
+    return (count, high_water_mark)
+
+#-------------------------------------------------------------------------
+#
+# SqliteWriter Options
+#
+#-------------------------------------------------------------------------
+class SqliteWriterOptionBox(WriterOptionBox):
+    """
+    Create a VBox with the option widgets and define methods to retrieve
+    the options. 
+    
+    """
+    def __init__(self, person, dbstate, uistate):
+        """
+        Initialize the local options.
+        """
+        super(SqliteWriterOptionBox, self).__init__(person, dbstate, uistate)
+        self.incremental = 0
+        self.incremental_check = None
+        self.summaries = 0
+        self.summaries_check = None
+
+    def get_option_box(self):
+        option_box = super(SqliteWriterOptionBox, self).get_option_box()
+        # Make options:
+        self.incremental_check = Gtk.CheckButton(
+            _("Update a previous export in place"))
+        self.summaries_check = Gtk.CheckButton(_("Include summary tables"))
+        # Set defaults:
+        self.incremental_check.set_active(0)
+        self.summaries_check.set_active(0)
+        # Add to gui:
+        option_box.pack_start(self.incremental_check, False, False, 0)
+        option_box.pack_start(self.summaries_check, False, False, 0)
+        # Return option box:
+        return option_box
+
+    def parse_options(self):
+        """
+        Get the options and store locally.
+        """
+        super(SqliteWriterOptionBox, self).parse_options()
+        if self.incremental_check:
+            self.incremental = self.incremental_check.get_active()
+        if self.summaries_check:
+            self.summaries = self.summaries_check.get_active()
+
 def exportData(database, filename, err_dialog=None, option_box=None, 
-               callback=None):
+               callback=None, batch_size=10000, transaction_size=100000,
+               incremental=False, processes=None, summaries=False):
+    """
+    Export the database in SQLite format. With a batch_size, the rows
+    are buffered and written batch_size at a time per table, committing
+    every transaction_size rows; with no batch_size, every row is written
+    with its own statement.
+
+    With incremental, a previous export in filename is updated in place:
+    only the objects changed since its high-water mark (included) are
+    written again, and the objects no longer in the database are deleted.
+    The incremental and summaries options of the option box override
+    the arguments.
+
+    A new export is flattened into rows by a pool of processes (all of
+    the processors by default, none if processes is 1), and written by a
+    single thread.
+
+    With summaries, the denormalized summary tables of makeSummaries()
+    are added to the export.
+    """
     if not callable(callback): 
         callback = lambda percent: None # dummy
 
     if option_box:
         option_box.parse_options()
         database = option_box.get_filtered_database(database)
+        incremental = option_box.incremental
+        summaries = option_box.summaries
 
     start = time.time()
     total = (len(database.get_note_handles()) + 
@@ -881,287 +1692,91 @@ def exportData(database, filename, err_dialog=None, option_box=None,
              len(database.get_source_handles()))
     count = 0.0
 
-    db = Database(filename)
-    makeDB(db)
+    if batch_size:
+        db = BatchDatabase(filename, batch_size, transaction_size)
+    else:
+        db = Database(filename)
+
+    mark = None
+    if incremental:
+        mark = get_meta(db, "high_water_mark")
+    if mark is None:
+        if batch_size:
+            # Only the final file of a new export matters; trade safety
+            # for speed while writing:
+            db.query("""PRAGMA journal_mode = MEMORY;""")
+            db.query("""PRAGMA synchronous = OFF;""")
+        makeDB(db)
+        mark = -1
+    else:
+        mark = int(mark)
+    high_water_mark = mark
+    updated = deleted = 0
 
     db.batch = True # don't commit till end
-    # ---------------------------------
-    # Notes
-    # ---------------------------------
-    for note_handle in database.iter_note_handles():
-        data = database.get_note_from_handle(note_handle)
-        if data is None:
-            continue
-        export_note(db, data.serialize())
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Event
-    # ---------------------------------
-    for event_handle in database.iter_event_handles():
-        data = database.get_event_from_handle(event_handle)
-        if data is None:
-            continue
-        export_event(db, data.serialize())
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Person
-    # ---------------------------------
-    for person_handle in database.iter_person_handles():
-        person = database.get_person_from_handle(person_handle)
-        if person is None:
-            continue
-        export_person(db, person.serialize())
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Family
-    # ---------------------------------
-    for family_handle in database.iter_family_handles():
-        family = database.get_family_from_handle(family_handle)
-        if family is None:
-            continue
-        (handle, gid, father_handle, mother_handle,
-         child_ref_list, the_type, event_ref_list, media_list,
-         attribute_list, lds_seal_list, citation_list, note_list,
-         change, tags, private) = family.serialize()
-        # father_handle and/or mother_handle can be None
-        db.query("""INSERT INTO family (
-                 handle, 
-                 gid, 
-                 father_handle, 
-                 mother_handle,
-                 the_type0, 
-                 the_type1, 
-                 change, 
-                 tags, 
-                 private) values (?,?,?,?,?,?,?,?,?);""",
-                 handle, gid, father_handle, mother_handle,
-                 the_type[0], the_type[1], change, ",".join(tags), 
-                 private)
-
-        export_child_ref_list(db, "family", handle, "child_ref", child_ref_list)
-        export_list(db, "family", handle, "note", note_list)
-        export_attribute_list(db, "family", handle, attribute_list)
-        export_citation_list(db, "family", handle, citation_list)
-        export_media_ref_list(db, "family", handle, media_list)
-
-        # Event Reference information
-        for event_ref in event_ref_list:
-            export_event_ref(db, "family", handle, event_ref)
-            
-        # -------------------------------------
-        # LDS 
-        # -------------------------------------
-        for ldsord in lds_seal_list:
-            export_lds(db, "family", handle, ldsord)
-
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Repository
-    # ---------------------------------
-    for repository_handle in database.iter_repository_handles():
-        repository = database.get_repository_from_handle(repository_handle)
-        if repository is None:
-            continue
-        (handle, gid, the_type, name, note_list,
-         address_list, urls, change, private) = repository.serialize()
-
-        db.query("""INSERT INTO repository (
-                 handle, 
-                 gid, 
-                 the_type0, 
-                 the_type1,
-                 name, 
-                 change, 
-                 private) VALUES (?,?,?,?,?,?,?);""",
-                 handle, gid, the_type[0], the_type[1],
-                 name, change, private)
-        
-        export_list(db, "repository", handle, "note", note_list)
-        export_url_list(db, "repository", handle, urls)
-
-        for address in address_list:
-            export_address(db, "repository", handle, address)
-
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Place 
-    # ---------------------------------
-    for place_handle in database.iter_place_handles():
-        place = database.get_place_from_handle(place_handle)
-        if place is None:
-            continue
-        (handle, gid, title, long, lat,
-         main_loc, alt_location_list,
-         urls,
-         media_list,
-         citation_list,
-         note_list,
-         change, private) = place.serialize()
-
-        db.query("""INSERT INTO place (
-                 handle, 
-                 gid, 
-                 title, 
-                 long, 
-                 lat, 
-                 change, 
-                 private) values (?,?,?,?,?,?,?);""",
-                 handle, gid, title, long, lat,
-                 change, private)
-
-        export_url_list(db, "place", handle, urls)
-        export_media_ref_list(db, "place", handle, media_list)
-        export_citation_list(db, "place", handle, citation_list)
-        export_list(db, "place", handle, "note", note_list) 
-
-        # Main Location with parish:
-        # No need; we have the handle, but ok:
-        export_location(db, "place_main", handle, main_loc)
-        # But we need to link these:
-        export_location_list(db, "place_alt", handle, alt_location_list)
-
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Citation
-    # ---------------------------------
-    for citation_handle in database.iter_citation_handles():
-        citation = database.get_citation_from_handle(citation_handle)
-        if citation is None:
-            continue
-        #(handle, gid, title,
-        # author, pubinfo,
-        # note_list,
-        # media_list,
-        # abbrev,
-        # change, datamap,
-        # reporef_list,
-        # private) 
-        (handle,                           #  0
-         gid,                        #  1
-         date, #  2
-         page,                    #  3
-         confidence,                       #  4
-         source_handle,                    #  5
-         note_list,              #  6
-         media_list,             #  7
-         datamap,                          #  8
-         change,                           #  9
-         private) = citation.serialize()
-        db.query("""INSERT into citation (
-                 handle, 
-                 gid, 
-                 source_handle,
-                 confidence,
-                 page,
-                 change,
-                 private
-                 ) VALUES (?,?,?,?,?,?,?);""",
-                 handle, 
-                 gid,
-                 source_handle,
-                 confidence,
-                 page,
-                 change,
-                 private)
-        export_datamap_dict(db, "citation", handle, datamap)
-        export_date(db, "citation", handle, date)
-        export_list(db, "citation", handle, "note", note_list) 
-        export_media_ref_list(db, "citation", handle, media_list) 
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Source
-    # ---------------------------------
-    for source_handle in database.iter_source_handles():
-        source = database.get_source_from_handle(source_handle)
-        if source is None:
-            continue
-        (handle, gid, title,
-         author, pubinfo,
-         note_list,
-         media_list,
-         abbrev,
-         change, datamap,
-         reporef_list,
-         private) = source.serialize()
-
-        export_source(db, handle, gid, title, author, pubinfo, abbrev, change, private)
-        export_list(db, "source", handle, "note", note_list) 
-        export_media_ref_list(db, "source", handle, media_list)
-        export_datamap_dict(db, "source", handle, datamap)
-        export_repository_ref_list(db, "source", handle, reporef_list)
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Media
-    # ---------------------------------
-    for media_handle in database.iter_media_object_handles():
-        media = database.get_object_from_handle(media_handle)
-        if media is None:
-            continue
-        (handle, gid, path, mime, desc,
-         attribute_list,
-         citation_list,
-         note_list,
-         change,
-         date,
-         tags,
-         private) = media.serialize()
-
-        db.query("""INSERT INTO media (
-            handle, 
-            gid, 
-            path, 
-            mime, 
-            desc,
-            change, 
-            tags, 
-            private) VALUES (?,?,?,?,?,?,?,?);""",
-                 handle, gid, path, mime, desc, 
-                 change, ",".join(tags), private)
-        export_date(db, "media", handle, date)
-        export_list(db, "media", handle, "note", note_list) 
-        export_citation_list(db, "media", handle, citation_list)
-        export_attribute_list(db, "media", handle, attribute_list)
-        count += 1
-        callback(100 * count/total)
-
-    # ---------------------------------
-    # Tags
-    # ---------------------------------
-    for tag_handle in database.iter_tag_handles():
-        tag_object = database.get_tag_from_handle(tag_handle)
-        if tag_object is None:
-            continue
-        (handle, name, color, priority, change) = tag_object.serialize()
-        db.query("""INSERT INTO tag (
-            handle, 
-            name,
-            color,
-            priority,
-            change) VALUES (?,?,?,?,?);""",
-                 handle, name, color, priority, change)
-        count += 1
-        callback(100 * count/total)
-
+    pool = None
+    if mark < 0:
+        pool = make_pool(processes)
+    if pool:
+        try:
+            (updated, high_water_mark) = write_chunks(
+                db, pool, iter_chunks(database),
+                lambda count: callback(100.0 * count/total))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for (table, iter_handles, get_object, export_object) in PRIMARY_OBJECTS:
+            if mark >= 0:
+                existing = set(row[0] for row in 
+                               db.query("select handle from %s;" % table))
+            else:
+                existing = set()
+            for handle in getattr(database, iter_handles)():
+                obj = getattr(database, get_object)(handle)
+                if obj is None:
+                    continue
+                data = obj.serialize()
+                change = obj.get_change_time()
+                high_water_mark = max(high_water_mark, change)
+                count += 1
+                callback(100 * count/total)
+                if data[0] in existing:
+                    existing.remove(data[0])
+                    # An object changed in the second of the mark may
+                    # have been changed after it was exported:
+                    if change < mark:
+                        continue
+                    delete_object(db, table, data[0])
+                export_object(db, data)
+                updated += 1
+            # What remains was deleted since the last export:
+            for handle in existing:
+                delete_object(db, table, handle)
+                deleted += 1
+
+    set_meta(db, "high_water_mark", str(high_water_mark))
+    set_meta(db, "export_time", str(int(start)))
     db.batch = False # turn off batch processing
+    db.flush()
+    if mark < 0:
+        makeIndexes(db)
+    if summaries:
+        makeSummaries(db)
+    else:
+        dropSummaries(db)
     db.db.commit() # commit all changes
+    if batch_size:
+        if mark < 0:
+            db.query("""PRAGMA synchronous = FULL;""")
+            db.query("""PRAGMA journal_mode = DELETE;""")
+        db.report()
+    db.close()
 
     total_time = time.time() - start
+    if mark >= 0:
+        print("Incremental export: %d objects written, %d deleted" % 
+              (updated, deleted))
     msg = ngettext('Export Complete: %d second','Export Complete: %d seconds', total_time ) % total_time
     print(msg)
     return True
@@ -26,8 +26,14 @@
 # Standard Python Modules
 #
 #-------------------------------------------------------------------------
+import sys
 import sqlite3 as sqlite
 import time
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
 #------------------------------------------------------------------------
 #
@@ -54,6 +60,33 @@ except ValueError:
 _ = trans.gettext
 ngettext = trans.ngettext
 
+#-------------------------------------------------------------------------
+#
+# Tables
+#
+#-------------------------------------------------------------------------
+# (table, map) of the primary objects, in import order:
+PRIMARY_TABLES = [
+    ("note", "note_map"),
+    ("event", "event_map"),
+    ("person", "person_map"),
+    ("family", "family_map"),
+    ("repository", "repository_map"),
+    ("place", "place_map"),
+    ("citation", "citation_map"),
+    ("source", "source_map"),
+    ("media", "media_map"),
+    ("tag", "tag_map"),
+    ]
+
+# Number of rows fetched at a time from a streamed query:
+FETCH_SIZE = 1000
+
+# Secondary tables read in one pass by the bulk loader:
+BULK_TABLES = ["address", "attribute", "child_ref", "datamap", "date",
+               "event_ref", "lds", "location", "markup", "media_ref", "name",
+               "person_ref", "repository_ref", "surname", "url"]
+
 #-------------------------------------------------------------------------
 #
 # Import functions
@@ -74,6 +107,19 @@ def lookup(handle, event_ref_list):
             count += 1
         return -1
 
+def peak_memory():
+    """
+    Return the peak resident memory of the process in MB, or None when it
+    is unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on Mac OS X, and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024.0
+
 def make_tag_list(tags):
     """
     """
@@ -112,6 +158,24 @@ class Database(object):
                 raise
             return self.cursor.fetchall()
 
+    def iter_query(self, q, args=(), size=FETCH_SIZE):
+        """
+        Yield the rows of a query, fetched size rows at a time with a
+        cursor of their own, so that the whole result is never held in
+        memory and that other queries can be run meanwhile.
+        """
+        cursor = self.db.cursor()
+        try:
+            cursor.execute(q, args)
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
     def close(self):
         """ Closes and writes out tables """
         self.cursor.close()
@@ -123,13 +187,20 @@ class Database(object):
 #
 #-------------------------------------------------------------------------
 class SQLReader(object):
-    def __init__(self, db, filename, callback):
+    def __init__(self, db, filename, callback, bulk=True):
         if not callable(callback): 
             callback = lambda percent: None # dummy
         self.db = db
         self.filename = filename
         self.callback = callback
         self.debug = 0
+        # When bulk is set, the secondary tables are loaded in memory
+        # by load_tables() instead of being queried per object. Otherwise
+        # the import streams: its memory use does not depend on the size
+        # of the tables.
+        self.bulk = bulk
+        self.links = None
+        self.tables = None
 
     def openSQL(self):
         sql = None
@@ -149,8 +220,7 @@ class SQLReader(object):
         results = self.get_links(sql, from_type, from_handle, "address")
         retval = []
         for handle in results:
-            result = sql.query("select * from address where handle = ?;",
-                               handle)
+            result = self.get_rows(sql, "address", handle)
             retval.append(self.pack_address(sql, result[0], with_parish))
         return retval
 
@@ -158,8 +228,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "attribute")
         retval = []
         for handle in handles:
-            rows = sql.query("select * from attribute where handle = ?;",
-                             handle)
+            rows = self.get_rows(sql, "attribute", handle)
             for row in rows:
                 (handle,
                  the_type0, 
@@ -176,8 +245,7 @@ class SQLReader(object):
         results = self.get_links(sql, from_type, from_handle, "child_ref")
         retval = []
         for handle in results:
-            rows = sql.query("select * from child_ref where handle = ?;",
-                             handle)
+            rows = self.get_rows(sql, "child_ref", handle)
             for row in rows:
                 (handle, ref, frel0, frel1, mrel0, mrel1, private) = row
                 citation_list = self.get_citation_list(sql, "child_ref", handle)
@@ -190,8 +258,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "datamap")
         datamap = {}
         for handle in handles:
-            row = sql.query("select * from datamap where handle = ?;",
-                            handle)
+            row = self.get_rows(sql, "datamap", handle)
             if len(row) == 1:
                 (handle, key_field, value_field) = row[0]
                 datamap[key_field] = value_field
@@ -203,8 +270,7 @@ class SQLReader(object):
         results = self.get_links(sql, from_type, from_handle, "event_ref")
         retval = []
         for handle in results:
-            result = sql.query("select * from event_ref where handle = ?;",
-                               handle)
+            result = self.get_rows(sql, "event_ref", handle)
             retval.append(self.pack_event_ref(sql, result[0]))
         return retval
 
@@ -218,8 +284,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "person_ref")
         retval = []
         for ref_handle in handles:
-            rows = sql.query("select * from person_ref where handle = ?;",
-                             ref_handle)
+            rows = self.get_rows(sql, "person_ref", ref_handle)
             for row in rows:
                 (handle,
                  description,
@@ -237,28 +302,25 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "location")
         results = []
         for handle in handles:
-            results += sql.query("""select * from location where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "location", handle)
         return [self.pack_location(sql, result, with_parish) for result in results]
 
     def get_lds_list(self, sql, from_type, from_handle):
         handles = self.get_links(sql, from_type, from_handle, "lds")
         results = []
         for handle in handles:
-            results += sql.query("""select * from lds where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "lds", handle)
         return [self.pack_lds(sql, result) for result in results]
 
     def get_media_list(self, sql, from_type, from_handle):
         handles = self.get_links(sql, from_type, from_handle, "media_ref")
         results = []
         for handle in handles:
-            results += sql.query("""select * from media_ref where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "media_ref", handle)
         return [self.pack_media_ref(sql, result) for result in results]
 
     def get_surname_list(self, sql, handle):
-        results = sql.query("""select * from surname where handle = ?;""", handle)
+        results = self.get_rows(sql, "surname", handle)
         return [self.pack_surnames(sql, result) for result in results]
 
     def get_note_list(self, sql, from_type, from_handle):
@@ -268,8 +330,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "repository_ref")
         results = []
         for handle in handles:
-            results += sql.query("""select * from repository_ref where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "repository_ref", handle)
         return [self.pack_repository_ref(sql, result) for result in results]
 
     def get_citation_list(self, sql, from_type, from_handle):
@@ -280,8 +341,7 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "url")
         results = []
         for handle in handles:
-            results += sql.query("""select * from url where handle = ?;""",
-                                 handle)
+            results += self.get_rows(sql, "url", handle)
         return [self.pack_url(sql, result) for result in results]
 
     # ---------------------------------
@@ -404,8 +464,7 @@ class SQLReader(object):
     def get_location(self, sql, from_type, from_handle, with_parish):
         handle = self.get_link(sql, from_type, from_handle, "location")
         if handle:
-            results = sql.query("""select * from location where handle = ?;""",
-                                handle)
+            results = self.get_rows(sql, "location", handle)
             if len(results) == 1:
                 return self.pack_location(sql, results[0], with_parish)
 
@@ -413,10 +472,8 @@ class SQLReader(object):
         handles = self.get_links(sql, from_type, from_handle, "name")
         names = []
         for handle in handles:
-            results = sql.query("""select * from name where handle = ? and primary_name = ?;""",
-                                handle, primary)
-            if len(results) > 0:
-                names += results
+            names += [row for row in self.get_rows(sql, "name", handle)
+                      if bool(row[1]) == bool(primary)]
         result = [self.pack_name(sql, name) for name in names]
         if primary:
             if len(result) == 1:
@@ -473,8 +530,7 @@ class SQLReader(object):
 
     def get_place_from_handle(self, sql, ref_handle):
         if ref_handle: 
-            place_row = sql.query("select * from place where handle = ?;",
-                                  ref_handle)
+            place_row = self.get_rows(sql, "place", ref_handle)
             if len(place_row) == 1:
                 # return just the handle here:
                 return place_row[0][0]
@@ -487,8 +543,7 @@ class SQLReader(object):
     def get_main_location(self, sql, from_handle, with_parish):
         ref_handle = self.get_link(sql, "place_main", from_handle, "location")
         if ref_handle: 
-            place_row = sql.query("select * from location where handle = ?;",
-                                  ref_handle)
+            place_row = self.get_rows(sql, "location", ref_handle)
             if len(place_row) == 1:
                 return self.pack_location(sql, place_row[0], with_parish)
             elif len(place_row) == 0:
@@ -514,14 +569,52 @@ class SQLReader(object):
         """
         Return a list of handles (possibly none).
         """
+        if self.links is not None:
+            return self.links.get((from_type, from_handle, to_link), [])
         results = sql.query("""select to_handle from link where from_type = ? and from_handle = ? and to_type = ?;""",
                             from_type, from_handle, to_link)
         return [result[0] for result in results]
 
+    def get_rows(self, sql, table, handle):
+        """
+        Return the rows of a table matching a handle (possibly none).
+        """
+        if self.tables is not None and table in self.tables:
+            return self.tables[table].get(handle, [])
+        return sql.query("select * from %s where handle = ?;" % table, handle)
+
+    def load_tables(self, sql):
+        """
+        Read the link table and all of the secondary tables in one pass
+        each, grouping the rows by handle, so that the get methods above
+        are answered from memory rather than with one query per object.
+        """
+        self.links = {}
+        for (from_type, from_handle, to_type, to_handle) in sql.query(
+                """select from_type, from_handle, to_type, to_handle 
+                   from link order by rowid;"""):
+            key = (from_type, from_handle, to_type)
+            if key in self.links:
+                self.links[key].append(to_handle)
+            else:
+                self.links[key] = [to_handle]
+        self.tables = {}
+        for table in BULK_TABLES:
+            rows = {}
+            for row in sql.query("select * from %s order by rowid;" % table):
+                if row[0] in rows:
+                    rows[row[0]].append(row)
+                else:
+                    rows[row[0]] = [row]
+            self.tables[table] = rows
+        # Places are only checked for existence:
+        self.tables["place"] = dict((row[0], [row]) for row in
+                                    sql.query("select handle from place;"))
+
     def get_date(self, sql, handle):
         assert type(handle) in [str, type(None)], "handle is wrong type: %s" % handle
         if handle: 
-            rows = sql.query("select * from date where handle = ?;", handle)
+            rows = self.get_rows(sql, "date", handle)
             if len(rows) == 1:
                 (handle,
                  calendar, 
@@ -547,349 +640,312 @@ class SQLReader(object):
             else:
                 print(Exception("ERROR, wrong number of dates: %s" % rows))
 
-    def process(self):
-        sql = self.openSQL() 
-        total = (sql.query("select count(*) from note;")[0][0] + 
-                 sql.query("select count(*) from person;")[0][0] + 
-                 sql.query("select count(*) from event;")[0][0] + 
-                 sql.query("select count(*) from family;")[0][0] + 
-                 sql.query("select count(*) from repository;")[0][0] + 
-                 sql.query("select count(*) from place;")[0][0] + 
-                 sql.query("select count(*) from media;")[0][0] + 
-                 sql.query("select count(*) from tag;")[0][0] + 
-                 sql.query("select count(*) from citation;")[0][0] +
-                 sql.query("select count(*) from source;")[0][0])
-        with DbTxn(_("CSV import"), self.db, batch=True) as self.trans:
-            self.db.disable_signals()
-            count = 0.0
-            self.t = time.time()
-            # ---------------------------------
-            # Process note
-            # ---------------------------------
-            notes = sql.query("""select * from note;""")
-            for note in notes:
-                (handle,
-                 gid, 
-                 text,
-                 format,
-                 note_type1, 
-                 note_type2,
-                 change,
-                 tags,
-                 private) = note
-                styled_text = [text, []]
-                # direct connection with note handle
-                markups = sql.query("""select * from markup where handle = ?""", handle)
-                for markup in markups:
-                    (mhandle,
-                     markup0,
-                     markup1,
-                     value, 
-                     start_stop_list) = markup
-                    ss_list = eval(start_stop_list)
-                    styled_text[1] += [((markup0, markup1), value, ss_list)]
-
-                handle = handle.encode()
-                self.db.note_map[handle] = (handle, gid, styled_text, 
-                                            format, (note_type1, note_type2), change, 
-                                            make_tag_list(tags), bool(private))
-                count += 1
-                self.callback(100 * count/total)
 
-            # ---------------------------------
-            # Process event
-            # ---------------------------------
-            events = sql.query("""select * from event;""")
-            for event in events:
-                (handle, 
-                 gid,
-                 the_type0,
-                 the_type1,
-                 description,
-                 change,
-                 private) = event
+    # ---------------------------------
+    # Primary objects
+    # ---------------------------------
 
-                note_list = self.get_note_list(sql, "event", handle)
-                citation_list = self.get_citation_list(sql, "event", handle)
-                media_list = self.get_media_list(sql, "event", handle)
-                attribute_list = self.get_attribute_list(sql, "event", handle)
+    def build_note(self, sql, row):
+        (handle,
+         gid, 
+         text,
+         format,
+         note_type1, 
+         note_type2,
+         change,
+         tags,
+         private) = row
+        styled_text = [text, []]
+        # markup is linked to the note, like any other secondary object
+        markups = []
+        for markup_handle in self.get_links(sql, "note", handle, "markup"):
+            markups += self.get_rows(sql, "markup", markup_handle)
+        for markup in markups:
+            (mhandle,
+             markup0,
+             markup1,
+             value, 
+             start_stop_list) = markup
+            ss_list = eval(start_stop_list)
+            styled_text[1] += [((markup0, markup1), value, ss_list)]
+
+        handle = handle.encode()
+        return (handle, gid, styled_text, 
+                format, (note_type1, note_type2), change, 
+                make_tag_list(tags), bool(private))
+
+    def build_event(self, sql, row):
+        (handle, 
+         gid,
+         the_type0,
+         the_type1,
+         description,
+         change,
+         private) = row
 
-                date_handle = self.get_link(sql, "event", handle, "date")
-                date = self.get_date(sql, date_handle)
+        note_list = self.get_note_list(sql, "event", handle)
+        citation_list = self.get_citation_list(sql, "event", handle)
+        media_list = self.get_media_list(sql, "event", handle)
+        attribute_list = self.get_attribute_list(sql, "event", handle)
 
-                place_handle = self.get_link(sql, "event", handle, "place")
-                place = self.get_place_from_handle(sql, place_handle)
+        date_handle = self.get_link(sql, "event", handle, "date")
+        date = self.get_date(sql, date_handle)
 
-                handle = handle.encode()
-                data = (handle, gid, (the_type0, the_type1), date, description, place, 
-                        citation_list, note_list, media_list, attribute_list,
-                        change, bool(private))
+        place_handle = self.get_link(sql, "event", handle, "place")
+        place = self.get_place_from_handle(sql, place_handle)
+
+        handle = handle.encode()
+        return (handle, gid, (the_type0, the_type1), date, description, place, 
+                citation_list, note_list, media_list, attribute_list,
+                change, bool(private))
+
+    def build_person(self, sql, row):
+        (handle,        #  0
+         gid,          #  1
+         gender,             #  2
+         death_ref_handle,    #  5
+         birth_ref_handle,    #  6
+         change,             # 17
+         tags,             # 18
+         private,           # 19
+         ) = row
+        primary_name = self.get_names(sql, "person", handle, True) # one
+        alternate_names = self.get_names(sql, "person", handle, False) # list
+        event_ref_list = self.get_event_ref_list(sql, "person", handle)
+        family_list = self.get_family_list(sql, "person", handle)
+        parent_family_list = self.get_parent_family_list(sql, "person", handle)
+        media_list = self.get_media_list(sql, "person", handle)
+        address_list = self.get_address_list(sql, "person", handle, with_parish=False)
+        attribute_list = self.get_attribute_list(sql, "person", handle)
+        urls = self.get_url_list(sql, "person", handle)
+        lds_ord_list = self.get_lds_list(sql, "person", handle)
+        pcitation_list = self.get_citation_list(sql, "person", handle)
+        pnote_list = self.get_note_list(sql, "person", handle)
+        person_ref_list = self.get_person_ref_list(sql, "person", handle)
+        death_ref_index = lookup(death_ref_handle, event_ref_list)
+        birth_ref_index = lookup(birth_ref_handle, event_ref_list)
+
+        handle = handle.encode()
+        return (handle,             #  0
+                gid,                #  1
+                gender,             #  2
+                primary_name,       #  3
+                alternate_names,    #  4
+                death_ref_index,    #  5
+                birth_ref_index,    #  6
+                event_ref_list,     #  7
+                family_list,        #  8
+                parent_family_list, #  9
+                media_list,         # 10
+                address_list,       # 11
+                attribute_list,     # 12
+                urls,               # 13
+                lds_ord_list,       # 14
+                pcitation_list,     # 15
+                pnote_list,         # 16
+                change,             # 17
+                make_tag_list(tags), # 18
+                bool(private),      # 19
+                person_ref_list,    # 20
+                )
+
+    def build_family(self, sql, row):
+        (handle,
+         gid,
+         father_handle,
+         mother_handle,
+         the_type0,
+         the_type1,
+         change,
+         tags,
+         private) = row
+
+        child_ref_list = self.get_child_ref_list(sql, "family", handle)
+        event_ref_list = self.get_event_ref_list(sql, "family", handle)
+        media_list = self.get_media_list(sql, "family", handle)
+        attribute_list = self.get_attribute_list(sql, "family", handle)
+        lds_seal_list = self.get_lds_list(sql, "family", handle)
+        citation_list = self.get_citation_list(sql, "family", handle)
+        note_list = self.get_note_list(sql, "family", handle)
+
+        handle = handle.encode()
+        return (handle, gid, 
+                father_handle, mother_handle,
+                child_ref_list, (the_type0, the_type1), 
+                event_ref_list, media_list,
+                attribute_list, lds_seal_list, 
+                citation_list, note_list,
+                change, make_tag_list(tags), private)
+
+    def build_repository(self, sql, row):
+        (handle, 
+         gid, 
+         the_type0, 
+         the_type1, 
+         name, 
+         change, 
+         private) = row
+
+        note_list = self.get_note_list(sql, "repository", handle)
+        address_list = self.get_address_list(sql, "repository", handle, with_parish=False)
+        urls = self.get_url_list(sql, "repository", handle)
+
+        handle = handle.encode()
+        return (handle, gid, 
+                (the_type0, the_type1),
+                name, note_list,
+                address_list, urls, change, 
+                private)
+
+    def build_place(self, sql, row):
+        (handle, 
+         gid, 
+         title, 
+         main_loc,
+         long, 
+         lat, 
+         change, 
+         private) = row
+
+        # We could look this up by "place_main", but we have the handle:
+        main_loc = self.get_main_location(sql, handle, with_parish=True)
+        alt_location_list = self.get_location_list(sql, "place_alt", handle, 
+                                                   with_parish=True)
+        urls = self.get_url_list(sql, "place", handle)
+        media_list = self.get_media_list(sql, "place", handle)
+        citation_list = self.get_citation_list(sql, "place", handle)
+        note_list = self.get_note_list(sql, "place", handle)
+
+        handle = handle.encode()
+        return (handle, gid, title, long, lat,
+                main_loc, alt_location_list,
+                urls,
+                media_list,
+                citation_list,
+                note_list,
+                change, 
+                private)
 
-                self.db.event_map[handle] = data
+    def build_citation(self, sql, row):
+        (handle, 
+         gid, 
+         confidence,
+         page,
+         source_handle,
+         change,
+         private) = row
+        date_handle = self.get_link(sql, "citation", handle, "date")
+        date = self.get_date(sql, date_handle)
+        note_list = self.get_note_list(sql, "citation", handle)
+        media_list = self.get_media_list(sql, "citation", handle)
+        datamap = self.get_datamap(sql, "citation", handle)
+
+        handle = handle.encode()
+        return (handle, 
+                gid, 
+                date,
+                page, 
+                confidence,
+                source_handle,
+                note_list,
+                media_list,
+                datamap,
+                change, 
+                private)
 
-                count += 1
-                self.callback(100 * count/total)
+    def build_source(self, sql, row):
+        (handle, 
+         gid,
+         title,
+         author,
+         pubinfo,
+         abbrev,
+         change,
+         private) = row
+        note_list = self.get_note_list(sql, "source", handle)
+        media_list = self.get_media_list(sql, "source", handle)
+        datamap = self.get_datamap(sql, "source", handle)
+        reporef_list = self.get_repository_ref_list(sql, "source", handle)
 
-            # ---------------------------------
-            # Process person
-            # ---------------------------------
-            people = sql.query("""select * from person;""")
-            for person in people:
-                if person is None:
-                    continue
-                (handle,        #  0
-                 gid,          #  1
-                 gender,             #  2
-                 death_ref_handle,    #  5
-                 birth_ref_handle,    #  6
-                 change,             # 17
-                 tags,             # 18
-                 private,           # 19
-                 ) = person
-                primary_name = self.get_names(sql, "person", handle, True) # one
-                alternate_names = self.get_names(sql, "person", handle, False) # list
-                event_ref_list = self.get_event_ref_list(sql, "person", handle)
-                family_list = self.get_family_list(sql, "person", handle)
-                parent_family_list = self.get_parent_family_list(sql, "person", handle)
-                media_list = self.get_media_list(sql, "person", handle)
-                address_list = self.get_address_list(sql, "person", handle, with_parish=False)
-                attribute_list = self.get_attribute_list(sql, "person", handle)
-                urls = self.get_url_list(sql, "person", handle)
-                lds_ord_list = self.get_lds_list(sql, "person", handle)
-                pcitation_list = self.get_citation_list(sql, "person", handle)
-                pnote_list = self.get_note_list(sql, "person", handle)
-                person_ref_list = self.get_person_ref_list(sql, "person", handle)
-                death_ref_index = lookup(death_ref_handle, event_ref_list)
-                birth_ref_index = lookup(birth_ref_handle, event_ref_list)
-
-                handle = handle.encode()
-                self.db.person_map[handle] = (handle,             #  0
-                                              gid,                #  1
-                                              gender,             #  2
-                                              primary_name,       #  3
-                                              alternate_names,    #  4
-                                              death_ref_index,    #  5
-                                              birth_ref_index,    #  6
-                                              event_ref_list,     #  7
-                                              family_list,        #  8
-                                              parent_family_list, #  9
-                                              media_list,         # 10
-                                              address_list,       # 11
-                                              attribute_list,     # 12
-                                              urls,               # 13
-                                              lds_ord_list,       # 14
-                                              pcitation_list,     # 15
-                                              pnote_list,         # 16
-                                              change,             # 17
-                                              make_tag_list(tags), # 18
-                                              bool(private),      # 19
-                                              person_ref_list,    # 20
-                                                   )
-                count += 1
-                self.callback(100 * count/total)
-            # ---------------------------------
-            # Process family
-            # ---------------------------------
-            families = sql.query("""select * from family;""")
-            for family in families:
-                (handle,
-                 gid,
-                 father_handle,
-                 mother_handle,
-                 the_type0,
-                 the_type1,
-                 change,
-                 tags,
-                 private) = family
-
-                child_ref_list = self.get_child_ref_list(sql, "family", handle)
-                event_ref_list = self.get_event_ref_list(sql, "family", handle)
-                media_list = self.get_media_list(sql, "family", handle)
-                attribute_list = self.get_attribute_list(sql, "family", handle)
-                lds_seal_list = self.get_lds_list(sql, "family", handle)
-                citation_list = self.get_citation_list(sql, "family", handle)
-                note_list = self.get_note_list(sql, "family", handle)
-
-                handle = handle.encode()
-                self.db.family_map[handle] = (handle, gid, 
-                                              father_handle, mother_handle,
-                                              child_ref_list, (the_type0, the_type1), 
-                                              event_ref_list, media_list,
-                                              attribute_list, lds_seal_list, 
-                                              citation_list, note_list,
-                                              change, make_tag_list(tags), private)
+        handle = handle.encode()
+        return (handle, gid, title,
+                author, pubinfo,
+                note_list,
+                media_list,
+                abbrev,
+                change, datamap,
+                reporef_list,
+                private)
 
-                count += 1
-                self.callback(100 * count/total)
-            # ---------------------------------
-            # Process repository
-            # ---------------------------------
-            repositories = sql.query("""select * from repository;""")
-            for repo in repositories:
-                (handle, 
-                 gid, 
-                 the_type0, 
-                 the_type1, 
-                 name, 
-                 change, 
-                 private) = repo
-
-                note_list = self.get_note_list(sql, "repository", handle)
-                address_list = self.get_address_list(sql, "repository", handle, with_parish=False)
-                urls = self.get_url_list(sql, "repository", handle)
-
-                handle = handle.encode()
-                self.db.repository_map[handle] = (handle, gid, 
-                                                  (the_type0, the_type1),
-                                                  name, note_list,
-                                                  address_list, urls, change, 
-                                                  private)
-                count += 1
-                self.callback(100 * count/total)
-            # ---------------------------------
-            # Process place
-            # ---------------------------------
-            places = sql.query("""select * from place;""")
-            for place in places:
-                count += 1
-                (handle, 
-                 gid, 
-                 title, 
-                 main_loc,
-                 long, 
-                 lat, 
-                 change, 
-                 private) = place
-
-                # We could look this up by "place_main", but we have the handle:
-                main_loc = self.get_main_location(sql, handle, with_parish=True)
-                alt_location_list = self.get_location_list(sql, "place_alt", handle, 
-                                                           with_parish=True)
-                urls = self.get_url_list(sql, "place", handle)
-                media_list = self.get_media_list(sql, "place", handle)
-                citation_list = self.get_citation_list(sql, "place", handle)
-                note_list = self.get_note_list(sql, "place", handle)
-
-                handle = handle.encode()
-                self.db.place_map[handle] = (handle, gid, title, long, lat,
-                                             main_loc, alt_location_list,
-                                             urls,
-                                             media_list,
-                                             citation_list,
-                                             note_list,
-                                             change, 
-                                             private)
-                self.callback(100 * count/total)
+    def build_media(self, sql, row):
+        (handle, 
+         gid,
+         path,
+         mime,
+         desc,
+         change,
+         tags,
+         private) = row
 
-            # ---------------------------------
-            # Process citation
-            # ---------------------------------
-            citations = sql.query("""select * from citation;""")
-            for citation in citations:
-                (handle, 
-                 gid, 
-                 confidence,
-                 page,
-                 source_handle,
-                 change,
-                 private) = citation
-                date_handle = self.get_link(sql, "citation", handle, "date")
-                date = self.get_date(sql, date_handle)
-                note_list = self.get_note_list(sql, "citation", handle)
-                media_list = self.get_media_list(sql, "citation", handle)
-                datamap = self.get_datamap(sql, "citation", handle)
-
-                handle = handle.encode()
-                self.db.citation_map[handle] = (handle, 
-                                                gid, 
-                                                date,
-                                                page, 
-                                                confidence,
-                                                source_handle,
-                                                note_list,
-                                                media_list,
-                                                datamap,
-                                                change, 
-                                                private)
-                count += 1
-                self.callback(100 * count/total)
+        attribute_list = self.get_attribute_list(sql, "media", handle)
+        citation_list = self.get_citation_list(sql, "media", handle)
+        note_list = self.get_note_list(sql, "media", handle)
 
-            # ---------------------------------
-            # Process source
-            # ---------------------------------
-            sources = sql.query("""select * from source;""")
-            for source in sources:
-                (handle, 
-                 gid,
-                 title,
-                 author,
-                 pubinfo,
-                 abbrev,
-                 change,
-                 private) = source
-                note_list = self.get_note_list(sql, "source", handle)
-                media_list = self.get_media_list(sql, "source", handle)
-                datamap = self.get_datamap(sql, "source", handle)
-                reporef_list = self.get_repository_ref_list(sql, "source", handle)
-
-                handle = handle.encode()
-                self.db.source_map[handle] = (handle, gid, title,
-                                              author, pubinfo,
-                                              note_list,
-                                              media_list,
-                                              abbrev,
-                                              change, datamap,
-                                              reporef_list,
-                                              private)
-                count += 1
-                self.callback(100 * count/total)
-            # ---------------------------------
-            # Process media
-            # ---------------------------------
-            media = sql.query("""select * from media;""")
-            for med in media:
-                (handle, 
-                 gid,
-                 path,
-                 mime,
-                 desc,
-                 change,
-                 tags,
-                 private) = med
-
-                attribute_list = self.get_attribute_list(sql, "media", handle)
-                citation_list = self.get_citation_list(sql, "media", handle)
-                note_list = self.get_note_list(sql, "media", handle)
-
-                date_handle = self.get_link(sql, "media", handle, "date")
-                date = self.get_date(sql, date_handle)
-
-                handle = handle.encode()
-                self.db.media_map[handle] = (handle, gid, path, mime, desc,
-                                             attribute_list,
-                                             citation_list,
-                                             note_list,
-                                             change,
-                                             date,
-                                             make_tag_list(tags),
-                                             private)
-            # ---------------------------------
-            # Process tag
-            # ---------------------------------
-            tags = sql.query("""select * from tag;""")
-            for tag in tags:
-                (handle,
+        date_handle = self.get_link(sql, "media", handle, "date")
+        date = self.get_date(sql, date_handle)
+
+        handle = handle.encode()
+        return (handle, gid, path, mime, desc,
+                attribute_list,
+                citation_list,
+                note_list,
+                change,
+                date,
+                make_tag_list(tags),
+                private)
+
+    def build_tag(self, sql, row):
+        (handle,
+        name,
+        color,
+        priority,
+        change) = row
+
+        handle = handle.encode()
+        return (handle, 
                 name,
                 color,
                 priority,
-                change) = tag
-
-                handle = handle.encode()
-                self.db.tag_map[handle] = (handle, 
-                                        name,
-                                        color,
-                                        priority,
-                                        change)
+                change)
+
+    def iter_objects(self, sql):
+        """
+        Yield (map name, serialized data) for every primary object of
+        the SQL database, in import order. The primary tables are read in
+        batches of FETCH_SIZE rows.
+        """
+        for (table, map_name) in PRIMARY_TABLES:
+            build = getattr(self, "build_" + table)
+            for row in sql.iter_query("select * from %s;" % table):
+                if row is None:
+                    continue
+                yield (map_name, build(sql, row))
+
+    def process(self):
+        sql = self.openSQL() 
+        total = sum(sql.query("select count(*) from %s;" % table)[0][0]
+                    for (table, map_name) in PRIMARY_TABLES)
+        with DbTxn(_("CSV import"), self.db, batch=True) as self.trans:
+            self.db.disable_signals()
+            count = 0.0
+            self.t = time.time()
+            if self.bulk:
+                self.load_tables(sql)
+            for (map_name, data) in self.iter_objects(sql):
+                getattr(self.db, map_name)[data[0]] = data
+                count += 1
+                self.callback(100 * count/total)
+        self.links = self.tables = None
         return None
 
     def cleanup(self):
@@ -898,10 +954,21 @@ class SQLReader(object):
         self.db.enable_signals()
         self.db.request_rebuild()
         print(msg)
+        peak = peak_memory()
+        if peak is not None:
+            print("%s import: peak memory %.0f MB" %
+                  ("Bulk" if self.bulk else "Streaming", peak))
 
 
-def importData(db, filename, callback=None):
-    g = SQLReader(db, filename, callback)
+def importData(db, filename, callback=None, bulk=True):
+    """
+    Import a SQLite export. With bulk, the secondary tables are loaded in
+    memory, so that no query is run per object. Without it, the import
+    streams: its memory use does not grow with the export, but every
+    object is read with queries of its own, which is much slower on large
+    exports.
+    """
+    g = SQLReader(db, filename, callback, bulk)
     g.process()
     g.cleanup()
 
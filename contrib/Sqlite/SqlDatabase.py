@@ -0,0 +1,535 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2009 Douglas S. Blank <doug.blank@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""
+Read-only database over a SQLite export
+
+Opens a file written by ExportSql.py as a Gramps database, without
+importing it: the objects are assembled from the exported tables when
+they are requested, with the build methods of ImportSql.py, and the
+most recently used ones are kept in memory.
+
+>>> db = SQLDatabase("/PATHTO/export.sql")
+>>> person = db.get_person_from_gramps_id("I0001")
+>>> list(db.find_backlink_handles(person.handle))
+"""
+
+#-------------------------------------------------------------------------
+#
+# Standard Python Modules
+#
+#-------------------------------------------------------------------------
+import os
+from collections import OrderedDict
+
+#------------------------------------------------------------------------
+#
+# Set up logging
+#
+#------------------------------------------------------------------------
+import logging
+log = logging.getLogger(".SqlDatabase")
+
+#-------------------------------------------------------------------------
+#
+# Gramps modules
+#
+#-------------------------------------------------------------------------
+from gramps.gen.db import DbReadBase
+from gramps.gen.lib import (Person, Family, Event, Place, Citation, Source,
+                            MediaObject, Repository, Note, Tag, Researcher)
+from ImportSql import Database, SQLReader
+
+#-------------------------------------------------------------------------
+#
+# Tables
+#
+#-------------------------------------------------------------------------
+# Number of decoded objects kept in memory:
+CACHE_SIZE = 10000
+
+# table -> class of the primary objects
+CLASSES = {
+    "person": Person,
+    "family": Family,
+    "event": Event,
+    "place": Place,
+    "citation": Citation,
+    "source": Source,
+    "media": MediaObject,
+    "repository": Repository,
+    "note": Note,
+    "tag": Tag,
+    }
+
+# Link types of the primary objects, and their class names; places also
+# link their locations under place_main and place_alt:
+PRIMARY_TYPES = {
+    "person": "Person",
+    "family": "Family",
+    "event": "Event",
+    "place": "Place",
+    "place_main": "Place",
+    "place_alt": "Place",
+    "citation": "Citation",
+    "source": "Source",
+    "media": "MediaObject",
+    "repository": "Repository",
+    "note": "Note",
+    }
+
+# Link types whose to_handle is the handle of a primary object:
+DIRECT_REFERENCES = ["citation", "family", "note", "parent_family",
+                     "person_ref", "place"]
+
+# Tables of the references whose ref is the handle of a primary object:
+REFERENCE_TABLES = ["child_ref", "event_ref", "media_ref", "repository_ref"]
+
+#-------------------------------------------------------------------------
+#
+# Link lookup
+#
+#-------------------------------------------------------------------------
+class LinkLookup(object):
+    """
+    Stands for the links loaded by the bulk loader of SQLReader: all of
+    the links of an object are read with one query the first time one of
+    them is looked up, and kept until clear() is called.
+    """
+    def __init__(self, sql):
+        self.sql = sql
+        self.loaded = set()
+        self.links = {}
+
+    def get(self, key, default=None):
+        (from_type, from_handle, to_type) = key
+        if (from_type, from_handle) not in self.loaded:
+            self.loaded.add((from_type, from_handle))
+            for (link_type, to_handle) in self.sql.query(
+                    """select to_type, to_handle from link 
+                       where from_type = ? and from_handle = ?
+                       order by rowid;""", from_type, from_handle):
+                link_key = (from_type, from_handle, link_type)
+                if link_key in self.links:
+                    self.links[link_key].append(to_handle)
+                else:
+                    self.links[link_key] = [to_handle]
+        return self.links.get(key, default)
+
+    def clear(self):
+        self.loaded.clear()
+        self.links.clear()
+
+#-------------------------------------------------------------------------
+#
+# SQLDatabase
+#
+#-------------------------------------------------------------------------
+class SQLDatabase(DbReadBase):
+    """
+    Read-only Gramps database over a SQLite export.
+
+    Every lookup is answered with the indexes of the export; the links of
+    each object assembled are read with one query. The objects
+    are shared between the calls through the cache, and must not be
+    modified.
+    """
+    def __init__(self, filename, cache_size=CACHE_SIZE):
+        DbReadBase.__init__(self)
+        if not os.path.isfile(filename):
+            raise IOError("No such SQLite export: '%s'" % filename)
+        self.filename = filename
+        self.sql = Database(filename)
+        self.reader = SQLReader(None, filename, None, bulk=False)
+        self.reader.links = LinkLookup(self.sql)
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # (table, handle) -> object
+        self.hits = self.misses = 0
+        self.readonly = True
+
+    def close(self):
+        self.sql.close()
+        self.sql = None
+        self.cache.clear()
+
+    def is_open(self):
+        return self.sql is not None
+
+    def get_dbname(self):
+        return os.path.basename(self.filename)
+
+    def get_save_path(self):
+        return self.filename
+
+    # -----------------------------------------------
+    # Generic access
+    # -----------------------------------------------
+
+    def make_object(self, table, row):
+        """
+        Assemble an object from its row and cache it.
+        """
+        handle = row[0]
+        data = getattr(self.reader, "build_" + table)(self.sql, row)
+        self.reader.links.clear()
+        # build methods give the handle as the bytes key of the maps
+        obj = CLASSES[table]()
+        obj.unserialize((handle,) + tuple(data[1:]))
+        self.cache[(table, handle)] = obj
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return obj
+
+    def get_object(self, table, handle):
+        if handle is None:
+            return None
+        if isinstance(handle, bytes):
+            handle = handle.decode("utf-8")
+        key = (table, handle)
+        obj = self.cache.pop(key, None)
+        if obj is not None:
+            # Most recently used objects are at the end
+            self.cache[key] = obj
+            self.hits += 1
+            return obj
+        self.misses += 1
+        rows = self.sql.query("select * from %s where handle = ?;" % table,
+                              handle)
+        if not rows:
+            return None
+        return self.make_object(table, rows[0])
+
+    def get_object_from_gid(self, table, gid):
+        rows = self.sql.query("select handle from %s where gid = ?;" % table,
+                              gid)
+        if not rows:
+            return None
+        return self.get_object(table, rows[0][0])
+
+    def iter_objects(self, table):
+        for row in self.sql.iter_query("select * from %s;" % table):
+            obj = self.cache.get((table, row[0]))
+            yield obj if obj is not None else self.make_object(table, row)
+
+    def iter_handles(self, table):
+        for row in self.sql.iter_query("select handle from %s;" % table):
+            yield row[0]
+
+    def has_handle(self, table, handle):
+        if isinstance(handle, bytes):
+            handle = handle.decode("utf-8")
+        return bool(self.sql.query(
+            "select 1 from %s where handle = ?;" % table, handle))
+
+    def count(self, table):
+        return self.sql.query("select count(*) from %s;" % table)[0][0]
+
+    def cache_report(self):
+        """
+        Return the number of cache hits and misses.
+        """
+        return (self.hits, self.misses)
+
+    # -----------------------------------------------
+    # Get methods
+    # -----------------------------------------------
+
+    def get_person_from_handle(self, handle):
+        return self.get_object("person", handle)
+
+    def get_family_from_handle(self, handle):
+        return self.get_object("family", handle)
+
+    def get_event_from_handle(self, handle):
+        return self.get_object("event", handle)
+
+    def get_place_from_handle(self, handle):
+        return self.get_object("place", handle)
+
+    def get_citation_from_handle(self, handle):
+        return self.get_object("citation", handle)
+
+    def get_source_from_handle(self, handle):
+        return self.get_object("source", handle)
+
+    def get_object_from_handle(self, handle):
+        return self.get_object("media", handle)
+
+    def get_repository_from_handle(self, handle):
+        return self.get_object("repository", handle)
+
+    def get_note_from_handle(self, handle):
+        return self.get_object("note", handle)
+
+    def get_tag_from_handle(self, handle):
+        return self.get_object("tag", handle)
+
+    def get_person_from_gramps_id(self, gid):
+        return self.get_object_from_gid("person", gid)
+
+    def get_family_from_gramps_id(self, gid):
+        return self.get_object_from_gid("family", gid)
+
+    def get_event_from_gramps_id(self, gid):
+        return self.get_object_from_gid("event", gid)
+
+    def get_place_from_gramps_id(self, gid):
+        return self.get_object_from_gid("place", gid)
+
+    def get_citation_from_gramps_id(self, gid):
+        return self.get_object_from_gid("citation", gid)
+
+    def get_source_from_gramps_id(self, gid):
+        return self.get_object_from_gid("source", gid)
+
+    def get_object_from_gramps_id(self, gid):
+        return self.get_object_from_gid("media", gid)
+
+    def get_repository_from_gramps_id(self, gid):
+        return self.get_object_from_gid("repository", gid)
+
+    def get_note_from_gramps_id(self, gid):
+        return self.get_object_from_gid("note", gid)
+
+    def get_tag_from_name(self, name):
+        rows = self.sql.query("select handle from tag where name = ?;", name)
+        if not rows:
+            return None
+        return self.get_object("tag", rows[0][0])
+
+    def has_person_handle(self, handle):
+        return self.has_handle("person", handle)
+
+    def has_family_handle(self, handle):
+        return self.has_handle("family", handle)
+
+    def has_event_handle(self, handle):
+        return self.has_handle("event", handle)
+
+    def has_place_handle(self, handle):
+        return self.has_handle("place", handle)
+
+    def has_citation_handle(self, handle):
+        return self.has_handle("citation", handle)
+
+    def has_source_handle(self, handle):
+        return self.has_handle("source", handle)
+
+    def has_object_handle(self, handle):
+        return self.has_handle("media", handle)
+
+    def has_repository_handle(self, handle):
+        return self.has_handle("repository", handle)
+
+    def has_note_handle(self, handle):
+        return self.has_handle("note", handle)
+
+    def has_tag_handle(self, handle):
+        return self.has_handle("tag", handle)
+
+    def get_default_person(self):
+        return None
+
+    def get_default_handle(self):
+        return None
+
+    def get_researcher(self):
+        return Researcher()
+
+    def get_mediapath(self):
+        return None
+
+    def get_name_group_mapping(self, surname):
+        return surname
+
+    def get_surname_list(self):
+        return [row[0] for row in self.sql.query(
+            "select distinct surname from surname order by surname;")]
+
+    # -----------------------------------------------
+    # Iterators and counts
+    # -----------------------------------------------
+
+    def iter_people(self):
+        return self.iter_objects("person")
+
+    def iter_families(self):
+        return self.iter_objects("family")
+
+    def iter_events(self):
+        return self.iter_objects("event")
+
+    def iter_places(self):
+        return self.iter_objects("place")
+
+    def iter_citations(self):
+        return self.iter_objects("citation")
+
+    def iter_sources(self):
+        return self.iter_objects("source")
+
+    def iter_media_objects(self):
+        return self.iter_objects("media")
+
+    def iter_repositories(self):
+        return self.iter_objects("repository")
+
+    def iter_notes(self):
+        return self.iter_objects("note")
+
+    def iter_tags(self):
+        return self.iter_objects("tag")
+
+    def iter_person_handles(self):
+        return self.iter_handles("person")
+
+    def iter_family_handles(self):
+        return self.iter_handles("family")
+
+    def iter_event_handles(self):
+        return self.iter_handles("event")
+
+    def iter_place_handles(self):
+        return self.iter_handles("place")
+
+    def iter_citation_handles(self):
+        return self.iter_handles("citation")
+
+    def iter_source_handles(self):
+        return self.iter_handles("source")
+
+    def iter_media_object_handles(self):
+        return self.iter_handles("media")
+
+    def iter_repository_handles(self):
+        return self.iter_handles("repository")
+
+    def iter_note_handles(self):
+        return self.iter_handles("note")
+
+    def iter_tag_handles(self):
+        return self.iter_handles("tag")
+
+    def get_person_handles(self, sort_handles=False):
+        return list(self.iter_handles("person"))
+
+    def get_family_handles(self, sort_handles=False):
+        return list(self.iter_handles("family"))
+
+    def get_event_handles(self):
+        return list(self.iter_handles("event"))
+
+    def get_place_handles(self, sort_handles=False):
+        return list(self.iter_handles("place"))
+
+    def get_citation_handles(self, sort_handles=False):
+        return list(self.iter_handles("citation"))
+
+    def get_source_handles(self, sort_handles=False):
+        return list(self.iter_handles("source"))
+
+    def get_media_object_handles(self, sort_handles=False):
+        return list(self.iter_handles("media"))
+
+    def get_repository_handles(self):
+        return list(self.iter_handles("repository"))
+
+    def get_note_handles(self):
+        return list(self.iter_handles("note"))
+
+    def get_tag_handles(self, sort_handles=False):
+        return list(self.iter_handles("tag"))
+
+    def get_number_of_people(self):
+        return self.count("person")
+
+    def get_number_of_families(self):
+        return self.count("family")
+
+    def get_number_of_events(self):
+        return self.count("event")
+
+    def get_number_of_places(self):
+        return self.count("place")
+
+    def get_number_of_citations(self):
+        return self.count("citation")
+
+    def get_number_of_sources(self):
+        return self.count("source")
+
+    def get_number_of_media_objects(self):
+        return self.count("media")
+
+    def get_number_of_repositories(self):
+        return self.count("repository")
+
+    def get_number_of_notes(self):
+        return self.count("note")
+
+    def get_number_of_tags(self):
+        return self.count("tag")
+
+    # -----------------------------------------------
+    # Back references
+    # -----------------------------------------------
+
+    def find_backlink_handles(self, handle, include_classes=None):
+        """
+        Yield (class name, handle) of the primary objects referencing
+        handle. The references held by secondary objects (names, event
+        references, attributes...) are followed up the link table to the
+        primary object owning them.
+        """
+        if isinstance(handle, bytes):
+            handle = handle.decode("utf-8")
+        # (link type, handle) of the referencing objects
+        pending = self.sql.query(
+            """select from_type, from_handle from link
+               where to_type in (%s) and to_handle = ?;""" %
+            ", ".join("'%s'" % to_type for to_type in DIRECT_REFERENCES),
+            handle)
+        for table in REFERENCE_TABLES:
+            pending.extend((table, row[0]) for row in self.sql.query(
+                "select handle from %s where ref = ?;" % table, handle))
+        pending.extend(("family", row[0]) for row in self.sql.query(
+            """select handle from family
+               where father_handle = ? or mother_handle = ?;""",
+            handle, handle))
+        pending.extend(("citation", row[0]) for row in self.sql.query(
+            "select handle from citation where source_handle = ?;", handle))
+        seen = set()
+        found = set()
+        while pending:
+            (from_type, from_handle) = key = pending.pop()
+            if key in seen:
+                continue
+            seen.add(key)
+            if from_type in PRIMARY_TYPES:
+                result = (PRIMARY_TYPES[from_type], from_handle)
+                if result not in found and (include_classes is None or
+                                            result[0] in include_classes):
+                    found.add(result)
+                    yield result
+                continue
+            pending.extend(self.sql.query(
+                """select from_type, from_handle from link
+                   where to_type = ? and to_handle = ?;""",
+                from_type, from_handle))
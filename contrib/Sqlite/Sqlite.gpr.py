@@ -2,7 +2,7 @@ register(IMPORT,
          id    = 'im_sqlite',
          name  = _('SQLite Import'),
          description =  _('SQLite is a common local database format'),
-         version = '1.0.27',
+         version = '1.0.30',
          gramps_target_version = "4.2",
          status = STABLE, # tested with python 3, need to review unicode usage 
          fname = 'ImportSql.py',
@@ -14,11 +14,12 @@ register(EXPORT,
          id    = 'ex_sqlite',
          name  = _('SQLite Export'),
          description =  _('SQLite is a common local database format'),
-         version = '1.0.26',
+         version = '1.0.29',
          gramps_target_version = "4.2",
          status = STABLE, # tested with python 3 but still gives errors
          fname = 'ExportSql.py',
          export_function = 'exportData',
          extension = "sql",
-         export_options = 'WriterOptionBox'
+         export_options = 'SqliteWriterOptionBox',
+         export_options_title = _('SQLite export options')
 )
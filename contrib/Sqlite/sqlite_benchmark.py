@@ -0,0 +1,331 @@
+#
+# Gramps - a GTK+/GNOME based genealogy program
+#
+# Copyright (C) 2009 Douglas S. Blank <doug.blank@gmail.com>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""
+SQLite import/export benchmark script
+
+Builds a synthetic SQLite export with the helpers of ExportSql.py, and
+times the ways ExportSql.py can write it and ImportSql.py can read it back.
+
+The script is to be launched from its directory
+
+Usage examples:
+- Compare the per-object and the bulk import on 10000 people
+    GRAMPS_RESOURCES=/PATHTO/gramps python sqlite_benchmark.py import 10000
+- Compare the per-row and the executemany export writers
+    GRAMPS_RESOURCES=/PATHTO/gramps python sqlite_benchmark.py export 10000
+- Compare the peak memory of the bulk and the streaming import
+    GRAMPS_RESOURCES=/PATHTO/gramps python sqlite_benchmark.py memory 10000
+- Compare the single process and the pipeline export writers
+    GRAMPS_RESOURCES=/PATHTO/gramps python sqlite_benchmark.py pipeline 10000
+- Compare a report on an imported tree and on the export itself
+    GRAMPS_RESOURCES=/PATHTO/gramps python sqlite_benchmark.py snapshot 10000
+"""
+
+from __future__ import print_function
+import os, sys, time, random, argparse, tempfile
+
+gramps_path = os.environ.get("GRAMPS_RESOURCES")
+if gramps_path:
+    sys.path.append(gramps_path)
+sys.path.append(".")
+
+from gramps.gen.lib import Person, Event, Family, Place
+import ExportSql
+import ImportSql
+import SqlDatabase
+
+#-------------------------------------------------------------------------
+#
+# Synthetic export
+#
+#-------------------------------------------------------------------------
+def make_date(rand):
+    year = rand.randint(1600, 2000)
+    return (0, 0, 0, (rand.randint(1, 28), rand.randint(1, 12), year, False),
+            "", year * 372, 0)
+
+def make_objects(people, seed=0):
+    """
+    Yield (table, serialized data) for the given number of people, each
+    with a note, a birth event and a primary name.
+    """
+    rand = random.Random(seed)
+    for i in range(people):
+        note_handle = "N%08d" % i
+        yield ("note", (note_handle, "N%04d" % i,
+                        ("note text %d" % i, [((1, ""), "", [(0, 4)])]),
+                        0, (1, ""), 0, [], False))
+        event_handle = "E%08d" % i
+        yield ("event", (event_handle, "E%04d" % i, (12, ""),
+                         make_date(rand), "Birth", None,
+                         [], [note_handle], [],
+                         [(False, [], [], (1, ""), "value")],
+                         0, False))
+        surname = (("Surname%d" % rand.randint(0, 500)), "", True,
+                   (1, ""), "")
+        name = (False, [], [], make_date(rand), "Given%d" % i, [surname],
+                "", "", (2, ""), "", 0, 0, "", "", "")
+        event_ref = (False, [], [], event_handle, (1, ""))
+        yield ("person", ("I%08d" % i, "I%04d" % i,
+                          rand.randint(0, 1), name, [],
+                          -1, 0, [event_ref], [], [], [], [],
+                          [], [], [], [], [note_handle], 0,
+                          [], False, []))
+
+def make_export(filename, people, seed=0, batch_size=None):
+    """
+    Write an export of the given number of people, each with a note,
+    a birth event and a primary name.
+    """
+    if os.path.exists(filename):
+        os.remove(filename)
+    if batch_size:
+        db = ExportSql.BatchDatabase(filename, batch_size)
+    else:
+        db = ExportSql.Database(filename)
+    ExportSql.makeDB(db)
+    db.batch = True
+    for (table, data) in make_objects(people, seed):
+        ExportSql.EXPORT_FUNCTIONS[table](db, data)
+    db.batch = False
+    db.flush()
+    ExportSql.makeIndexes(db)
+    db.db.commit()
+    db.close()
+    return db
+
+#-------------------------------------------------------------------------
+#
+# Benchmarks
+#
+#-------------------------------------------------------------------------
+def read_all(filename, bulk):
+    """
+    Read all of the objects of an export, and return them with the time
+    it took.
+    """
+    reader = ImportSql.SQLReader(None, filename, None, bulk)
+    sql = ImportSql.Database(filename)
+    start = time.time()
+    if bulk:
+        reader.load_tables(sql)
+    objects = list(reader.iter_objects(sql))
+    elapsed = time.time() - start
+    sql.close()
+    return objects, elapsed
+
+def bench_import(filename):
+    legacy, legacy_time = read_all(filename, False)
+    bulk, bulk_time = read_all(filename, True)
+    print("per-object: %d objects in %.2f s (%.0f objects/s)" %
+          (len(legacy), legacy_time, len(legacy) / legacy_time))
+    print("bulk:       %d objects in %.2f s (%.0f objects/s)" %
+          (len(bulk), bulk_time, len(bulk) / bulk_time))
+    if legacy != bulk:
+        raise Exception("bulk import differs from the per-object import")
+
+def bench_memory(filename):
+    """
+    Read all of the objects of an export without keeping them, and print
+    the peak memory allocated by each import mode. Without tracemalloc
+    (Python 2), the peak resident memory of the process is printed
+    instead: the streaming mode is run first, so that it is not hidden
+    by the peak of the bulk mode.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    for (label, bulk) in [("streaming", False), ("bulk", True)]:
+        reader = ImportSql.SQLReader(None, filename, None, bulk)
+        sql = ImportSql.Database(filename)
+        if tracemalloc:
+            tracemalloc.start()
+        start = time.time()
+        if bulk:
+            reader.load_tables(sql)
+        count = sum(1 for item in reader.iter_objects(sql))
+        elapsed = time.time() - start
+        if tracemalloc:
+            peak = tracemalloc.get_traced_memory()[1] / 1048576.0
+            tracemalloc.stop()
+        else:
+            peak = ImportSql.peak_memory()
+        reader.links = reader.tables = None
+        sql.close()
+        if peak is None:
+            print("%-10s %d objects in %.2f s" %
+                  (label + ":", count, elapsed))
+        else:
+            print("%-10s %d objects in %.2f s, peak memory %.1f MB" %
+                  (label + ":", count, elapsed, peak))
+
+class ImportedTree(object):
+    """
+    All of the objects of an export, read back in memory. Loading it is
+    a lower bound of the time to import the export in a new tree.
+    """
+    def __init__(self, filename):
+        reader = ImportSql.SQLReader(None, filename, None, True)
+        sql = ImportSql.Database(filename)
+        reader.load_tables(sql)
+        self.maps = {}
+        for (map_name, data) in reader.iter_objects(sql):
+            self.maps.setdefault(map_name, {})[data[0].decode()] = data
+        sql.close()
+
+    def get_object(self, map_name, cls, handle):
+        data = self.maps.get(map_name, {}).get(handle)
+        if data is None:
+            return None
+        obj = cls()
+        obj.unserialize((handle,) + tuple(data[1:]))
+        return obj
+
+    def iter_person_handles(self):
+        return iter(self.maps.get("person_map", {}))
+
+    def get_person_from_handle(self, handle):
+        return self.get_object("person_map", Person, handle)
+
+    def get_event_from_handle(self, handle):
+        return self.get_object("event_map", Event, handle)
+
+    def get_family_from_handle(self, handle):
+        return self.get_object("family_map", Family, handle)
+
+    def get_place_from_handle(self, handle):
+        return self.get_object("place_map", Place, handle)
+
+def run_report(db):
+    """
+    Read what a report typically reads: every person, with their events,
+    places and families. Return the number of objects read.
+    """
+    count = 0
+    for handle in db.iter_person_handles():
+        person = db.get_person_from_handle(handle)
+        count += 1
+        for event_ref in person.get_event_ref_list():
+            event = db.get_event_from_handle(event_ref.ref)
+            count += 1
+            if event.get_place_handle():
+                db.get_place_from_handle(event.get_place_handle())
+                count += 1
+        for family_handle in person.get_family_handle_list():
+            db.get_family_from_handle(family_handle)
+            count += 1
+    return count
+
+def bench_snapshot(filename):
+    start = time.time()
+    tree = ImportedTree(filename)
+    loaded = time.time()
+    count = run_report(tree)
+    end = time.time()
+    print("imported tree: loaded in %.2f s, report read %d objects in %.2f s" %
+          (loaded - start, count, end - loaded))
+    start = time.time()
+    db = SqlDatabase.SQLDatabase(filename)
+    loaded = time.time()
+    count = run_report(db)
+    end = time.time()
+    print("snapshot:      opened in %.2f s, report read %d objects in %.2f s"
+          " (%d cache hits, %d misses)" %
+          ((loaded - start, count, end - loaded) + db.cache_report()))
+    db.close()
+
+def bench_export(filename, people, seed):
+    for (label, batch_size) in [("per-row", None), ("executemany", 10000)]:
+        start = time.time()
+        db = make_export(filename, people, seed, batch_size)
+        print("%-12s export of %d people in %.2f s" %
+              (label, people, time.time() - start))
+        if batch_size:
+            db.report()
+
+def bench_pipeline(filename, people, seed):
+    """
+    Write the synthetic objects in this process, and with the pipeline
+    of ExportSql.exportData.
+    """
+    tables = {}
+    for (table, data) in make_objects(people, seed):
+        tables.setdefault(table, []).append(data)
+    size = ExportSql.CHUNK_SIZE
+    chunks = [(table, tables[table][i:i + size])
+              for (table, iter_handles, get_object, export_object)
+              in ExportSql.PRIMARY_OBJECTS if table in tables
+              for i in range(0, len(tables[table]), size)]
+    for processes in [1, None]:
+        if os.path.exists(filename):
+            os.remove(filename)
+        db = ExportSql.BatchDatabase(filename)
+        ExportSql.makeDB(db)
+        start = time.time()
+        pool = ExportSql.make_pool(processes)
+        if pool:
+            (count, mark) = ExportSql.write_chunks(db, pool, chunks)
+            pool.close()
+            pool.join()
+            label = "pipeline"
+        else:
+            count = 0
+            for (table, chunk) in chunks:
+                for data in chunk:
+                    ExportSql.EXPORT_FUNCTIONS[table](db, data)
+                count += len(chunk)
+            label = "single process"
+        db.batch = False
+        db.flush()
+        db.db.commit()
+        elapsed = time.time() - start
+        db.close()
+        print("%-15s %d objects in %.2f s (%.0f objects/s)" %
+              (label + ":", count, elapsed, count / max(elapsed, 1e-6)))
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite addon benchmarks")
+    parser.add_argument("what", choices=["import", "export", "memory",
+                                         "pipeline", "snapshot"])
+    parser.add_argument("people", type=int, nargs="?", default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    filename = os.path.join(tempfile.gettempdir(), "sqlite_benchmark.sql")
+    start = time.time()
+    make_export(filename, args.people, args.seed)
+    print("synthetic export of %d people in %.2f s" %
+          (args.people, time.time() - start))
+    if args.what == "import":
+        bench_import(filename)
+    elif args.what == "memory":
+        bench_memory(filename)
+    elif args.what == "export":
+        bench_export(filename, args.people, args.seed)
+    elif args.what == "pipeline":
+        bench_pipeline(filename, args.people, args.seed)
+    elif args.what == "snapshot":
+        bench_snapshot(filename)
+    os.remove(filename)
+
+if __name__ == '__main__':
+    main()